@@ -18,7 +18,10 @@ import flopy.utils as fpu
 #modelname is used for all the files that are created
 #by FloPy for this model.
 
-path_to_mf2005 = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin/mf2005.exe'  #SCZ
+import sys  #SCZ
+sys.path.append('../FloPyTools')  #SCZ
+import mfexe  #SCZ
+path_to_mf2005 = mfexe.resolve('mf2005')  #SCZ (search folders are set in mfexe.py)
 model = fpm.Modflow(modelname = 'gwexample', exe_name=path_to_mf2005)  #SCZ
 #model = fpm.Modflow(modelname = 'gwexample')
 
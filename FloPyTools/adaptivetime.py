@@ -0,0 +1,241 @@
+## adaptivetime.py
+# Choose nstp and tsmult for each stress period from a target head
+# change per time step, instead of hardcoding uniform steps like
+# nstp = [1, 100, 100].
+#
+# A coarse pass (a few uniform steps per transient period) is run first
+# and the largest head change over the active cells is measured for
+# every step. For each period the first time step is then sized so the
+# head change right after the stress change stays below the tolerance,
+# and the geometric multiplier tsmult is made as large as possible
+# (fewest steps) while the last step still meets the tolerance. Quiet
+# periods get a single step. The adaptive and the original schedules
+# can both be run to report the run time saved.
+#
+# Example (after building 'mf' as in SquareWithWell-Transient.py):
+#   import adaptivetime
+#   report = adaptivetime.adapt_time_steps(mf, tol=0.05)
+#   print(report['nstp'], report['tsmult'], report['saved_wall'])
+#   mf.write_input()
+
+import bisect
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import flopy
+
+import solvertuner
+
+
+def head_changes(headfile, strt):
+    """Largest absolute head change of every saved step.
+
+    Returns (kstpkper, times, dh) with dh[i] the maximum over active
+    cells of |h_i - h_(i-1)| (h_(-1) is strt); dry/inactive cells are
+    ignored.
+    """
+    import flopy.utils.binaryfile as bf
+
+    hds = bf.HeadFile(headfile)
+    h = hds.get_alldata()
+    kstpkper = hds.get_kstpkper()
+    times = hds.get_times()
+    hds.close()
+    prev = np.concatenate([np.asarray(strt, dtype=h.dtype).reshape((1,) + h.shape[1:]), h[:-1]])
+    valid = (np.abs(h) < 1e29) & (np.abs(prev) < 1e29)
+    dh = np.where(valid, np.abs(h - prev), 0.).reshape(len(h), -1).max(axis=1)
+    return kstpkper, np.asarray(times), dh
+
+
+def geometric_steps(perlen, dt1, tsmult):
+    # number of steps so the first step is no longer than dt1, and the
+    # length of the last step
+    if tsmult == 1.:
+        n = int(np.ceil(perlen/dt1))
+        return n, perlen/n
+    n = int(np.ceil(np.log(1. + perlen*(tsmult - 1.)/dt1)/np.log(tsmult)))
+    n = max(n, 1)
+    dt_last = perlen*tsmult**(n - 1)*(tsmult - 1.)/(tsmult**n - 1.)
+    return n, dt_last
+
+
+def design_schedule(perlen, steady, coarse_nstp, kstpkper, dh, tol,
+                    max_tsmult=1.5, min_nstp=1, max_nstp=1000):
+    """nstp and tsmult per stress period from coarse-pass head changes.
+
+    perlen, steady: per-period lists from DIS
+    coarse_nstp: per-period uniform step counts used in the coarse pass
+    kstpkper, dh: from head_changes() on the coarse pass
+    tol: target maximum head change per time step
+    """
+    kper = np.array([kk[1] for kk in kstpkper])
+    nstp = []
+    tsmult = []
+    for p, (length, ss) in enumerate(zip(perlen, steady)):
+        dh_p = dh[kper == p]
+        if ss or len(dh_p) == 0 or dh_p.max() <= tol:
+            nstp.append(min_nstp if not ss else 1)
+            tsmult.append(1.)
+            continue
+        dt_c = length/float(coarse_nstp[p])
+        # head change rate right after the stress change and at the end
+        dt1 = dt_c*min(1., tol/dh_p[0]) if dh_p[0] > 0 else dt_c
+        rate_last = dh_p[-1]/dt_c
+        best = None
+        for m in np.linspace(1., max_tsmult, 11):
+            n, dt_last = geometric_steps(length, dt1, m)
+            if rate_last*dt_last > tol:
+                continue
+            if best is None or n < best[0]:
+                best = (n, m)
+        if best is None:
+            dt = min(dt1, tol/rate_last)
+            best = (int(np.ceil(length/dt)), 1.)
+        nstp.append(int(min(max(best[0], min_nstp), max_nstp)))
+        tsmult.append(float(best[1]))
+    return nstp, tsmult
+
+
+def oc_words(oc):
+    # OC entries in (kper, kstp) order, to be carried forward as flopy does
+    spd = oc.stress_period_data
+    keys = sorted(spd)
+    return keys, [spd[k] for k in keys]
+
+
+def replace_oc(mf, spd):
+    """Replace mf's OC package with one for stress_period_data spd.
+
+    Print formats, unit numbers, file names and label are carried over
+    from the old package; returns the new one.
+    """
+    oc = mf.get_package('OC')
+    units = [oc.unit_number[0], oc.iuhead, oc.iuddn,
+             oc.iubud if isinstance(oc.iubud, int) else 0, oc.iuibnd]
+    # output files the old package registered keep their names
+    fnames = [oc.file_name[0]]
+    for unit in units[1:]:
+        fnames.append(mf.output_fnames[mf.output_units.index(unit)]
+                      if unit in mf.output_units else None)
+    mf.remove_package(oc.name[0])
+    return flopy.modflow.ModflowOc(mf, ihedfm=oc.ihedfm, iddnfm=oc.iddnfm,
+                                   chedfm=oc.chedfm, cddnfm=oc.cddnfm, cboufm=oc.cboufm,
+                                   compact=getattr(oc, 'compact', True),
+                                   stress_period_data=spd,
+                                   extension=[oc.extension[0], 'hds', 'ddn', 'cbc', 'ibo'],
+                                   unitnumber=units, filenames=fnames,
+                                   label=getattr(oc, 'label', 'LABEL'))
+
+
+def restore(mf, dis, oc):
+    # put back the original DIS and OC packages
+    for pkg in [dis, oc]:
+        if pkg is None:
+            continue
+        if mf.get_package(pkg.name[0]) is not None:
+            mf.remove_package(pkg.name[0])
+        mf.add_package(pkg)
+
+
+def set_schedule(mf, nstp, tsmult, words=None):
+    """Replace DIS (and OC) so the model uses the given nstp/tsmult.
+
+    words: OC words for every step; if None the existing OC words are
+    carried forward onto the new steps.
+    """
+    dis = mf.dis
+    oc = mf.get_package('OC')
+    perlen = list(dis.perlen.array)
+    steady = list(dis.steady.array)
+    new_dis = dict(nlay=dis.nlay, nrow=dis.nrow, ncol=dis.ncol,
+                   delr=dis.delr.array, delc=dis.delc.array,
+                   top=dis.top.array, botm=dis.botm.array,
+                   laycbd=dis.laycbd.array, nper=dis.nper, perlen=perlen,
+                   nstp=list(nstp), tsmult=list(tsmult), steady=steady,
+                   itmuni=dis.itmuni, lenuni=dis.lenuni)
+    mf.remove_package('DIS')
+    flopy.modflow.ModflowDis(mf, **new_dis)
+
+    if oc is not None:
+        keys, old_words = oc_words(oc)
+        spd = {}
+        for p in range(len(perlen)):
+            for s in range(nstp[p]):
+                if words is not None:
+                    spd[(p, s)] = list(words)
+                    continue
+                # last OC entry at or before this step
+                i = bisect.bisect_right(keys, (p, s)) - 1
+                if i >= 0:
+                    spd[(p, s)] = list(old_words[i])
+        replace_oc(mf, spd)
+
+
+def adapt_time_steps(mf, tol, coarse_nstp=5, max_tsmult=1.5, min_nstp=1,
+                     max_nstp=1000, compare=True, workspace=None, apply=True):
+    """Coarse pass, schedule design and (optionally) timing comparison.
+
+    mf: a transient FloPy Modflow model (with DIS, BAS and OC)
+    tol: target maximum head change per time step (length units)
+    coarse_nstp: uniform steps per transient period in the coarse pass
+    compare: also run the original and the adaptive schedules and report
+        their wall times and the largest head change per step
+    apply: leave the adaptive schedule on mf (otherwise it is restored)
+
+    Returns a dict with 'nstp', 'tsmult', the original 'uniform_nstp',
+    and, if compare is True, 'uniform_wall', 'adaptive_wall',
+    'saved_wall' (seconds) and 'max_dh' of the adaptive run.
+    """
+    dis = mf.dis
+    perlen = list(dis.perlen.array)
+    steady = list(dis.steady.array)
+    orig_nstp = list(dis.nstp.array)
+    orig_tsmult = list(dis.tsmult.array)
+    orig_dis = mf.get_package('DIS')
+    orig_oc = mf.get_package('OC')
+    strt = mf.bas6.strt.array
+    headfile = mf.name + '.hds'
+
+    orig_ws = mf.model_ws
+    tmp_ws = workspace is None
+    if tmp_ws:
+        workspace = tempfile.mkdtemp(prefix='adaptivetime_')
+    mf.change_model_ws(workspace)
+    report = {'uniform_nstp': orig_nstp}
+    try:
+        # coarse pass, saving head at every step
+        coarse = [1 if ss else coarse_nstp for ss in steady]
+        set_schedule(mf, coarse, [1.]*len(perlen), words=['save head'])
+        info = solvertuner.run_trial(mf)
+        if info['status'] != 'ok':
+            raise Exception('coarse pass did not run: ' + info['status'])
+        kstpkper, times, dh = head_changes(os.path.join(workspace, headfile), strt)
+        nstp, tsmult = design_schedule(perlen, steady, coarse, kstpkper, dh, tol,
+                                       max_tsmult=max_tsmult, min_nstp=min_nstp,
+                                       max_nstp=max_nstp)
+        report['nstp'] = nstp
+        report['tsmult'] = tsmult
+        report['coarse_dh'] = dh
+
+        if compare:
+            # both runs save the head at every step, so the timings
+            # differ only by the schedule
+            set_schedule(mf, orig_nstp, orig_tsmult, words=['save head'])
+            report['uniform_wall'] = solvertuner.run_trial(mf)['wall']
+            # adaptive schedule; its heads also check the tolerance
+            set_schedule(mf, nstp, tsmult, words=['save head'])
+            report['adaptive_wall'] = solvertuner.run_trial(mf)['wall']
+            report['max_dh'] = head_changes(os.path.join(workspace, headfile), strt)[2].max()
+            report['saved_wall'] = report['uniform_wall'] - report['adaptive_wall']
+    finally:
+        restore(mf, orig_dis, orig_oc)
+        mf.change_model_ws(orig_ws)
+        if tmp_ws:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if apply:
+        set_schedule(mf, report['nstp'], report['tsmult'])
+    report['uniform_tsmult'] = orig_tsmult
+    return report
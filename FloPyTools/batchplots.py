@@ -0,0 +1,226 @@
+## batchplots.py
+# Render map frames (head, contours and flow arrows) for many output
+# times without a screen.
+#
+# GitHub-Tutorial2.py makes a new ModelMap for every time and redraws
+# the grid, ibound and boundary conditions each time. Here the static
+# layers are drawn once per figure and only the head image, contours
+# and arrows are updated for each frame. Frames are split into chunks
+# and rendered by a pool of worker processes, each of which opens the
+# head/budget files itself so no arrays are sent between processes.
+# The workers use matplotlib's Agg backend; with nproc=1 the frames are
+# drawn with the caller's backend (set MPLBACKEND=Agg when there is no
+# display).
+#
+# Example (after running GitHub-Tutorial2.py):
+#   import batchplots
+#   spec = batchplots.map_spec(mf, bc=['GHB', 'WEL'], levels=np.linspace(0, 10, 11))
+#   times = flopy.utils.binaryfile.HeadFile('tutorial2.hds').get_times()
+#   fnames = batchplots.render_frames(spec, 'tutorial2.hds', times,
+#                                     'frames/tutorial2-{:04d}.png',
+#                                     cbcfile='tutorial2.cbc')
+#   batchplots.make_gif(fnames, 'tutorial2.gif')
+
+import multiprocessing
+import os
+
+import numpy as np
+
+import specdis
+
+
+def map_spec(mf, layer=0, bc=None, levels=None, vmin=None, vmax=None,
+             cmap='BrBG', arrows=True, arrow_stride=1, figsize=(6, 6), dpi=100):
+    """Everything needed to draw a map of one layer of a FloPy model.
+
+    bc: list of package names (e.g. ['GHB', 'WEL', 'RIV']) whose cells
+        are drawn as a static layer
+    The result is a plain dict so it can be sent to worker processes.
+    """
+    dis = mf.dis
+    spec = {'layer': layer,
+            'delr': np.asarray(dis.delr.array, dtype=np.float64),
+            'delc': np.asarray(dis.delc.array, dtype=np.float64),
+            'ibound': np.asarray(mf.bas6.ibound.array[layer]),
+            'bc': {}, 'levels': levels, 'vmin': vmin, 'vmax': vmax,
+            'cmap': cmap, 'arrows': arrows, 'arrow_stride': arrow_stride,
+            'figsize': figsize, 'dpi': dpi}
+    for name in bc or []:
+        pkg = mf.get_package(name)
+        if pkg is None:
+            continue
+        # cells used by the package in any stress period
+        mask = np.zeros((dis.nrow, dis.ncol), dtype=bool)
+        for kper, rec in pkg.stress_period_data.data.items():
+            if isinstance(rec, np.recarray) or isinstance(rec, np.ndarray):
+                sel = rec['k'] == layer
+                mask[rec['i'][sel].astype(int), rec['j'][sel].astype(int)] = True
+        spec['bc'][name] = mask
+    return spec
+
+
+def cell_centered_flows(frf, fff):
+    # cell-centre flows for the arrows (x to the right, y up the page)
+    qx, qy, qz = specdis.face_to_center(frf, fff)
+    return qx, qy
+
+
+class MapRenderer(object):
+    """Figure with static layers drawn once and per-frame artists updated.
+
+    Call draw() for every frame, then save() or fig.savefig().
+    """
+
+    bc_colors = {'GHB': 'cyan', 'WEL': 'red', 'RIV': 'teal', 'CHD': 'navy',
+                 'DRN': 'yellow', 'SFR': 'blue'}
+
+    def __init__(self, spec):
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import ListedColormap
+
+        self.spec = spec
+        delr, delc = spec['delr'], spec['delc']
+        self.xe = np.concatenate([[0.], np.cumsum(delr)])
+        self.ye = np.concatenate([[0.], np.cumsum(delc)])[::-1]
+        self.xc = 0.5*(self.xe[:-1] + self.xe[1:])
+        self.yc = 0.5*(self.ye[:-1] + self.ye[1:])
+        self.fig = plt.figure(figsize=spec['figsize'], dpi=spec['dpi'])
+        self.ax = self.fig.add_subplot(1, 1, 1, aspect='equal')
+        ax = self.ax
+
+        # static layers: grid, inactive/constant head cells, boundaries
+        nrow, ncol = len(delc), len(delr)
+        self.head = ax.pcolormesh(self.xe, self.ye, np.ma.masked_all((nrow, ncol)),
+                                  cmap=spec['cmap'], vmin=spec['vmin'],
+                                  vmax=spec['vmax'], zorder=1)
+        ibound = spec['ibound']
+        ax.pcolormesh(self.xe, self.ye, np.ma.masked_where(ibound != 0, ibound),
+                      cmap=ListedColormap(['black']), zorder=2)
+        ax.pcolormesh(self.xe, self.ye, np.ma.masked_where(ibound >= 0, ibound),
+                      cmap=ListedColormap(['blue']), alpha=0.5, zorder=2)
+        for name, mask in spec['bc'].items():
+            color = self.bc_colors.get(name, 'magenta')
+            ax.pcolormesh(self.xe, self.ye, np.ma.masked_where(~mask, mask),
+                          cmap=ListedColormap([color]), alpha=0.5, zorder=3)
+        ax.vlines(self.xe, self.ye[-1], self.ye[0], colors='grey', lw=0.3, zorder=4)
+        ax.hlines(self.ye, self.xe[0], self.xe[-1], colors='grey', lw=0.3, zorder=4)
+        ax.set_xlim(self.xe[0], self.xe[-1])
+        ax.set_ylim(self.ye[-1], self.ye[0])
+        self.fig.colorbar(self.head, ax=ax, shrink=0.8)
+
+        # per-frame artists
+        self.contours = None
+        self.quiver = None
+        self.title = ax.set_title('')
+
+    def draw(self, head, qx=None, qy=None, title=''):
+        """Update the frame with a 2D head array and optional flows."""
+        ax = self.ax
+        h = np.ma.masked_invalid(np.where(np.abs(head) > 1e29, np.nan, head))
+        self.head.set_array(h.ravel())
+        if self.spec['vmin'] is None or self.spec['vmax'] is None:
+            self.head.autoscale()
+        if self.contours is not None:
+            # contour sets cannot be updated in place
+            if hasattr(self.contours, 'remove'):
+                self.contours.remove()
+            else:
+                for c in self.contours.collections:
+                    c.remove()
+        self.contours = None
+        if self.spec['levels'] is not None and h.count() > 0:
+            self.contours = ax.contour(self.xc, self.yc, h, levels=self.spec['levels'],
+                                       colors='black', linewidths=0.5, zorder=5)
+        if qx is not None and self.spec['arrows']:
+            s = self.spec['arrow_stride']
+            if self.quiver is None:
+                xx, yy = np.meshgrid(self.xc[::s], self.yc[::s])
+                self.quiver = ax.quiver(xx, yy, qx[::s, ::s], qy[::s, ::s], zorder=6)
+            else:
+                self.quiver.set_UVC(qx[::s, ::s], qy[::s, ::s])
+        self.title.set_text(title)
+
+    def save(self, fname):
+        self.fig.savefig(fname, dpi=self.spec['dpi'])
+
+    def close(self):
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+
+
+def init_worker():
+    # worker processes never show a window
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_chunk(spec, headfile, cbcfile, times, fnames, title_fmt):
+    # worker: one figure for a whole chunk of frames
+    import flopy.utils.binaryfile as bf
+
+    renderer = MapRenderer(spec)
+    layer = spec['layer']
+    headobj = bf.HeadFile(headfile)
+    cbb = bf.CellBudgetFile(cbcfile) if cbcfile is not None else None
+    # budget records are looked up by time step, since budget files
+    # saved without compact=True do not store times
+    kstpkper = dict(zip(headobj.get_times(), headobj.get_kstpkper()))
+    for time, fname in zip(times, fnames):
+        head = headobj.get_data(totim=time)[layer]
+        qx = qy = None
+        if cbb is not None:
+            kk = kstpkper[time]
+            frf = cbb.get_data(text='FLOW RIGHT FACE', kstpkper=kk)[0][layer]
+            fff = cbb.get_data(text='FLOW FRONT FACE', kstpkper=kk)[0][layer]
+            qx, qy = cell_centered_flows(frf, fff)
+        renderer.draw(head, qx, qy, title=title_fmt.format(time))
+        renderer.save(fname)
+    headobj.close()
+    if cbb is not None:
+        cbb.close()
+    renderer.close()
+    return len(fnames)
+
+
+def render_frames(spec, headfile, times, fname_fmt, cbcfile=None,
+                  title_fmt='time = {:g}', nproc=None, chunksize=None):
+    """Render one PNG per time, in parallel; returns the file names.
+
+    fname_fmt: e.g. 'frames/model-{:04d}.png', formatted with the frame
+        number
+    nproc: number of worker processes (os.cpu_count() if None; 1 renders
+        in this process)
+    chunksize: frames per task (split evenly over the workers if None)
+    """
+    times = list(times)
+    fnames = [fname_fmt.format(i) for i in range(len(times))]
+    outdir = os.path.dirname(fname_fmt)
+    if outdir and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    nproc = max(1, min(nproc, len(times)))
+    if chunksize is None:
+        chunksize = int(np.ceil(len(times)/float(nproc)))
+    tasks = [(spec, headfile, cbcfile, times[i:i + chunksize],
+              fnames[i:i + chunksize], title_fmt)
+             for i in range(0, len(times), chunksize)]
+    if nproc == 1:
+        for task in tasks:
+            render_chunk(*task)
+    else:
+        pool = multiprocessing.Pool(nproc, initializer=init_worker)
+        try:
+            pool.starmap(render_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return fnames
+
+
+def make_gif(fnames, fname_out, duration=100):
+    """Join PNG frames into an animated GIF (duration in ms per frame)."""
+    from PIL import Image
+    frames = [Image.open(f) for f in fnames]
+    frames[0].save(fname_out, save_all=True, append_images=frames[1:],
+                   duration=duration, loop=0)
@@ -0,0 +1,297 @@
+## batchrun.py
+# Fault-tolerant runs for scenario sweeps: wall-clock timeouts, failure
+# classification from the listing file, and retries with relaxed solver
+# settings or smaller time steps.
+#
+# The scripts stop with "raise Exception('MODFLOW did not terminate
+# normally.')", so one NWT scenario that does not converge aborts a
+# whole sweep, and a run that hangs holds its worker forever. Here
+# every attempt is killed after timeout seconds, and a failed attempt is
+# classified as 'timeout', 'nonconvergence', 'dry', 'missing_file' or
+# 'error'. Timeouts, non-convergence and dry-cell failures are retried
+# with the next rung of a ladder of relaxations (looser NWT/PCG
+# tolerances and more iterations, then twice as many time steps, ...),
+# each applied on top of the previous ones. Missing files are not
+# retried. Unless asked to keep it, OC's 'save drawdown' is dropped for
+# the runs (drawdown.DrawdownFile computes it from the heads). The
+# outcome of every scenario, with all its attempts, is returned and can
+# be written to a CSV file.
+#
+# Example (SquareWithWell-Transient.py for a range of hk):
+#   import batchrun
+#   def build(hk, model_ws):            # module-level, returns the model
+#       mf = flopy.modflow.Modflow(modelname, exe_name=path2mf,
+#                                  version='mfnwt', model_ws=model_ws)
+#       ...
+#       return mf
+#   records = batchrun.run_batch(build, {'hk1': 1., 'hk10': 10.},
+#                                workspace='sweep', timeout=600, nproc=4)
+#   batchrun.write_outcomes(records, 'sweep/outcomes.csv')
+# or, for a model that is already built:
+#   record = batchrun.run_scenario(mf, timeout=600)
+#   if record['status'] != 'ok': ...
+
+import csv
+import multiprocessing
+import os
+import re
+import time
+
+import numpy as np
+
+import adaptivetime
+import drawdown
+import fastload
+import solvertuner
+
+# a cell or the whole model going dry as a failure; not the LPF/UPW
+# 'HEAD AT CELLS THAT CONVERT TO DRY=' header or wetting/drying
+# conversion tables, which are in most listings
+re_dry = re.compile(r'\bCELL\b.*\bIS\s+DRY\b|\bALL\b.*\bCELLS\b.*\bDRY\b',
+                    re.IGNORECASE)
+re_missing = re.compile(r'DOES NOT EXIST|ERROR OPENING FILE|CAN\'?T FIND|NOT FOUND',
+                        re.IGNORECASE)
+
+# failures that a relaxed solver or smaller time steps may get past
+retry_on = ('timeout', 'nonconvergence', 'dry')
+
+def missing_inputs(model_ws, namefile):
+    """Package files named in the name file that are not in model_ws."""
+    fname = os.path.join(model_ws, namefile)
+    if not os.path.isfile(fname):
+        return [namefile]
+    missing = []
+    with open(fname, 'r', errors='replace') as f:
+        for line in f:
+            words = line.split()
+            if len(words) < 3 or words[0].startswith('#'):
+                continue
+            if words[0].upper() in fastload.data_ftypes:
+                continue
+            if not os.path.isfile(os.path.join(model_ws, words[2])):
+                missing.append(words[2])
+    return missing
+
+
+def scan_listing(fname):
+    # dry-cell and missing-file messages in a listing file
+    out = {'dry': 0, 'missing': []}
+    if not os.path.isfile(fname):
+        return out
+    with open(fname, 'r', errors='replace') as f:
+        for line in f:
+            if re_dry.search(line):
+                out['dry'] += 1
+            elif re_missing.search(line):
+                out['missing'].append(line.strip())
+    return out
+
+
+def classify(info, messages):
+    """Failure class of a run from run_files() info and scan_listing()."""
+    status = info['status']
+    if status == 'ok':
+        return 'ok'
+    if status == 'timeout':
+        return 'timeout'
+    if messages['missing'] or info.get('nbudgets') is None:
+        return 'missing_file'
+    if status == 'failed':
+        return 'nonconvergence'
+    if messages['dry']:
+        return 'dry'
+    return 'error'
+
+
+def run_attempt(mf, timeout=None):
+    """Write and run mf once; returns the run_files() summary with 'failure'."""
+    mf.write_input()
+    lstfile = mf.lst.file_name[0]
+    missing = missing_inputs(mf.model_ws, mf.namefile)
+    if missing:
+        return {'status': 'error', 'failure': 'missing_file', 'missing': missing,
+                'wall': 0., 'iterations': None, 'max_discrepancy': None}
+    try:
+        info = solvertuner.run_files(mf.exe_name, mf.namefile, mf.model_ws, lstfile,
+                                     timeout=timeout)
+    except OSError as e:
+        # the executable itself could not be started
+        return {'status': 'error', 'failure': 'missing_file', 'missing': [str(e)],
+                'wall': 0., 'iterations': None, 'max_discrepancy': None}
+    messages = scan_listing(os.path.join(mf.model_ws, lstfile))
+    info['failure'] = classify(info, messages)
+    info['dry_messages'] = messages['dry']
+    info['missing'] = messages['missing']
+    return info
+
+
+def relax_solver(mf, factor=10.):
+    """Loosen the NWT/PCG closure criteria by factor and allow more iterations."""
+    solver = solvertuner.get_solver(mf)
+    pkg = mf.get_package(solver)
+    if solver == 'NWT':
+        pkg.headtol = pkg.headtol*factor
+        pkg.fluxtol = pkg.fluxtol*factor
+        pkg.maxiterout = int(pkg.maxiterout*2)
+        # COMPLEX has the most forgiving built-in settings
+        if isinstance(pkg.options, list):
+            pkg.options = ['COMPLEX']
+        else:
+            pkg.options = 'COMPLEX'
+    else:
+        pkg.hclose = pkg.hclose*factor
+        pkg.rclose = pkg.rclose*factor
+        pkg.mxiter = int(pkg.mxiter*2)
+        pkg.iter1 = int(pkg.iter1*2)
+        pkg.damp = min(pkg.damp, 0.7)
+    return True
+
+
+def halve_steps(mf):
+    """Twice as many time steps in every transient period (False if steady)."""
+    dis = mf.dis
+    steady = np.asarray(dis.steady.array, dtype=bool)
+    if np.all(steady):
+        return False
+    nstp = [int(n) if ss else int(n)*2 for n, ss in zip(dis.nstp.array, steady)]
+    adaptivetime.set_schedule(mf, nstp, list(dis.tsmult.array))
+    return True
+
+
+relaxations = {'relax_solver': relax_solver, 'halve_steps': halve_steps}
+
+# each attempt adds the next relaxation to the ones already applied
+default_ladder = ['relax_solver', 'halve_steps', 'relax_solver', 'halve_steps']
+
+
+def run_scenario(mf, timeout=None, ladder=None, retry_on=retry_on, apply=False,
+                 keep_drawdown=False):
+    """Run mf in its model_ws, retrying failures with relaxed settings.
+
+    timeout: wall-clock seconds per attempt (None for no limit)
+    ladder: names in relaxations (or functions f(mf) returning False when
+        they do not apply), applied one more per retry
+    retry_on: failure classes that are retried
+    keep_drawdown: let MODFLOW write the drawdown file if OC asks for it
+    apply: leave the settings of the last attempt on mf (otherwise the
+        solver, DIS and OC packages are put back)
+
+    Returns a dict with 'status' ('ok' or the failure class of the last
+    attempt), 'relaxations' (applied in the last attempt), 'wall' (all
+    attempts) and 'attempts', the list of run summaries.
+    """
+    if ladder is None:
+        ladder = default_ladder
+    solver = solvertuner.get_solver(mf)
+    solver_pkg = mf.get_package(solver)
+    saved = dict(solver_pkg.__dict__)
+    orig_dis = mf.get_package('DIS')
+    orig_oc = mf.get_package('OC')
+
+    record = {'attempts': [], 'relaxations': []}
+    applied = []
+    rungs = iter(ladder)
+    try:
+        if not keep_drawdown:
+            drawdown.drop_drawdown(mf)
+        while True:
+            info = run_attempt(mf, timeout=timeout)
+            info['relaxations'] = list(applied)
+            record['attempts'].append(info)
+            if info['failure'] not in retry_on:
+                break
+            # next relaxation that applies to this model
+            for rung in rungs:
+                f = relaxations[rung] if isinstance(rung, str) else rung
+                if f(mf) is not False:
+                    applied.append(rung if isinstance(rung, str) else f.__name__)
+                    break
+            else:
+                break
+    finally:
+        if not apply:
+            solver_pkg.__dict__.clear()
+            solver_pkg.__dict__.update(saved)
+            adaptivetime.restore(mf, orig_dis, orig_oc)
+    last = record['attempts'][-1]
+    record['status'] = last['failure']
+    record['relaxations'] = last['relaxations']
+    record['wall'] = sum(a['wall'] for a in record['attempts'])
+    return record
+
+
+# each worker keeps the model builder and retry settings
+worker = {}
+
+
+def init_worker(build, kwargs):
+    worker['build'] = build
+    worker['kwargs'] = kwargs
+
+
+def run_one(name, params, model_ws):
+    # worker: build and run one scenario; a builder error is an outcome too
+    t0 = time.perf_counter()
+    try:
+        mf = worker['build'](params, model_ws)
+        record = run_scenario(mf, **worker['kwargs'])
+    except Exception as e:
+        record = {'status': 'error', 'error': repr(e), 'attempts': [],
+                  'relaxations': [], 'wall': time.perf_counter() - t0}
+    record['name'] = name
+    record['model_ws'] = model_ws
+    return record
+
+
+def run_batch(build, scenarios, workspace, nproc=None, timeout=None, ladder=None,
+              retry_on=retry_on, keep_drawdown=False):
+    """Build and run many scenarios in a process pool.
+
+    build: module-level function build(params, model_ws) returning a
+        FloPy Modflow model (with NWT or PCG) set up in model_ws
+    scenarios: dict of name -> params (or a list of params, named by
+        position)
+    workspace: each scenario runs in workspace/name
+    nproc: worker processes (os.cpu_count() if None; 1 runs in this process)
+
+    Returns the list of run_scenario() records, in scenario order, each
+    with 'name' and 'model_ws'. A scenario never stops the batch.
+    """
+    if not isinstance(scenarios, dict):
+        scenarios = dict(('{0:04d}'.format(i), p) for i, p in enumerate(scenarios))
+    kwargs = {'timeout': timeout, 'ladder': ladder, 'retry_on': retry_on,
+              'keep_drawdown': keep_drawdown}
+    jobs = [(name, params, os.path.join(workspace, name)) for name, params in scenarios.items()]
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    if nproc == 1:
+        init_worker(build, kwargs)
+        try:
+            return [run_one(*job) for job in jobs]
+        finally:
+            worker.clear()
+    with multiprocessing.Pool(nproc, initializer=init_worker, initargs=(build, kwargs)) as pool:
+        # one scenario at a time, so a straggler does not hold back a chunk
+        return pool.starmap(run_one, jobs, chunksize=1)
+
+
+def write_outcomes(records, fname):
+    """One CSV row per scenario: status, attempts, relaxations, wall time."""
+    with open(fname, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['name', 'status', 'attempts', 'relaxations', 'wall',
+                    'iterations', 'max_discrepancy', 'first_failure'])
+        for r in records:
+            last = r['attempts'][-1] if r['attempts'] else {}
+            first = r['attempts'][0]['failure'] if r['attempts'] else r['status']
+            w.writerow([r['name'], r['status'], len(r['attempts']),
+                        '+'.join(r['relaxations']), '{0:.3f}'.format(r['wall']),
+                        last.get('iterations'), last.get('max_discrepancy'), first])
+
+
+def summarize(records):
+    """Count of scenarios per final status, e.g. {'ok': 48, 'dry': 2}."""
+    counts = {}
+    for r in records:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    return counts
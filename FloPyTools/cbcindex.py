@@ -0,0 +1,165 @@
+## cbcindex.py
+# Record index for a MODFLOW-2005/NWT binary cell-by-cell budget file.
+#
+# CbcIndex memory-maps the file, scans the record headers once and
+# keeps the type, size, time and byte offset of every record in a
+# record array, so a record (or the same record for every time step) is
+# read straight from the map without going through the file again.
+# The precision of the reals is detected from where the second header
+# starts. sfrbudget.py, specdis.py, zonebudget.py, sensitivity.py,
+# particles.py and ensemble.py read budget files through it.
+#
+# Example (TwoStreamsWithWell.py):
+#   import cbcindex
+#   index = cbcindex.CbcIndex(modelname+'.cbc')
+#   index.get_textlist()                # ['CONSTANT HEAD', ..., 'RIVER LEAKAGE']
+#   irec = np.flatnonzero(index.records.text == 'RIVER LEAKAGE')[-1]
+#   nodes, values = index.read_record(irec)
+
+import numpy as np
+
+
+class CbcIndex(object):
+    """Record index for a MODFLOW-2005/NWT binary budget file.
+
+    fname: budget file (any mix of full-array and compact records)
+    precision: 'single', 'double' or 'auto'
+
+    self.records has one row per record with its text, kstp, kper,
+    imeth, totim (nan for full-array records), byte offset of the data,
+    nlist, nval, ncol, nrow and nlay.
+    """
+
+    def __init__(self, fname, precision='auto'):
+        self.fname = fname
+        self.data = np.memmap(fname, dtype=np.uint8, mode='r')
+        if precision == 'auto':
+            precision = self.detect_precision()
+        self.precision = precision
+        self.realtype = np.dtype('<f4') if precision == 'single' else np.dtype('<f8')
+        self.build_index()
+
+    def read_header(self, pos, realtype):
+        # decode the record header at pos; returns a dict or None
+        d = self.data
+        if pos + 36 > len(d):
+            return None
+        i4 = d[pos:pos + 36].view('<i4')
+        kstp, kper = int(i4[0]), int(i4[1])
+        text = bytes(d[pos + 8:pos + 24]).decode('ascii', 'replace').strip()
+        ncol, nrow, nlay = int(i4[6]), int(i4[7]), int(i4[8])
+        rec = {'kstp': kstp, 'kper': kper, 'text': text, 'ncol': ncol,
+               'nrow': nrow, 'nlay': nlay, 'imeth': 0, 'totim': np.nan,
+               'nval': 1, 'nlist': 0}
+        pos += 36
+        rsize = realtype.itemsize
+        ncell = ncol*nrow*abs(nlay)
+        if nlay > 0:
+            # full 3D array, no second header
+            rec['offset'] = pos
+            rec['nlist'] = ncell
+            rec['end'] = pos + ncell*rsize
+            return rec
+        imeth = int(d[pos:pos + 4].view('<i4')[0])
+        rec['imeth'] = imeth
+        rec['totim'] = float(d[pos + 4 + 2*rsize:pos + 4 + 3*rsize].view(realtype)[0])
+        pos += 4 + 3*rsize
+        if imeth == 1:
+            rec['nlist'] = ncell
+            rec['offset'] = pos
+            rec['end'] = pos + ncell*rsize
+        elif imeth in (2, 5):
+            if imeth == 5:
+                nval = int(d[pos:pos + 4].view('<i4')[0])
+                pos += 4 + 16*(nval - 1)
+                rec['nval'] = nval
+            nlist = int(d[pos:pos + 4].view('<i4')[0])
+            pos += 4
+            rec['nlist'] = nlist
+            rec['offset'] = pos
+            rec['end'] = pos + nlist*(4 + rec['nval']*rsize)
+        elif imeth == 3:
+            rec['nlist'] = nrow*ncol
+            rec['offset'] = pos
+            rec['end'] = pos + nrow*ncol*(4 + rsize)
+        elif imeth == 4:
+            rec['nlist'] = nrow*ncol
+            rec['offset'] = pos
+            rec['end'] = pos + nrow*ncol*rsize
+        else:
+            return None
+        return rec
+
+    def detect_precision(self):
+        # the precision is right if the second header (or the end of the
+        # file) is where the first record says it should be
+        for precision, realtype in [('single', np.dtype('<f4')), ('double', np.dtype('<f8'))]:
+            rec = self.read_header(0, realtype)
+            if rec is None or rec['nlist'] < 0 or rec['end'] > len(self.data):
+                continue
+            if rec['end'] == len(self.data):
+                return precision
+            nxt = self.read_header(rec['end'], realtype)
+            if nxt is not None and nxt['kper'] >= rec['kper'] and nxt['text'].isprintable():
+                return precision
+        raise ValueError('could not determine the precision of ' + self.fname)
+
+    def build_index(self):
+        """Scan the headers and store one row per record in self.records."""
+        rows = []
+        pos = 0
+        while pos < len(self.data):
+            rec = self.read_header(pos, self.realtype)
+            if rec is None:
+                raise ValueError('unreadable budget record at byte {0}'.format(pos))
+            rows.append((rec['text'], rec['kstp'], rec['kper'], rec['imeth'],
+                         rec['totim'], rec['offset'], rec['nlist'], rec['nval'],
+                         rec['ncol'], rec['nrow'], abs(rec['nlay'])))
+            pos = rec['end']
+        dtype = [('text', 'U16'), ('kstp', np.int32), ('kper', np.int32),
+                 ('imeth', np.int32), ('totim', np.float64), ('offset', np.int64),
+                 ('nlist', np.int64), ('nval', np.int32), ('ncol', np.int32),
+                 ('nrow', np.int32), ('nlay', np.int32)]
+        self.records = np.array(rows, dtype=dtype).view(np.recarray)
+
+    def get_textlist(self):
+        return [str(t) for t in dict.fromkeys(self.records.text)]
+
+    def select(self, text):
+        # records with the given text, in file order
+        recs = self.records[self.records.text == text]
+        if len(recs) == 0:
+            raise ValueError('no "{0}" records in {1}'.format(text, self.fname))
+        if not np.all(recs.imeth == recs.imeth[0]) or not np.all(recs.nlist == recs.nlist[0]):
+            raise ValueError('"{0}" records change size between time steps'.format(text))
+        return recs
+
+    def get_times(self, text):
+        return self.select(text).totim.copy()
+
+    def read_record(self, irec):
+        """Values of one budget record as (nodes, values).
+
+        nodes are zero-based cell numbers (None if values cover every cell).
+        """
+        rec = self.records[irec]
+        d = self.data
+        realtype = self.realtype
+        rsize = realtype.itemsize
+        o = int(rec.offset)
+        ncell = int(rec.nlay)*int(rec.nrow)*int(rec.ncol)
+        ncpl = int(rec.nrow)*int(rec.ncol)
+        if rec.imeth in (0, 1):
+            return None, d[o:o + ncell*rsize].view(realtype).astype(np.float64)
+        if rec.imeth in (2, 5):
+            entry = np.dtype({'names': ['node', 'q'], 'formats': ['<i4', realtype],
+                              'offsets': [0, 4], 'itemsize': 4 + int(rec.nval)*rsize})
+            lst = d[o:o + int(rec.nlist)*entry.itemsize].view(entry)
+            return lst['node'].astype(np.int64) - 1, lst['q'].astype(np.float64)
+        if rec.imeth == 3:
+            layer = d[o:o + 4*ncpl].view('<i4').astype(np.int64)
+            values = d[o + 4*ncpl:o + (4 + rsize)*ncpl].view(realtype).astype(np.float64)
+            return (layer - 1)*ncpl + np.arange(ncpl), values
+        if rec.imeth == 4:
+            return np.arange(ncpl), d[o:o + ncpl*rsize].view(realtype).astype(np.float64)
+        raise ValueError('unsupported budget record type IMETH={0}'.format(rec.imeth))
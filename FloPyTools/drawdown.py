@@ -0,0 +1,147 @@
+## drawdown.py
+# Drawdown computed from the head file when it is read, instead of
+# having MODFLOW write a second binary file.
+#
+# Drawdown is just strt - head (or reference head - head), so OC's
+# 'save drawdown' doubles the binary output of a run for nothing.
+# DrawdownFile has the same get_times/get_kstpkper/get_data/get_alldata/
+# get_ts methods as HeadFile(..., text='drawdown') but reads only the
+# head file, one time step at a time. Dry and inactive cells keep their
+# hdry/hnoflo values, as in a MODFLOW drawdown file. drop_drawdown()
+# removes the drawdown words from a model's OC package before it is
+# written; batchrun.run_scenario() (and so run_batch() and jobqueue.py)
+# calls it unless keep_drawdown is set.
+#
+# Example (SquareWithWell-SteadyState.py):
+#   import drawdown
+#   drawdown.drop_drawdown(mf)          # before mf.write_input()
+#   ...
+#   ddnobj = drawdown.DrawdownFile(modelname+'.hds', strt=strt)
+#   ddn = ddnobj.get_data(totim=time)
+# or, relative to a run without pumping:
+#   ddnobj = drawdown.DrawdownFile('pumping.hds', reference='no_pumping.hds')
+
+import numpy as np
+
+inactive_value = 1e29
+
+
+class DrawdownFile(object):
+    """Drawdown view of a binary head file.
+
+    headfile: head file name
+    strt: starting heads (nlay, nrow, ncol), e.g. mf.bas6.strt.array
+    reference: head file (name) or array of reference heads, instead of
+        strt; a reference file is read at the same time as the heads (or
+        at its last time if it has only one, e.g. a steady-state run)
+    hnoflo: value of inactive cells in the head file
+    """
+
+    def __init__(self, headfile, strt=None, reference=None, text='head',
+                 precision='auto', hnoflo=-999.99):
+        import flopy.utils.binaryfile as bf
+
+        if strt is None and reference is None:
+            raise ValueError('give strt or reference heads')
+        self.hds = bf.HeadFile(headfile, text=text, precision=precision)
+        self.ref_file = None
+        if reference is None:
+            self.ref = np.asarray(strt)
+        elif isinstance(reference, str):
+            self.ref_file = bf.HeadFile(reference, text=text, precision=precision)
+            self.ref = None
+        else:
+            self.ref = np.asarray(reference)
+        self.hnoflo = hnoflo
+
+    def get_times(self):
+        return self.hds.get_times()
+
+    def get_kstpkper(self):
+        return self.hds.get_kstpkper()
+
+    def reference(self, totim):
+        # reference heads for time totim
+        if self.ref_file is None:
+            return self.ref
+        times = self.ref_file.get_times()
+        if len(times) == 1:
+            return self.ref_file.get_data(idx=0)
+        return self.ref_file.get_data(totim=totim)
+
+    def drawdown(self, head, ref):
+        # ref - head where the head is a real value
+        head = np.asarray(head)
+        ref = np.broadcast_to(ref, head.shape)
+        keep = (np.abs(head) >= inactive_value) | (head == self.hnoflo) | \
+               (np.abs(ref) >= inactive_value) | (ref == self.hnoflo)
+        return np.where(keep, head, ref - head)
+
+    def get_data(self, kstpkper=None, idx=None, totim=None, mflay=None):
+        """Drawdown array (nlay, nrow, ncol), as HeadFile.get_data()."""
+        times = self.hds.get_times()
+        if totim is None:
+            if kstpkper is not None:
+                idx = [tuple(kk) for kk in self.hds.get_kstpkper()].index(tuple(kstpkper))
+            elif idx is None:
+                idx = len(times) - 1
+            totim = times[idx]
+        head = self.hds.get_data(totim=totim)
+        dd = self.drawdown(head, self.reference(totim))
+        return dd if mflay is None else dd[mflay]
+
+    def get_alldata(self, mflay=None, nodata=-9999):
+        """Drawdown for all times (ntimes, nlay, nrow, ncol), one step at a time."""
+        times = self.hds.get_times()
+        out = None
+        for it, t in enumerate(times):
+            dd = self.get_data(totim=t, mflay=mflay)
+            if out is None:
+                out = np.empty((len(times),) + dd.shape, dtype=dd.dtype)
+            out[it] = dd
+        if nodata is not None and out is not None:
+            out[out == nodata] = np.nan
+        return out
+
+    def get_ts(self, idx):
+        """(ntimes, 1 + ncells) time series of drawdown, as HeadFile.get_ts()."""
+        ts = self.hds.get_ts(idx)
+        cells = idx if isinstance(idx, list) else [idx]
+        if self.ref_file is None:
+            ref = np.array([self.ref[tuple(c)] for c in cells])[None, :]
+        else:
+            ref = np.array([[self.reference(t)[tuple(c)] for c in cells] for t in ts[:, 0]])
+        ts[:, 1:] = self.drawdown(ts[:, 1:], ref)
+        return ts
+
+    def close(self):
+        self.hds.close()
+        if self.ref_file is not None:
+            self.ref_file.close()
+
+
+drawdown_words = ['save drawdown', 'print drawdown']
+
+
+def drop_drawdown(mf):
+    """Remove 'save drawdown'/'print drawdown' from mf's OC package.
+
+    Returns the number of words removed. The OC package is rebuilt (with
+    its other settings kept) only if something changed.
+    """
+    import adaptivetime
+
+    oc = mf.get_package('OC')
+    if oc is None:
+        return 0
+    spd = {}
+    removed = 0
+    for key, words in oc.stress_period_data.items():
+        keep = [w for w in words if w.lower().strip() not in drawdown_words]
+        removed += len(words) - len(keep)
+        spd[key] = keep
+    if removed:
+        # the .ddn file stays in the name file (empty after the run), so
+        # the original OC can be put back without re-adding it
+        adaptivetime.replace_oc(mf, spd)
+    return removed
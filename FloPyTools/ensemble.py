@@ -0,0 +1,277 @@
+## ensemble.py
+# Collect ensemble results in shared memory instead of pickling them
+# back from the worker processes.
+#
+# A parallel sweep of SquareWithWell or TwoStreamsWithWell returns a
+# (ntimes, nlay, nrow, ncol) head array per realization, and sending it
+# through a multiprocessing pipe copies it several times (pickle, pipe,
+# unpickle). EnsembleStore preallocates one block, in
+# multiprocessing.shared_memory or in a memory-mapped file, holding
+# every field (heads, budget extracts, ...) for every realization. Each
+# worker attaches to the block once and writes its realization straight
+# into its slot, so only the realization number and a small summary go
+# through the pipe. The parent reads the results as ordinary NumPy
+# arrays over the same memory, without copying.
+#
+# Example (SquareWithWell-Transient.py as a function of hk):
+#   import ensemble
+#   def run(hk, slot):                  # module-level, so it can be pickled
+#       ... build and run the model with hk in its own model_ws ...
+#       ensemble.copy_heads(os.path.join(ws, modelname+'.hds'), slot['head'])
+#       ensemble.copy_budget(os.path.join(ws, modelname+'.cbc'), 'WELLS', slot['wel'])
+#   fields = [('head', (ntimes, nlay, nrow, ncol), 'f4'),
+#             ('wel', (ntimes, nlay*nrow*ncol), 'f4')]
+#   store, info = ensemble.run_ensemble(run, [0.5, 1., 2.], fields, nproc=3)
+#   hw = store['head'][:, -1, 0, r_well, c_well].copy()   # last head at the well
+#   store.close(); store.unlink()
+
+import multiprocessing
+import os
+
+import numpy as np
+
+# status of a realization
+status_names = {0: 'pending', 1: 'done', -1: 'failed'}
+
+# field offsets are rounded up to this many bytes
+alignment = 64
+
+
+def attach_shared(name):
+    # Attach to an existing shared memory block. Pool workers share the
+    # resource tracker of the process that created the block, but any
+    # other process starts its own on attach, which would unlink the
+    # block (and warn about a leak) when that process exits.
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        pass
+    tracker = getattr(resource_tracker, '_resource_tracker', None)
+    own_tracker = os.name == 'posix' and getattr(tracker, '_fd', None) is None
+    shm = shared_memory.SharedMemory(name=name)
+    if own_tracker:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def layout(nreal, fields):
+    # byte offset of each field and total size; a status field is added
+    fields = [(name, tuple(shape), np.dtype(dtype)) for name, shape, dtype in fields]
+    fields.append(('status', (), np.dtype(np.int8)))
+    offsets = []
+    size = 0
+    for name, shape, dtype in fields:
+        offsets.append(size)
+        nbytes = nreal*int(np.prod(shape, dtype=np.int64))*dtype.itemsize
+        size += -(-nbytes//alignment)*alignment
+    return fields, offsets, max(size, 1)
+
+
+class EnsembleStore(object):
+    """Per-realization result arrays in one shared block of memory.
+
+    nreal: number of realizations
+    fields: list of (name, shape, dtype) of the result of one realization
+    path: file to memory-map; if None, a multiprocessing.shared_memory
+        block is used
+    name: name of an existing shared memory block to attach to (used by
+        attach())
+
+    store[name] is an array of shape (nreal,) + shape; store.status is
+    0 (pending), 1 (done) or -1 (failed) per realization. The creating
+    process should call unlink() when the results are no longer needed.
+    """
+
+    def __init__(self, nreal, fields, path=None, name=None, create=True):
+        self.nreal = int(nreal)
+        self.fields, self.offsets, self.size = layout(self.nreal, fields)
+        self.path = path
+        self.shm = None
+        if path is not None:
+            mode = 'w+' if create else 'r+'
+            self.buf = np.memmap(path, dtype=np.uint8, mode=mode, shape=(self.size,))
+        else:
+            from multiprocessing import shared_memory
+            if create:
+                self.shm = shared_memory.SharedMemory(create=True, size=self.size)
+            else:
+                self.shm = attach_shared(name)
+            # frombuffer holds on to the block, so closing it while views
+            # are alive raises instead of leaving them dangling
+            self.buf = np.frombuffer(self.shm.buf, dtype=np.uint8, count=self.size)
+        self.name = None if self.shm is None else self.shm.name
+        self.arrays = {}
+        for (fname, shape, dtype), off in zip(self.fields, self.offsets):
+            count = self.nreal*int(np.prod(shape, dtype=np.int64))
+            self.arrays[fname] = np.frombuffer(self.buf, dtype=dtype, count=count,
+                                               offset=off).reshape((self.nreal,) + shape)
+        if create:
+            self.arrays['status'][:] = 0
+
+    def spec(self):
+        """Small picklable description, for attach() in another process."""
+        fields = [(n, s, d.str) for n, s, d in self.fields if n != 'status']
+        return {'nreal': self.nreal, 'fields': fields, 'path': self.path, 'name': self.name}
+
+    @classmethod
+    def attach(cls, spec):
+        """Open the store described by spec() (e.g. in a worker process)."""
+        return cls(spec['nreal'], spec['fields'], path=spec['path'], name=spec['name'],
+                   create=False)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def keys(self):
+        return [n for n, s, d in self.fields if n != 'status']
+
+    @property
+    def status(self):
+        return self.arrays['status']
+
+    def slot(self, ireal):
+        """Views of the fields of realization ireal, to be written in place."""
+        return {n: self.arrays[n][ireal] for n in self.keys()}
+
+    def write(self, ireal, **values):
+        for n, v in values.items():
+            self.arrays[n][ireal] = v
+        self.arrays['status'][ireal] = 1
+
+    def flush(self):
+        if self.path is not None:
+            self.buf.flush()
+
+    def close(self):
+        """Release the block in this process.
+
+        Arrays from store[name] or slot() are views into the block: drop
+        them, or keep copies, before calling close(), otherwise closing
+        shared memory raises BufferError.
+        """
+        self.flush()
+        self.arrays = {}
+        self.buf = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                raise BufferError('arrays of the ensemble store are still in use; '
+                                  'delete them (or use copies) before close()')
+
+    def unlink(self):
+        """Free the shared memory block (or delete the file)."""
+        if self.shm is not None:
+            self.shm.unlink()
+        elif self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def to_npz(self, fname):
+        """Save all fields and the status to a compressed .npz file."""
+        np.savez_compressed(fname, **dict(self.arrays))
+
+
+def copy_heads(headfile, out, text='HEAD', precision='auto'):
+    """Fill out (ntimes, nlay, nrow, ncol) from a binary head file.
+
+    The file is memory-mapped as layer records (obsinterp.py) and copied
+    straight into out, e.g. a slot of an EnsembleStore. Returns the
+    times. out must have room for every saved time step.
+    """
+    import obsinterp
+
+    ntimes, nlay, nrow, ncol = out.shape
+    recs = obsinterp.open_records(headfile, nrow, ncol, precision=precision)
+    sel = np.flatnonzero(np.char.strip(recs['text']) == text.upper().encode())
+    if len(sel) != ntimes*nlay:
+        raise ValueError('{0} has {1} {2} records, expected {3}'.format(
+            headfile, len(sel), text, ntimes*nlay))
+    order = sel.reshape(ntimes, nlay)
+    out[...] = recs['data'][order]
+    return recs['totim'][order[:, 0]].astype(np.float64)
+
+
+def copy_budget(cbcfile, text, out, precision='auto'):
+    """Fill out (ntimes, ncells) with a budget term for every cell.
+
+    Compact list records (WELLS, RIVER LEAKAGE, ...) are summed into their
+    cells; cells that are not listed get 0. Returns the times (nan for
+    full-array records, whose headers have no time).
+    """
+    import cbcindex
+
+    index = cbcindex.CbcIndex(cbcfile, precision=precision)
+    irecs = np.flatnonzero(index.records['text'] == text.upper())
+    if len(irecs) != out.shape[0]:
+        raise ValueError('{0} has {1} {2} records, expected {3}'.format(
+            cbcfile, len(irecs), text, out.shape[0]))
+    for it, irec in enumerate(irecs):
+        nodes, values = index.read_record(irec)
+        row = out[it].reshape(-1)
+        if nodes is None:
+            row[:] = values.reshape(-1)
+        else:
+            row[:] = 0.
+            np.add.at(row, nodes, values)
+    return index.records['totim'][irecs].astype(np.float64)
+
+
+# each worker attaches to the store once
+worker = {}
+
+
+def init_worker(spec, run):
+    worker['store'] = EnsembleStore.attach(spec)
+    worker['run'] = run
+
+
+def run_one(ireal, params):
+    # worker: run one realization into its slot; only a summary goes back
+    store = worker['store']
+    try:
+        summary = worker['run'](params, store.slot(ireal))
+        store.status[ireal] = 1
+    except Exception as e:
+        store.status[ireal] = -1
+        summary = {'error': repr(e)}
+    return ireal, summary
+
+
+def run_ensemble(run, params, fields, nproc=None, path=None, chunksize=1):
+    """Run run(params[i], slot) for every realization in a process pool.
+
+    run: module-level function that writes its results into slot, a
+        dict of arrays with the shapes in fields (copy_heads() and
+        copy_budget() read model output straight into them); it may
+        return a small picklable summary
+    params: one (picklable) entry per realization
+    fields: list of (name, shape, dtype)
+    nproc: worker processes (os.cpu_count() if None; 1 runs in this process)
+    path: memory-mapped file to hold the results instead of shared memory
+
+    Returns (store, info) with info the list of summaries. A realization
+    that raises gets status -1 and its error in info.
+    """
+    store = EnsembleStore(len(params), fields, path=path)
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    info = [None]*len(params)
+    jobs = list(enumerate(params))
+    if nproc == 1:
+        worker['store'] = store
+        worker['run'] = run
+        try:
+            results = [run_one(i, p) for i, p in jobs]
+        finally:
+            worker.clear()
+    else:
+        with multiprocessing.Pool(nproc, initializer=init_worker,
+                                  initargs=(store.spec(), run)) as pool:
+            results = pool.starmap(run_one, jobs, chunksize=chunksize)
+    for ireal, summary in results:
+        info[ireal] = summary
+    store.flush()
+    return store, info
@@ -0,0 +1,412 @@
+## fastload.py
+# Load a MODFLOW-2005/NWT input set written by write_input() (e.g.
+# gwexample.*, tutorial2.*, TiltedVwithSFR-Transient.*) back into a
+# FloPy Modflow object quickly, for scenario edits.
+#
+# Three things make it faster than flopy.modflow.Modflow.load():
+# - only DIS and BAS6 are read up front; every other package is parsed
+#   the first time it is used (lm.lpf, lm.get_package('WEL'), ...);
+# - text arrays (free or fixed format) are converted by NumPy once all
+#   their lines are read, instead of value by value, and (BINARY)
+#   external arrays are memory-mapped (copy on write) instead of read;
+# - a loaded model is saved as a pickle in a cache folder, keyed on the
+#   SHA-1 of every input file it was read from (name file entries and
+#   OPEN/CLOSE array and list files). Hashes are only recomputed for
+#   files whose size or modification time changed, so a second load of
+#   a large unchanged model is one unpickle. The cache folder must
+#   belong to the user and not be writable by others, and a snapshot is
+#   only unpickled if its SHA-256 matches the one in the index.
+#
+# Example:
+#   import fastload
+#   lm = fastload.LazyModel('tutorial2.nam', model_ws='GitHub-Tutorial2')
+#   hk = lm.lpf.hk.array             # LPF is parsed here
+#   mf = lm.load_all()               # the flopy Modflow object, all packages
+# or, with the snapshot cache:
+#   mf = fastload.load('tutorial2.nam', model_ws='GitHub-Tutorial2')
+
+import contextlib
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import threading
+import warnings
+
+import numpy as np
+
+cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'flopytools', 'models')
+
+re_open_close = re.compile(rb'OPEN/CLOSE\s+(\S+)', re.IGNORECASE)
+
+# name file types that are not packages (output files, written by the run)
+data_ftypes = ['LIST', 'DATA', 'DATA(BINARY)']
+
+
+def read_namefile(fname):
+    """Entries of a name file as a list of dicts (ftype, unit, fname, status)."""
+    entries = []
+    with open(fname, 'r', errors='replace') as f:
+        for line in f:
+            words = line.split()
+            if len(words) < 3 or words[0].startswith('#'):
+                continue
+            entries.append({'ftype': words[0].upper(), 'unit': int(words[1]),
+                            'fname': words[2].strip('\'"'),
+                            'status': words[3].upper() if len(words) > 3 else ''})
+    return entries
+
+
+def expand_repeats(line):
+    # free-format 'n*value' items written out in full
+    items = []
+    for item in line.replace(',', ' ').split():
+        if '*' in item:
+            num, val = item.split('*')
+            items += int(num)*[val]
+        else:
+            items.append(item)
+    return ' '.join(items)
+
+
+def parse_block(text, dtype, count):
+    # NumPy parse of whitespace-separated values; None if it stops early
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            values = np.fromstring(text, dtype=dtype, sep=' ')
+        except ValueError:
+            return None
+    return values if values.size >= count else None
+
+
+def read_text_array(shape, file_in, dtype, fmtin):
+    """Text array, converted by NumPy once all its lines are read.
+
+    Same arguments and result as flopy's Util2d.load_txt(). Free-format
+    arrays are read line by line until there are enough values; with a
+    fixed format such as (20G15.6) every row starts on a new line, so
+    the number of lines is known up front. Values that are not separated
+    by blanks are cut out at the field width.
+    """
+    from flopy.utils.util_array import ArrayFormat
+
+    openfile = not hasattr(file_in, 'read')
+    if openfile:
+        file_in = open(file_in, 'r')
+    n = int(np.prod(shape))
+    npl, fmt, width, decimal = ArrayFormat.decode_fortran_descriptor(fmtin)
+    try:
+        if npl == 'free':
+            lines = []
+            found = 0
+            while found < n:
+                line = file_in.readline()
+                if not line:
+                    raise ValueError('read_text_array: no data found')
+                if '*' in line:
+                    line = expand_repeats(line)
+                lines.append(line)
+                found += len(line.replace(',', ' ').split())
+        else:
+            ncol = shape[-1]
+            nrow = n//ncol
+            lines = [file_in.readline() for _ in range(nrow*(-(-ncol//npl)))]
+            if not lines[-1]:
+                raise ValueError('read_text_array: no data found')
+    finally:
+        if openfile:
+            file_in.close()
+    text = ' '.join(lines)
+    if ',' in text and npl == 'free':
+        text = text.replace(',', ' ')
+    values = parse_block(text, dtype, n)
+    if values is None:
+        if npl == 'free':
+            items = text.split()
+        else:
+            items = [line[p:p + width] for line in lines
+                     for p in range(0, npl*width, width)]
+            items = [item for item in items if item.strip()]
+        values = np.array(items[:n]).astype(dtype)
+    return values[:n].reshape(shape)
+
+
+def map_binary_array(shape, file_in, dtype, bintype=None):
+    """(BINARY) array as a copy-on-write memory map, as Util2d.load_bin()."""
+    import flopy.utils.binaryfile as bf
+
+    openfile = not hasattr(file_in, 'read')
+    if openfile:
+        file_in = open(file_in, 'rb')
+    try:
+        if np.issubdtype(dtype, np.integer):
+            dtype = np.int32
+        dtype = np.dtype(dtype)
+        header_data = None
+        if bintype is not None and np.issubdtype(dtype, np.floating):
+            header_dtype = bf.BinaryHeader.set_dtype(bintype=bintype)
+            header_data = np.fromfile(file_in, dtype=header_dtype, count=1)
+        pos = file_in.tell()
+        n = int(np.prod(shape))
+        if os.path.getsize(file_in.name) < pos + n*dtype.itemsize:
+            raise ValueError('map_binary_array: {0} is too short'.format(file_in.name))
+        data = np.memmap(file_in.name, dtype=dtype, mode='c', offset=pos, shape=tuple(shape))
+        file_in.seek(pos + n*dtype.itemsize)
+    finally:
+        if openfile:
+            file_in.close()
+    return header_data, data
+
+
+# held while FloPy's array loaders are replaced
+patch_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def fast_arrays():
+    """Use read_text_array/map_binary_array inside FloPy's Util2d.
+
+    FloPy's loaders are replaced for the whole process while the block
+    runs. Blocks in different threads wait for each other; other FloPy
+    loads running at the same time also get the fast loaders.
+    """
+    from flopy.utils.util_array import Util2d
+
+    with patch_lock:
+        load_txt = Util2d.__dict__['load_txt']
+        load_bin = Util2d.__dict__['load_bin']
+        Util2d.load_txt = staticmethod(read_text_array)
+        Util2d.load_bin = staticmethod(map_binary_array)
+        try:
+            yield
+        finally:
+            Util2d.load_txt = load_txt
+            Util2d.load_bin = load_bin
+
+
+class LazyModel(object):
+    """A Modflow object whose packages are parsed on first use.
+
+    namefile, model_ws, version, exe_name: as for Modflow.load()
+    load_first: packages read right away (DIS is always read)
+    fast: use the NumPy text-array parser and binary memory maps
+
+    Packages in the name file are attributes (lm.lpf, lm.wel, ...) and
+    load on first access; lm.model is the underlying flopy model with
+    the packages loaded so far, and load_all() loads the rest.
+    """
+
+    def __init__(self, namefile, model_ws='.', version='mf2005', exe_name='mf2005',
+                 load_first=('DIS', 'BAS6'), fast=True):
+        import flopy
+
+        self.namefile = namefile
+        self.model_ws = model_ws
+        self.fast = fast
+        self.entries = read_namefile(os.path.join(model_ws, namefile))
+        self.ftypes = [e['ftype'] for e in self.entries if e['ftype'] not in data_ftypes]
+        first = [p for p in load_first if p in self.ftypes]
+        with self.arrays():
+            self.model = flopy.modflow.Modflow.load(namefile, model_ws=model_ws,
+                                                    version=version, exe_name=exe_name,
+                                                    load_only=first, check=False,
+                                                    forgive=False)
+        self.loaded = set(first) | {'DIS'}
+        self.ext_unit_dict = None
+
+    def arrays(self):
+        return fast_arrays() if self.fast else contextlib.nullcontext()
+
+    def load_package(self, ftype):
+        """Parse one package of the name file (if not parsed yet)."""
+        from flopy.utils import mfreadnam
+
+        ftype = ftype.upper()
+        if ftype in self.loaded:
+            return self.model.get_package(ftype)
+        if ftype not in self.ftypes:
+            raise KeyError('{0} is not in {1}'.format(ftype, self.namefile))
+        if self.ext_unit_dict is None:
+            self.ext_unit_dict = mfreadnam.parsenamefile(
+                os.path.join(self.model_ws, self.namefile), self.model.mfnam_packages,
+                verbose=False)
+        items = [item for item in self.ext_unit_dict.values() if item.filetype == ftype]
+        if not items or items[0].package is None:
+            raise KeyError('FloPy cannot load {0} packages'.format(ftype))
+        item = items[0]
+        kw = {'ext_unit_dict': self.ext_unit_dict}
+        if 'check' in inspect.getfullargspec(item.package.load)[0]:
+            kw['check'] = False
+        with self.arrays():
+            item.filehandle.seek(0)
+            item.package.load(item.filehandle, self.model, **kw)
+        self.loaded.add(ftype)
+        # units that are now package output files are no longer external
+        for key in self.model.pop_key_list:
+            self.model.remove_external(unit=key)
+        return self.model.get_package(ftype)
+
+    def get_package(self, name):
+        name = name.upper()
+        if name not in self.loaded and name in self.ftypes:
+            return self.load_package(name)
+        return self.model.get_package(name)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not found normally
+        if name.startswith('_') or 'model' not in self.__dict__:
+            raise AttributeError(name)
+        if name.upper() in self.ftypes and name.upper() not in self.loaded:
+            self.load_package(name.upper())
+        return getattr(self.model, name)
+
+    def load_all(self):
+        """Parse every remaining package; returns the flopy model."""
+        for ftype in self.ftypes:
+            if ftype in self.loaded:
+                continue
+            pkg_class = self.model.mfnam_packages.get(ftype.lower())
+            if pkg_class is not None:
+                self.load_package(ftype)
+        self.close()
+        return self.model
+
+    def close(self):
+        # close the file handles opened by parsenamefile
+        if self.ext_unit_dict is not None:
+            for item in self.ext_unit_dict.values():
+                if hasattr(item.filehandle, 'close'):
+                    item.filehandle.close()
+            self.ext_unit_dict = None
+
+
+def file_hash(fname, known=None):
+    # SHA-1 of a file, reused from known if its size and mtime are the same
+    st = os.stat(fname)
+    stamp = [st.st_size, st.st_mtime_ns]
+    if known is not None and known.get('stamp') == stamp:
+        return known
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 24), b''):
+            h.update(chunk)
+    return {'stamp': stamp, 'sha1': h.hexdigest()}
+
+
+def snapshot_key(hashes):
+    # one key over the hashes of all input files (names relative to the model)
+    h = hashlib.sha1()
+    for name in sorted(hashes):
+        h.update(name.encode())
+        h.update(hashes[name]['sha1'].encode())
+    return h.hexdigest()
+
+
+def input_files(model_ws, namefile):
+    # the name file and the files it names that are not outputs
+    files = [namefile]
+    for e in read_namefile(os.path.join(model_ws, namefile)):
+        if e['status'] == 'REPLACE' or e['ftype'] == 'LIST':
+            continue
+        if os.path.isfile(os.path.join(model_ws, e['fname'])):
+            files.append(e['fname'])
+    return files
+
+
+def open_close_files(model_ws, files):
+    # files named in OPEN/CLOSE array and list records of the input files
+    found = set()
+    for name in files:
+        with open(os.path.join(model_ws, name), 'rb') as f:
+            text = f.read()
+        for m in re_open_close.finditer(text):
+            fname = m.group(1).decode(errors='replace').strip('\'"')
+            found.add(os.path.normpath(fname.replace('\\', os.path.sep)))
+    return sorted(found)
+
+
+def private_dir(path):
+    # create path for this user only; refuse a folder others can write to
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.name == 'posix':
+        st = os.stat(path)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            raise PermissionError('{0} is not a private folder of this user'.format(path))
+
+
+def write_index(fname, namefile, key, hashes, digest):
+    # file hashes, snapshot key and snapshot SHA-256 of one name file,
+    # written atomically
+    tmp = '{0}.{1}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump({'namefile': namefile, 'snapshot': key, 'sha256': digest,
+                   'hashes': hashes}, f, indent=1)
+    os.replace(tmp, fname)
+
+
+def load(namefile, model_ws='.', version='mf2005', exe_name='mf2005', cache=cache_dir,
+         fast=True):
+    """Fully loaded Modflow object, from the snapshot cache when possible.
+
+    cache: folder for the snapshots (None to always parse), created
+    private to the user. A snapshot is used only if every input file it
+    was built from has the same SHA-1 and the snapshot file itself has
+    the SHA-256 recorded when it was written.
+    """
+    if cache is not None:
+        try:
+            private_dir(cache)
+        except PermissionError as e:
+            warnings.warn('snapshot cache not used: {0}'.format(e))
+            cache = None
+    if cache is None:
+        return LazyModel(namefile, model_ws, version, exe_name, fast=fast).load_all()
+    ws = os.path.abspath(model_ws)
+    index_file = os.path.join(cache, hashlib.sha1(os.path.join(ws, namefile).encode())
+                              .hexdigest() + '.json')
+    index = {}
+    if os.path.isfile(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+
+    # files named in the name file, plus the OPEN/CLOSE files seen last time
+    names = set(input_files(ws, namefile)) | set(index.get('hashes', {}))
+    hashes = {}
+    for name in names:
+        path = os.path.join(ws, name)
+        if os.path.isfile(path):
+            hashes[name] = file_hash(path, index.get('hashes', {}).get(name))
+    key = snapshot_key(hashes)
+    snap = os.path.join(cache, key + '.pkl')
+    data = None
+    if set(hashes) == set(index.get('hashes', {})) and os.path.isfile(snap):
+        with open(snap, 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != index.get('sha256'):
+            # not the snapshot this index wrote: parse again
+            data = None
+    if data is not None:
+        mf = pickle.loads(data)
+        if hashes != index['hashes']:
+            # same contents, new times: keep the stamps for next time
+            write_index(index_file, os.path.join(ws, namefile), key, hashes, index['sha256'])
+        mf.change_model_ws(model_ws, reset_external=False)
+        return mf
+
+    mf = LazyModel(namefile, model_ws, version, exe_name, fast=fast).load_all()
+    for name in open_close_files(ws, list(hashes)):
+        if name not in hashes and os.path.isfile(os.path.join(ws, name)):
+            hashes[name] = file_hash(os.path.join(ws, name))
+    key = snapshot_key(hashes)
+    snap = os.path.join(cache, key + '.pkl')
+    tmp = '{0}.{1}.tmp'.format(snap, os.getpid())
+    data = pickle.dumps(mf, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, snap)
+    write_index(index_file, os.path.join(ws, namefile), key, hashes,
+                hashlib.sha256(data).hexdigest())
+    return mf
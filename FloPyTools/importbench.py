@@ -0,0 +1,104 @@
+## importbench.py
+# Import-time benchmark for headless runs.
+#
+# When a process pool starts many short-lived workers, the time spent
+# importing matplotlib, pandas and the flopy post-processing modules can
+# be a large part of each worker's run. The scripts therefore import
+# those modules where they are first used (see TwoStreamsWithWell.py),
+# so a worker that only builds and runs a model never pays for
+# plotting. The benchmark below starts a fresh interpreter for each
+# module and reports how long the import takes, to check which imports
+# are worth deferring.
+#
+# Benchmark (from the command line):
+#   python importbench.py                       # default module list
+#   python importbench.py flopy pandas --repeat 10 --top 10
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# modules timed by default: the model-building path first, then the
+# plotting/post-processing modules the scripts import
+default_modules = ['numpy', 'flopy', 'flopy.modflow', 'flopy.utils.binaryfile',
+                   'flopy.utils.postprocessing', 'flopy.utils.sfroutputfile',
+                   'matplotlib', 'matplotlib.pyplot', 'pandas']
+
+re_importtime = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_time(name, repeat=5, python=None):
+    """Seconds to import name in a fresh interpreter.
+
+    Returns (import, startup): the best of repeat runs of the import
+    alone, and of the whole interpreter start-up plus import.
+    """
+    python = sys.executable if python is None else python
+    code = ('import time; t = time.perf_counter(); import {0}; '
+            'print(time.perf_counter() - t)').format(name)
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+    best_import = best_total = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run([python, '-c', code], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, env=env)
+        total = time.perf_counter() - t0
+        if proc.returncode != 0:
+            return None, None
+        best_import = min(best_import, float(proc.stdout.decode().split()[-1]))
+        best_total = min(best_total, total)
+    return best_import, best_total
+
+
+def top_imports(name, n=10, python=None):
+    """The n slowest modules (cumulative microseconds) imported by name.
+
+    Uses the interpreter's -X importtime report; returns a list of
+    (module, cumulative_us, self_us).
+    """
+    python = sys.executable if python is None else python
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+    proc = subprocess.run([python, '-X', 'importtime', '-c', 'import ' + name],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    rows = []
+    for line in proc.stderr.decode('utf-8', 'replace').splitlines():
+        m = re_importtime.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(2)), int(m.group(1))))
+    rows.sort(key=lambda r: -r[1])
+    return rows[:n]
+
+
+def benchmark(modules=None, repeat=5, top=0):
+    """Print the import time of each module (and its slowest imports)."""
+    modules = default_modules if modules is None else modules
+    print('{0:<32} {1:>12} {2:>12}'.format('module', 'import [s]', 'startup [s]'))
+    results = {}
+    for name in modules:
+        t_import, t_total = import_time(name, repeat=repeat)
+        results[name] = (t_import, t_total)
+        if t_import is None:
+            print('{0:<32} {1:>12}'.format(name, 'not found'))
+            continue
+        print('{0:<32} {1:>12.3f} {2:>12.3f}'.format(name, t_import, t_total))
+        for mod, cum, own in top_imports(name, n=top) if top else []:
+            print('    {0:<40} {1:>10.3f}'.format(mod, cum*1e-6))
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Time module imports in a fresh interpreter.')
+    parser.add_argument('modules', nargs='*', help='modules to time (default: flopy, matplotlib, pandas, ...)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per module (best is kept)')
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest sub-imports')
+    args = parser.parse_args(args)
+    benchmark(args.modules or None, repeat=args.repeat, top=args.top)
+
+
+if __name__ == '__main__':
+    main()
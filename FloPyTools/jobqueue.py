@@ -0,0 +1,343 @@
+## jobqueue.py
+# Scenario sweeps spread over several machines through a job queue kept
+# in a shared directory.
+#
+# Each scenario is a small JSON job: the model builder to call (as
+# 'module:function', importable on every node) and its parameters.
+# Jobs move between the subfolders of the queue directory only by
+# os.rename, which is atomic on one file system, so a job can be
+# claimed by one worker only and a result is either there or not:
+#   pending/  ->  running/  ->  done/ or failed/
+# Workers on any node claim jobs, build and run the model in a local
+# scratch folder (batchrun.run_scenario(), with its timeout and
+# retries), and write a compressed .npz extract (heads by default) to
+# results/. While a job runs its worker touches the job file every
+# heartbeat seconds; a job whose file has not been touched for stale
+# seconds belonged to a worker that died, and is put back in pending/.
+# A local folder stands in for the shared file system on a single box.
+#
+# Example (SquareWithWell-Transient.py turned into build(hk, model_ws) in
+# sweep.py):
+#   import jobqueue
+#   q = jobqueue.JobQueue('/shared/sweep')
+#   for hk in [0.5, 1., 2.]:
+#       q.submit({'hk': hk}, 'sweep:build', path='/shared/code')
+# then, on every node:
+#   python jobqueue.py work /shared/sweep --scratch /tmp --nproc 8
+# and, when q.counts()['pending'] and ['running'] are 0:
+#   for jobid, job in q.finished():
+#       res = q.load_result(jobid)      # res['head'], res['times']
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+folders = ['pending', 'running', 'done', 'failed', 'results']
+
+
+def worker_name():
+    # unique per process, readable in the job files
+    return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+
+def write_json(fname, obj):
+    # write a file next to fname and rename it into place
+    tmp = '{0}.{1}.tmp'.format(fname, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, fname)
+
+
+def load_function(ref, path=None):
+    """Function from a 'module:function' reference."""
+    if path and path not in sys.path:
+        sys.path.insert(0, path)
+    module, name = ref.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def extract_heads(model_ws, mf):
+    """Default result extract: all saved heads, their times and kstpkper."""
+    import flopy.utils.binaryfile as bf
+
+    hds = bf.HeadFile(os.path.join(model_ws, mf.name + '.hds'))
+    out = {'head': hds.get_alldata(), 'times': np.asarray(hds.get_times()),
+           'kstpkper': np.asarray(hds.get_kstpkper())}
+    hds.close()
+    return out
+
+
+class JobQueue(object):
+    """Job queue in a (shared) directory.
+
+    root: queue directory, created if needed; every worker and the
+        submitting process must see the same directory
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for d in folders:
+            os.makedirs(os.path.join(root, d), exist_ok=True)
+
+    def path(self, folder, jobid, ext='.json'):
+        return os.path.join(self.root, folder, jobid + ext)
+
+    def submit(self, params, builder, jobid=None, path=None, extract=None, timeout=None):
+        """Add a job; returns its id.
+
+        params: JSON-serializable arguments, passed as build(params, model_ws)
+        builder: 'module:function' returning a FloPy model in model_ws
+        path: folder to put on sys.path before importing builder/extract
+        extract: 'module:function' f(model_ws, mf) returning a dict of
+            arrays to save (extract_heads() if None)
+        timeout: wall-clock seconds per MODFLOW attempt
+        """
+        if jobid is None:
+            jobid = uuid.uuid4().hex[:12]
+        job = {'id': jobid, 'params': params, 'builder': builder, 'path': path,
+               'extract': extract, 'timeout': timeout, 'requeued': 0,
+               'submitted': time.time()}
+        write_json(self.path('pending', jobid), job)
+        return jobid
+
+    def list(self, folder):
+        names = os.listdir(os.path.join(self.root, folder))
+        return sorted(n[:-5] for n in names if n.endswith('.json'))
+
+    def counts(self):
+        return {d: len(self.list(d)) for d in folders[:4]}
+
+    def claim(self, worker=None):
+        """Move the oldest pending job to running/; returns it or None."""
+        worker = worker or worker_name()
+        for jobid in self.list('pending'):
+            src = self.path('pending', jobid)
+            dest = self.path('running', jobid)
+            try:
+                # rename keeps the mtime: stamp the claim first, or
+                # requeue_stale() would see a long-pending job as stale
+                os.utime(src)
+                os.rename(src, dest)
+            except OSError:
+                # another worker got it first
+                continue
+            with open(dest) as f:
+                job = json.load(f)
+            job['worker'] = worker
+            job['started'] = time.time()
+            write_json(dest, job)
+            return job
+        return None
+
+    def heartbeat(self, jobid):
+        """Touch a running job; False if it is no longer ours (requeued)."""
+        try:
+            os.utime(self.path('running', jobid))
+            return True
+        except OSError:
+            return False
+
+    def requeue_stale(self, stale=300.):
+        """Put running jobs not touched for stale seconds back in pending/."""
+        now = time.time()
+        requeued = []
+        for jobid in self.list('running'):
+            src = self.path('running', jobid)
+            try:
+                if now - os.path.getmtime(src) < stale:
+                    continue
+                # take the job out of running/ first, so that a worker that
+                # is only slow cannot also complete it
+                grab = self.path('running', jobid, '.stale')
+                os.rename(src, grab)
+            except OSError:
+                continue
+            with open(grab) as f:
+                job = json.load(f)
+            job['requeued'] = job.get('requeued', 0) + 1
+            job.pop('worker', None)
+            write_json(self.path('pending', jobid), job)
+            os.remove(grab)
+            requeued.append(jobid)
+        return requeued
+
+    def complete(self, job, record, arrays=None):
+        """Save the extract and move the job to done/ (or failed/).
+
+        Returns False if the job had been requeued meanwhile; its result
+        is then dropped, since another worker will produce it.
+        """
+        jobid = job['id']
+        tmp = None
+        if arrays is not None:
+            # written under a temporary name, and moved into results/
+            # only once the rename below shows the job is still ours
+            tmp = '{0}.{1}.tmp.npz'.format(self.path('results', jobid, ''), uuid.uuid4().hex)
+            np.savez_compressed(tmp, **arrays)
+        folder = 'done' if record.get('status') == 'ok' else 'failed'
+        dest = self.path(folder, jobid)
+        try:
+            os.rename(self.path('running', jobid), dest)
+        except OSError:
+            if tmp is not None:
+                os.remove(tmp)
+            return False
+        if tmp is not None:
+            os.replace(tmp, self.path('results', jobid, '.npz'))
+        job = dict(job, finished=time.time(), record=record)
+        write_json(dest, job)
+        return True
+
+    def finished(self, folder='done'):
+        """(jobid, job) for every job in done/ (or failed/)."""
+        for jobid in self.list(folder):
+            with open(self.path(folder, jobid)) as f:
+                yield jobid, json.load(f)
+
+    def load_result(self, jobid):
+        with np.load(self.path('results', jobid, '.npz')) as res:
+            return dict(res)
+
+    def wait(self, poll=5., timeout=None, stale=None):
+        """Block until no job is pending or running; returns counts().
+
+        stale: also requeue dead workers' jobs while waiting
+        """
+        t0 = time.time()
+        while True:
+            if stale is not None:
+                self.requeue_stale(stale)
+            c = self.counts()
+            if c['pending'] == 0 and c['running'] == 0:
+                return c
+            if timeout is not None and time.time() - t0 > timeout:
+                return c
+            time.sleep(poll)
+
+
+def summary_record(record):
+    # the JSON-serializable part of a batchrun record
+    keep = ['status', 'relaxations', 'wall', 'error']
+    out = {k: record[k] for k in keep if k in record}
+    out['attempts'] = [{k: a.get(k) for k in ['failure', 'wall', 'iterations',
+                                              'max_discrepancy', 'relaxations']}
+                       for a in record.get('attempts', [])]
+    return out
+
+
+def run_job(job, scratch=None):
+    """Build, run and extract one job in a scratch folder; returns (record, arrays)."""
+    import batchrun
+
+    model_ws = tempfile.mkdtemp(prefix='job_{0}_'.format(job['id']), dir=scratch)
+    try:
+        build = load_function(job['builder'], job.get('path'))
+        extract = extract_heads
+        if job.get('extract'):
+            extract = load_function(job['extract'], job.get('path'))
+        mf = build(job['params'], model_ws)
+        record = batchrun.run_scenario(mf, timeout=job.get('timeout'))
+        arrays = extract(model_ws, mf) if record['status'] == 'ok' else None
+        return summary_record(record), arrays
+    except Exception as e:
+        return {'status': 'error', 'error': repr(e)}, None
+    finally:
+        shutil.rmtree(model_ws, ignore_errors=True)
+
+
+def work(root, scratch=None, heartbeat=30., stale=300., max_jobs=None, idle_exit=True,
+         poll=5., worker=None):
+    """Worker loop: claim, run and complete jobs until the queue is empty.
+
+    heartbeat: seconds between touches of the running job file
+    stale: requeue other workers' jobs not touched for this long (must be
+        well above heartbeat)
+    idle_exit: return when nothing is pending (otherwise keep polling)
+
+    Returns the number of jobs this worker completed.
+    """
+    q = JobQueue(root)
+    worker = worker or worker_name()
+    ndone = 0
+    while max_jobs is None or ndone < max_jobs:
+        q.requeue_stale(stale)
+        job = q.claim(worker)
+        if job is None:
+            if idle_exit:
+                break
+            time.sleep(poll)
+            continue
+
+        # touch the job file from a thread while the model runs
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(heartbeat):
+                if not q.heartbeat(job['id']):
+                    break
+        t = threading.Thread(target=beat, daemon=True)
+        t.start()
+        try:
+            record, arrays = run_job(job, scratch)
+        finally:
+            stop.set()
+            t.join()
+        record['worker'] = worker
+        if q.complete(job, record, arrays):
+            ndone += 1
+    return ndone
+
+
+def work_parallel(root, nproc=None, **kw):
+    # several worker processes on this node
+    import multiprocessing
+
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    if nproc == 1:
+        return work(root, **kw)
+    with multiprocessing.Pool(nproc) as pool:
+        results = [pool.apply_async(work, (root,), kw) for _ in range(nproc)]
+        return sum(r.get() for r in results)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='File-system job queue for model sweeps.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    w = sub.add_parser('work', help='run jobs from a queue')
+    w.add_argument('root', help='queue directory')
+    w.add_argument('--scratch', help='local folder for the model runs')
+    w.add_argument('--nproc', type=int, default=1, help='worker processes on this node')
+    w.add_argument('--heartbeat', type=float, default=30.)
+    w.add_argument('--stale', type=float, default=300.)
+    w.add_argument('--wait', action='store_true', help='keep polling when the queue is empty')
+    s = sub.add_parser('status', help='count jobs in each state')
+    s.add_argument('root', help='queue directory')
+    s.add_argument('--requeue', type=float, help='requeue jobs not touched for this many seconds')
+    args = parser.parse_args(args)
+
+    if args.command == 'work':
+        n = work_parallel(args.root, nproc=args.nproc, scratch=args.scratch,
+                          heartbeat=args.heartbeat, stale=args.stale,
+                          idle_exit=not args.wait)
+        print('{0} jobs completed'.format(n))
+        return 0
+    q = JobQueue(args.root)
+    if args.requeue is not None:
+        print('requeued: {0}'.format(q.requeue_stale(args.requeue)))
+    print(q.counts())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
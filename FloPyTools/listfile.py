@@ -0,0 +1,359 @@
+## listfile.py
+# Pull solver and budget information out of a MODFLOW-2005 or
+# MODFLOW-NWT listing (.list) file, so scripts can look at more
+# than the 'success' flag returned by run_model().
+#
+# read_listing() gives a one-line summary of a whole run. iter_steps()
+# streams one record per time step (solver iterations, budget terms,
+# percent discrepancy, wall time), either from a finished file or
+# while a run is still writing it, and steps_table()/summarize() turn
+# those records into a NumPy table and a list of alerts.
+#
+# Example:
+#   import listfile
+#   info = listfile.read_listing('tutorial2.list')
+#   print(info['iterations'], info['elapsed'], info['max_discrepancy'])
+#
+#   steps = listfile.steps_table(listfile.iter_steps('tutorial2.list'))
+#   print(listfile.summarize(steps)['alerts'])
+
+import os
+import re
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+# patterns for the lines we care about
+re_pcg = re.compile(r'(\d+)\s+TOTAL ITERATIONS')
+re_nwt_outer = re.compile(r'NWT REQUIRED\s+(\d+)\s+OUTER ITERATIONS')
+re_nwt_inner = re.compile(r'TOTAL OF\s+(\d+)\s+INNER ITERATIONS')
+re_discrepancy = re.compile(r'PERCENT DISCREPANCY\s*=\s*(\S+)\s+PERCENT DISCREPANCY\s*=\s*(\S+)')
+re_elapsed = re.compile(r'Elapsed run time:\s*(?:(\d+)\s*Days?,\s*)?(?:(\d+)\s*Hours?,\s*)?(?:(\d+)\s*Minutes?,\s*)?([\d.]+)\s*Seconds')
+re_failed = re.compile(r'FAILED TO (?:MEET SOLVER )?CONVERGE', re.IGNORECASE)
+re_pcg_step = re.compile(r'CALLS TO PCG ROUTINE FOR TIME STEP\s+(\d+)\s+IN STRESS PERIOD\s+(\d+)')
+re_oc_step = re.compile(r'OUTPUT CONTROL FOR STRESS PERIOD\s+(\d+)\s+TIME STEP\s+(\d+)')
+re_budget_step = re.compile(r'VOLUMETRIC BUDGET FOR ENTIRE MODEL AT END OF TIME STEP\s+(\d+),?\s+STRESS PERIOD\s+(\d+)')
+re_summary_step = re.compile(r'TIME SUMMARY AT END OF TIME STEP\s+(\d+)\s+IN STRESS PERIOD\s+(\d+)')
+re_term = re.compile(r'^\s*(.+?)\s*=\s*(\S+)\s+(.+?)\s*=\s*(\S+)\s*$')
+
+
+def parse_float(s):
+    # MODFLOW writes '*****' or 'NaN' when a number does not fit
+    try:
+        return float(s)
+    except ValueError:
+        return float('nan')
+
+
+def parse_elapsed(line):
+    # convert an 'Elapsed run time:' line to seconds (None if no match)
+    m = re_elapsed.search(line)
+    if m is None:
+        return None
+    d, h, mins, s = [float(g) if g else 0. for g in m.groups()]
+    return ((d*24. + h)*60. + mins)*60. + s
+
+
+def read_listing(fname):
+    """Summarize a listing file in a single pass.
+
+    Returns a dict with the total solver iterations (PCG iterations or
+    NWT inner iterations), NWT outer iterations, number of budgets
+    written, the largest absolute percent discrepancy (rate), the
+    elapsed run time in seconds and convergence/termination flags.
+    """
+    info = {'iterations': 0, 'outer_iterations': 0, 'nbudgets': 0,
+            'max_discrepancy': 0., 'elapsed': None,
+            'converged': True, 'normal_termination': False}
+    with open(fname, 'r', errors='replace') as f:
+        for line in f:
+            m = re_pcg.search(line)
+            if m:
+                info['iterations'] += int(m.group(1))
+                continue
+            m = re_nwt_outer.search(line)
+            if m:
+                info['outer_iterations'] += int(m.group(1))
+                continue
+            m = re_nwt_inner.search(line)
+            if m:
+                info['iterations'] += int(m.group(1))
+                continue
+            m = re_discrepancy.search(line)
+            if m:
+                # second column is the rate for this time step
+                pd_rate = abs(parse_float(m.group(2)))
+                if pd_rate != pd_rate:
+                    pd_rate = float('inf')
+                info['max_discrepancy'] = max(info['max_discrepancy'], pd_rate)
+                info['nbudgets'] += 1
+                continue
+            if re_failed.search(line):
+                info['converged'] = False
+            elif 'Normal termination' in line:
+                info['normal_termination'] = True
+            elif 'Elapsed run time' in line:
+                info['elapsed'] = parse_elapsed(line)
+    return info
+
+
+def follow_lines(f, proc, poll=0.2):
+    # yield complete lines from f, waiting for more while proc is running
+    buff = ''
+    while True:
+        line = f.readline()
+        if line:
+            buff += line
+            if buff.endswith('\n'):
+                yield buff
+                buff = ''
+            continue
+        if proc.poll() is not None:
+            # process is done, drain whatever is left
+            rest = f.read()
+            if buff or rest:
+                for line in (buff + rest).splitlines(True):
+                    yield line
+            return
+        time.sleep(poll)
+
+
+def new_step(kper, kstp):
+    return {'kper': kper, 'kstp': kstp, 'iterations': 0,
+            'outer_iterations': 0, 'converged': True,
+            'total_in': np.nan, 'total_out': np.nan,
+            'pct_discrepancy': np.nan, 'cum_discrepancy': np.nan,
+            'in': {}, 'out': {}, 'wall': np.nan}
+
+
+def iter_steps(fname, follow=None, poll=0.2):
+    """Stream one record per time step from a listing file.
+
+    fname: path to the listing file
+    follow: None to read a finished file, or a subprocess.Popen object for
+        a run that is still going; the file is then tailed until the
+        process exits, and each record's 'wall' is the wall-clock time in
+        seconds between it and the previous record (MODFLOW does not write
+        per-step timing, so 'wall' is NaN for finished files)
+
+    Each record is a dict with kper, kstp (both 1-based, as in the
+    listing), iterations (PCG or NWT inner), outer_iterations (NWT),
+    converged, total_in, total_out, pct_discrepancy and cum_discrepancy
+    (rate and cumulative percent discrepancy), and 'in'/'out' dicts of
+    budget rates by term. Budget values are NaN for steps where OC did
+    not print a budget.
+    """
+    with open(fname, 'r', errors='replace') as f:
+        if follow is None:
+            lines = f
+        else:
+            lines = follow_lines(f, follow, poll=poll)
+        t_last = time.perf_counter()
+        step = None
+        # PCG names the step before its iteration counts, which then go
+        # straight to that step; NWT writes its counts before OC or the
+        # budget identify the step, so they are held in pending
+        pending = new_step(0, 0)
+        counts_to = pending
+        side = None
+        for line in lines:
+            key = None
+            from_pcg = False
+            m = re_pcg_step.search(line)
+            if m:
+                key = (int(m.group(2)), int(m.group(1)))
+                from_pcg = True
+            else:
+                m = re_oc_step.search(line)
+                if m:
+                    key = (int(m.group(1)), int(m.group(2)))
+                else:
+                    m = re_budget_step.search(line) or re_summary_step.search(line)
+                    if m:
+                        key = (int(m.group(2)), int(m.group(1)))
+
+            if key is not None:
+                if step is not None and (step['kper'], step['kstp']) != key:
+                    yield step
+                    step = None
+                if step is None:
+                    step = new_step(*key)
+                step['iterations'] += pending['iterations']
+                step['outer_iterations'] += pending['outer_iterations']
+                step['converged'] &= pending['converged']
+                pending = new_step(0, 0)
+                counts_to = step if from_pcg else pending
+                if line.lstrip().startswith('TIME SUMMARY'):
+                    # last block written for a time step
+                    if follow is not None:
+                        t_now = time.perf_counter()
+                        step['wall'] = t_now - t_last
+                        t_last = t_now
+                    yield step
+                    step = None
+                    counts_to = pending
+                elif 'VOLUMETRIC BUDGET' in line:
+                    side = None
+                continue
+
+            m = re_pcg.search(line)
+            if m:
+                counts_to['iterations'] += int(m.group(1))
+                continue
+            m = re_nwt_outer.search(line)
+            if m:
+                pending['outer_iterations'] += int(m.group(1))
+                continue
+            m = re_nwt_inner.search(line)
+            if m:
+                pending['iterations'] += int(m.group(1))
+                continue
+            if re_failed.search(line):
+                counts_to['converged'] = False
+                continue
+            if step is None:
+                continue
+
+            # budget table
+            stripped = line.strip()
+            if stripped.startswith('IN:'):
+                side = 'in'
+            elif stripped.startswith('OUT:'):
+                side = 'out'
+            else:
+                m = re_term.match(line)
+                if m is None:
+                    continue
+                name = m.group(3)
+                value = parse_float(m.group(4))
+                if name == 'PERCENT DISCREPANCY':
+                    step['cum_discrepancy'] = parse_float(m.group(2))
+                    step['pct_discrepancy'] = value
+                    side = None
+                elif name == 'TOTAL IN':
+                    step['total_in'] = value
+                elif name == 'TOTAL OUT':
+                    step['total_out'] = value
+                elif side is not None and name != 'IN - OUT':
+                    step[side][name] = value
+
+        if step is not None:
+            step['iterations'] += pending['iterations']
+            step['outer_iterations'] += pending['outer_iterations']
+            step['converged'] &= pending['converged']
+            yield step
+
+
+def steps_table(steps):
+    """Collect step records from iter_steps() into a NumPy record array.
+
+    Budget terms become columns named like flopy's MfListBudget, e.g.
+    'STORAGE_IN' or 'CONSTANT_HEAD_OUT'.
+    """
+    steps = list(steps)
+    terms = []
+    for s in steps:
+        for side in ['in', 'out']:
+            for name in s[side]:
+                col = name.replace(' ', '_') + '_' + side.upper()
+                if col not in terms:
+                    terms.append(col)
+    dtype = [('kper', np.int32), ('kstp', np.int32),
+             ('iterations', np.int32), ('outer_iterations', np.int32),
+             ('converged', bool), ('wall', np.float64),
+             ('total_in', np.float64), ('total_out', np.float64),
+             ('pct_discrepancy', np.float64), ('cum_discrepancy', np.float64)]
+    dtype += [(col, np.float64) for col in terms]
+    table = np.zeros(len(steps), dtype=dtype)
+    for col in terms:
+        table[col] = np.nan
+    for irow, s in enumerate(steps):
+        for name, _ in dtype[:10]:
+            table[name][irow] = s[name]
+        for side in ['in', 'out']:
+            for name, value in s[side].items():
+                table[name.replace(' ', '_') + '_' + side.upper()][irow] = value
+    return table.view(np.recarray)
+
+
+def to_dataframe(table):
+    # pandas is only needed here, so it is not imported at the top
+    import pandas as pd
+    return pd.DataFrame(table)
+
+
+def summarize(table, max_discrepancy=1.0, slow_factor=5., max_iterations=None, nworst=5):
+    """Summary statistics and alerts for a table from steps_table().
+
+    A step raises an alert if it did not converge, if its absolute percent
+    discrepancy is above max_discrepancy, if it took more than
+    max_iterations solver iterations, or if it took more than slow_factor
+    times the median wall time (or median iterations, when wall times are
+    not known).
+    """
+    nsteps = len(table)
+    summary = {'nsteps': nsteps, 'alerts': []}
+    if nsteps == 0:
+        summary['alerts'].append('no time steps found in listing file')
+        return summary
+    iters = table['iterations']
+    summary['total_iterations'] = int(iters.sum())
+    summary['mean_iterations'] = float(iters.mean())
+    summary['max_abs_discrepancy'] = float(np.nanmax(np.abs(table['pct_discrepancy']))) \
+        if np.isfinite(table['pct_discrepancy']).any() else np.nan
+
+    wall = table['wall']
+    if np.isfinite(wall).all():
+        cost = wall
+        summary['total_wall'] = float(wall.sum())
+    else:
+        cost = iters.astype(np.float64)
+    # steps that dominate the run, most expensive first
+    worst = np.argsort(cost)[::-1][:nworst]
+    summary['worst_steps'] = [(int(table['kper'][i]), int(table['kstp'][i]), float(cost[i]))
+                              for i in worst]
+
+    def label(i):
+        return 'stress period {0}, time step {1}'.format(table['kper'][i], table['kstp'][i])
+
+    for i in np.where(~table['converged'])[0]:
+        summary['alerts'].append(label(i) + ': solver did not converge')
+    bad = np.abs(table['pct_discrepancy']) > max_discrepancy
+    for i in np.where(bad)[0]:
+        summary['alerts'].append(label(i) + ': percent discrepancy {0}'.format(
+                                 table['pct_discrepancy'][i]))
+    if max_iterations is not None:
+        for i in np.where(iters > max_iterations)[0]:
+            summary['alerts'].append(label(i) + ': {0} iterations'.format(iters[i]))
+    median = np.median(cost)
+    if median > 0:
+        for i in np.where(cost > slow_factor*median)[0]:
+            summary['alerts'].append(label(i) + ': {0:.3g} times slower than the median step'.format(
+                                     cost[i]/median))
+    return summary
+
+
+def monitor_run(mf, poll=0.2):
+    """Run a written FloPy model and stream its time-step records live.
+
+    Yields the records from iter_steps() while MODFLOW is running and
+    raises an Exception if MODFLOW exits with an error.
+    """
+    exe = shutil.which(mf.exe_name) or mf.exe_name
+    fname = os.path.join(mf.model_ws, mf.lst.file_name[0])
+    if os.path.isfile(fname):
+        os.remove(fname)
+    proc = subprocess.Popen([exe, mf.namefile], cwd=mf.model_ws,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            stdin=subprocess.DEVNULL)
+    # wait for MODFLOW to open the listing file
+    while not os.path.isfile(fname) and proc.poll() is None:
+        time.sleep(poll)
+    if not os.path.isfile(fname):
+        raise Exception('MODFLOW did not write a listing file.')
+    for step in iter_steps(fname, follow=proc, poll=poll):
+        yield step
+    if proc.wait() != 0:
+        raise Exception('MODFLOW did not terminate normally.')
@@ -0,0 +1,200 @@
+## mfexe.py
+# Find the MODFLOW executable for a given version once, check what it
+# is, and remember the answer.
+#
+# Instead of choosing between a hardcoded Windows path and a bare
+# 'mf2005'/'mfnwt' in every script, resolve() looks through the folders
+# in search_dirs (plus any in the MODFLOW_BIN environment variable) and
+# then the PATH, runs the first match with no input to read the program
+# name and version from its banner, and caches the result in a small
+# JSON file. Later calls, including those from other worker processes,
+# only stat the file to check it has not changed. A missing executable
+# raises straight away, before any input files are written.
+#
+# With stage_to_ram=True the executable is copied to RAM-backed storage
+# (/dev/shm, if there is one), into a folder private to the user, which
+# avoids disk reads when thousands of short runs are launched.
+#
+# Example:
+#   import sys
+#   sys.path.append('../FloPyTools')
+#   import mfexe
+#   path2mf = mfexe.resolve('mfnwt')
+#   mf = flopy.modflow.Modflow(modelname, exe_name=path2mf, version='mfnwt')
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import warnings
+
+# executable names to look for, by MODFLOW version
+exe_names = {'mf2005': ['mf2005', 'mf2005dbl', 'MF2005'],
+             'mfnwt': ['mfnwt', 'MODFLOW-NWT_64', 'MODFLOW-NWT', 'mfnwtdbl']}
+
+# folders searched before the PATH (MODFLOW_BIN entries go first)
+search_dirs = ['C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin',
+               'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MODFLOW-NWT_1.1.4/bin',
+               'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MODFLOW-NWT_1.1.3/bin']
+
+cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'flopytools', 'mfexe.json')
+stage_dir = '/dev/shm'
+
+re_version = re.compile(r'Version\s+([0-9][0-9.]*)', re.IGNORECASE)
+re_program = re.compile(r'(MODFLOW[-\w]*)', re.IGNORECASE)
+
+# results already looked up in this process
+resolved = {}
+
+
+def candidates(version):
+    """Paths that could hold the executable for version, in search order."""
+    names = exe_names.get(version, [version])
+    if os.name == 'nt':
+        names = [n + '.exe' for n in names] + names
+    dirs = [d for d in os.environ.get('MODFLOW_BIN', '').split(os.pathsep) if d]
+    paths = [os.path.join(d, n) for d in dirs + search_dirs for n in names]
+    for n in names:
+        path = shutil.which(n)
+        if path is not None:
+            paths.append(path)
+    return [p for p in paths if os.path.isfile(p) and os.access(p, os.X_OK)]
+
+
+def probe(path, timeout=10.):
+    """Program name and version from the banner the executable prints.
+
+    The executable is started with stdin closed, so it stops at the name
+    file prompt. Returns a dict with 'program', 'version' and 'nwt'
+    (whether the NWT solver is available); values are None if the
+    banner could not be read.
+    """
+    try:
+        proc = subprocess.run([path], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, timeout=timeout)
+        banner = proc.stdout.decode('utf-8', 'replace')
+    except (OSError, subprocess.TimeoutExpired):
+        return {'program': None, 'version': None, 'nwt': None}
+    m_prog = re_program.search(banner)
+    m_ver = re_version.search(banner)
+    program = m_prog.group(1) if m_prog else None
+    return {'program': program,
+            'version': m_ver.group(1) if m_ver else None,
+            'nwt': program is not None and 'NWT' in program.upper()}
+
+
+def file_id(path):
+    # size and modification time, to notice a replaced executable
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def read_cache(fname=None):
+    fname = cache_file if fname is None else fname
+    try:
+        with open(fname) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(cache, fname=None):
+    # write to a temporary file and rename, so parallel workers never
+    # see a partly written cache
+    fname = cache_file if fname is None else fname
+    folder = os.path.dirname(fname)
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, fname)
+    except OSError:
+        pass
+
+
+def lookup(version, refresh=False):
+    """Cached {'path', 'id', 'program', 'version', 'nwt'} for a MODFLOW version.
+
+    Raises an Exception listing the places searched if no executable is
+    found.
+    """
+    if not refresh and version in resolved:
+        return resolved[version]
+    cache = read_cache()
+    info = cache.get(version)
+    if info is not None and not refresh:
+        try:
+            if file_id(info['path']) == info['id']:
+                resolved[version] = info
+                return info
+        except OSError:
+            pass
+    paths = candidates(version)
+    if not paths:
+        raise Exception('No MODFLOW executable found for {0}: looked for {1} in '
+                        'MODFLOW_BIN, {2} and the PATH.'.format(
+                            version, exe_names.get(version, [version]), search_dirs))
+    path = os.path.abspath(paths[0])
+    info = dict(path=path, id=file_id(path), **probe(path))
+    cache[version] = info
+    write_cache(cache)
+    resolved[version] = info
+    return info
+
+
+def private_file(path):
+    # a file of this user that nobody else can write to
+    st = os.stat(path)
+    if os.name != 'posix':
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+def stage(path, folder=None):
+    """Copy an executable to RAM-backed storage and return the copy's path.
+
+    The copy goes to a folder of this user that only this user can
+    access, and is reused while the original is unchanged. Returns path
+    itself if there is no RAM-backed folder, or if the staging folder
+    is not private (another user created it first).
+    """
+    import fastload
+
+    folder = stage_dir if folder is None else folder
+    if not os.path.isdir(folder):
+        return path
+    size, mtime = file_id(path)
+    key = hashlib.md5('{0}|{1}|{2}'.format(path, size, mtime).encode()).hexdigest()[:12]
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    dest_dir = os.path.join(folder, 'flopytools-{0}-{1}'.format(uid, key))
+    try:
+        fastload.private_dir(dest_dir)
+    except PermissionError as e:
+        warnings.warn('{0}; running {1} in place'.format(e, path))
+        return path
+    dest = os.path.join(dest_dir, os.path.basename(path))
+    if os.path.isfile(dest) and os.path.getsize(dest) == size and private_file(dest):
+        return dest
+    fd, tmp = tempfile.mkstemp(dir=dest_dir)
+    os.close(fd)
+    shutil.copy2(path, tmp)
+    os.chmod(tmp, 0o700)
+    os.replace(tmp, dest)
+    return dest
+
+
+def resolve(version='mf2005', stage_to_ram=False, refresh=False):
+    """Path of the MODFLOW executable for version ('mf2005' or 'mfnwt').
+
+    stage_to_ram: run from a copy in /dev/shm
+    refresh: search and probe again instead of using the cache
+    """
+    path = lookup(version, refresh=refresh)['path']
+    if stage_to_ram:
+        path = stage(path)
+    return path
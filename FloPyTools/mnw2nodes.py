@@ -0,0 +1,150 @@
+## mnw2nodes.py
+# Build MNW2 node_data and stress_period_data straight from arrays.
+#
+# MNW2-SimpleExample.py builds node_data from pandas DataFrames, either
+# by screen interval (ztop/zbotm) or by explicit layer k, and groups the
+# stress period data with groupby/get_group. For well fields with tens
+# of thousands of multi-node wells that route is slow. Here the screens
+# are given as arrays (i, j, ztop, zbotm) and intersected with the layer
+# tops and bottoms from DIS in one NumPy operation. Each well gets one
+# node per layer it penetrates, with k, the screen interval clipped to
+# that layer, and the penetrated fraction of the layer. MNW2 reads
+# either screen intervals (NNODES < 0) or layers (NNODES > 0), and FloPy
+# picks intervals whenever ztop differs from zbotm, so by_layer=True
+# zeroes ztop/zbotm to have the nodes written by k.
+#
+# Example (the 'well1'/'well2' screens of MNW2-SimpleExample.py):
+#   import mnw2nodes
+#   node_data = mnw2nodes.node_data(dis, wellid=['well1', 'well2'],
+#                                   i=[1, 3], j=[1, 3], ztop=[9.5, 9.1],
+#                                   zbotm=[5.1, 3.7], losstype='skin',
+#                                   pumploc=-1, rw=1., rskin=2., kskin=5.,
+#                                   zpump=[6.2, 4.1])
+#   spd, itmp = mnw2nodes.stress_period_data(['well1', 'well2'],
+#                                            [[0., 0.], [100., 1000.], [100., 1000.]])
+#   mnw2 = flopy.modflow.ModflowMnw2(model=m, mnwmax=2, node_data=node_data,
+#                                    stress_period_data=spd, itmp=itmp)
+
+import numpy as np
+
+
+def layer_bounds(dis, i, j):
+    """(nlay, nwell) arrays of layer top and bottom elevations at cells (i, j)."""
+    top = np.asarray(dis.top.array, dtype=np.float64)
+    botm = np.asarray(dis.botm.array, dtype=np.float64)
+    tops = np.concatenate([top[None, :, :], botm[:-1]])
+    return tops[:, i, j], botm[:, i, j]
+
+
+def screen_nodes(dis, i, j, ztop, zbotm, min_length=0.):
+    """Intersect well screens with the model layers.
+
+    i, j: zero-based row and column of each well
+    ztop, zbotm: screen top and bottom elevation of each well
+    min_length: ignore intersections shorter than this
+
+    Returns a dict of per-node arrays, ordered by well then layer: well
+    (index into the input arrays), k, ztop, zbotm (screen clipped to the
+    layer), length and pp (length as a fraction of the layer thickness).
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    ztop = np.asarray(ztop, dtype=np.float64)
+    zbotm = np.asarray(zbotm, dtype=np.float64)
+    ltop, lbot = layer_bounds(dis, i, j)
+    node_top = np.minimum(ztop[None, :], ltop)
+    node_bot = np.maximum(zbotm[None, :], lbot)
+    length = node_top - node_bot
+    # nonzero on the transpose orders the nodes by well, then layer
+    well, k = np.nonzero(length.T > min_length)
+    thick = ltop[k, well] - lbot[k, well]
+    return {'well': well, 'k': k,
+            'ztop': node_top[k, well], 'zbotm': node_bot[k, well],
+            'length': length[k, well],
+            'pp': np.where(thick > 0., length[k, well]/np.where(thick > 0., thick, 1.), 0.)}
+
+
+def node_data(dis, wellid, i, j, ztop, zbotm, min_length=0., by_layer=False, **attrs):
+    """MNW2 node_data record array from well screen arrays.
+
+    wellid, i, j, ztop, zbotm: one entry per well
+    by_layer: define the nodes by layer k instead of by screen interval
+    attrs: other node_data columns (losstype, pumploc, rw, rskin, kskin,
+        zpump, ...), each a scalar or one value per well
+
+    Every node gets k, i, j and pp; wells that do not reach any active
+    layer interval are left out. By default the nodes also get their
+    clipped ztop/zbotm, so FloPy writes them as screen intervals and
+    MNW2 does not read k. With by_layer, ztop and zbotm are 0 and MNW2
+    uses k. Raises ValueError for a column that MNW2 node_data does not
+    have.
+    """
+    import flopy
+
+    wellid = np.asarray(wellid, dtype=object)
+    nodes = screen_nodes(dis, i, j, ztop, zbotm, min_length=min_length)
+    well = nodes['well']
+    nd = flopy.modflow.ModflowMnw2.get_empty_node_data(len(well))
+    names = nd.dtype.names
+    for name, value in attrs.items():
+        if name not in names:
+            raise ValueError('"{0}" is not an MNW2 node_data column'.format(name))
+        value = np.asarray(value)
+        nd[name] = value[well] if value.ndim > 0 else value
+    nd['k'] = nodes['k']
+    nd['i'] = np.asarray(i)[well]
+    nd['j'] = np.asarray(j)[well]
+    if by_layer:
+        # equal ztop and zbotm make FloPy write NNODES > 0
+        nd['ztop'] = 0.
+        nd['zbotm'] = 0.
+    else:
+        nd['ztop'] = nodes['ztop']
+        nd['zbotm'] = nodes['zbotm']
+    nd['wellid'] = wellid[well]
+    if 'pp' in names and 'pp' not in attrs:
+        nd['pp'] = nodes['pp']
+    return nd
+
+
+def stress_period_data(wellid, qdes, reuse=True, **attrs):
+    """MNW2 stress_period_data dict and itmp list from a rate table.
+
+    wellid: one entry per well
+    qdes: (nper, nwell) desired rates (nan: well not active that period)
+    reuse: give itmp = -1 (reuse the previous period) for periods with
+        the same rates as the one before instead of repeating them
+    attrs: other stress period columns (capmult, hlim, ...), each a
+        scalar or one value per well
+
+    Returns (spd, itmp); spd only has entries for periods with itmp >= 0.
+    """
+    import flopy
+
+    wellid = np.asarray(wellid, dtype=object)
+    qdes = np.atleast_2d(np.asarray(qdes, dtype=np.float64))
+    active = ~np.isnan(qdes)
+    same = np.zeros(len(qdes), dtype=bool)
+    if reuse and len(qdes) > 1:
+        same[1:] = np.all((qdes[1:] == qdes[:-1]) | (~active[1:] & ~active[:-1]), axis=1)
+    spd = {}
+    itmp = []
+    for per in range(len(qdes)):
+        if same[per]:
+            itmp.append(-1)
+            continue
+        idx = np.flatnonzero(active[per])
+        data = flopy.modflow.ModflowMnw2.get_empty_stress_period_data(len(idx))
+        names = data.dtype.names
+        for name, value in attrs.items():
+            if name not in names:
+                raise ValueError('"{0}" is not an MNW2 stress period column'.format(name))
+            value = np.asarray(value)
+            data[name] = value[idx] if value.ndim > 0 else value
+        if 'per' in names:
+            data['per'] = per
+        data['wellid'] = wellid[idx]
+        data['qdes'] = qdes[per, idx]
+        spd[per] = data
+        itmp.append(len(idx))
+    return spd, itmp
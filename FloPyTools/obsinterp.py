@@ -0,0 +1,153 @@
+## obsinterp.py
+# Interpolated head time series at many observation points, read in one
+# pass over the head file.
+#
+# The scripts read hydrographs one cell at a time with
+# headobj.get_ts((0, r_well, c_well)), and each call scans the whole
+# file. Observations works out, once, the layer of every (x, y, z)
+# point and the four surrounding cell centres with their bilinear
+# weights. extract() then memory-maps the binary head file as an array
+# of fixed-size layer records and only gathers the cells that are
+# needed, so thousands of points cost about as much as one.
+#
+# Example (after running SquareWithWell-Transient.py):
+#   import obsinterp
+#   obs = obsinterp.Observations(dis, x=[480., 520., 750.], y=[500., 500., 250.])
+#   times, heads = obsinterp.extract(modelname+'.hds', obs)
+#   # heads[it, ip] is the head at point ip at time times[it]
+
+import os
+
+import numpy as np
+
+inactive_value = 1e29
+
+
+class Observations(object):
+    """Layer, cells and interpolation weights of observation points.
+
+    dis: ModflowDis of the model
+    x, y: point coordinates, in the same units as delr/delc
+    z: point elevations, used to pick the layer (layer 0 if None)
+    layer: zero-based layers, instead of z
+    xll, yll: coordinates of the lower-left corner of the grid
+
+    Points outside the grid give nan.
+    """
+
+    def __init__(self, dis, x, y, z=None, layer=None, xll=0., yll=0.):
+        self.shape = (dis.nlay, dis.nrow, dis.ncol)
+        delr = np.asarray(dis.delr.array, dtype=np.float64)
+        delc = np.asarray(dis.delc.array, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64) - xll
+        # distance down from the top edge, as rows are numbered
+        d = delc.sum() - (np.asarray(y, dtype=np.float64) - yll)
+        xe = np.concatenate([[0.], np.cumsum(delr)])
+        de = np.concatenate([[0.], np.cumsum(delc)])
+        self.inside = (x >= 0.) & (x <= xe[-1]) & (d >= 0.) & (d <= de[-1])
+
+        # cell containing each point, for the layer lookup
+        ic = np.clip(np.searchsorted(de, d, side='right') - 1, 0, dis.nrow - 1)
+        jc = np.clip(np.searchsorted(xe, x, side='right') - 1, 0, dis.ncol - 1)
+        if layer is not None:
+            k = np.broadcast_to(np.asarray(layer, dtype=np.int64), x.shape)
+        elif z is not None:
+            botm = np.asarray(dis.botm.array, dtype=np.float64).reshape(self.shape)
+            zb = botm[:, ic, jc]
+            # first layer whose bottom is below z
+            k = np.argmax(zb <= np.asarray(z, dtype=np.float64)[None, :], axis=0)
+            k = np.where(np.all(zb > np.asarray(z)[None, :], axis=0), dis.nlay - 1, k)
+        else:
+            k = np.zeros(x.shape, dtype=np.int64)
+        self.k = np.asarray(k, dtype=np.int64)
+
+        # bilinear weights between the surrounding cell centres
+        xc = 0.5*(xe[:-1] + xe[1:])
+        dc = 0.5*(de[:-1] + de[1:])
+        j0, tx = self.bracket(xc, x)
+        i0, ty = self.bracket(dc, d)
+        j1 = np.minimum(j0 + 1, dis.ncol - 1)
+        i1 = np.minimum(i0 + 1, dis.nrow - 1)
+        self.i = np.stack([i0, i0, i1, i1])
+        self.j = np.stack([j0, j1, j0, j1])
+        self.weights = np.stack([(1. - ty)*(1. - tx), (1. - ty)*tx,
+                                 ty*(1. - tx), ty*tx])
+
+    @staticmethod
+    def bracket(centres, v):
+        # lower index and fraction between neighbouring centres, clamped
+        # to the outermost centres
+        if len(centres) == 1:
+            return np.zeros(v.shape, dtype=np.int64), np.zeros(v.shape)
+        i0 = np.clip(np.searchsorted(centres, v, side='right') - 1, 0, len(centres) - 2)
+        t = np.clip((v - centres[i0])/(centres[i0 + 1] - centres[i0]), 0., 1.)
+        return i0, t
+
+    @property
+    def npoints(self):
+        return len(self.k)
+
+    def interpolate(self, values):
+        """Point values from gathered cell values of shape (..., 4, npoints).
+
+        Dry/inactive cells are left out and the other weights rescaled.
+        """
+        valid = np.abs(values) < inactive_value
+        w = np.where(valid, self.weights, 0.)
+        wsum = w.sum(axis=-2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = (np.where(valid, values, 0.)*w).sum(axis=-2)/wsum
+        out[..., ~self.inside | (wsum == 0.)] = np.nan
+        return out
+
+    def at_array(self, heads):
+        """Point values from a dense (nlay, nrow, ncol) or (ntimes, nlay, nrow, ncol) array."""
+        heads = np.asarray(heads)
+        return self.interpolate(heads[..., self.k[None, :], self.i, self.j])
+
+
+def record_dtype(nrow, ncol, realtype):
+    # one layer record of a binary head file
+    return np.dtype([('kstp', '<i4'), ('kper', '<i4'), ('pertim', realtype),
+                     ('totim', realtype), ('text', 'S16'), ('ncol', '<i4'),
+                     ('nrow', '<i4'), ('ilay', '<i4'), ('data', realtype, (nrow, ncol))])
+
+
+def open_records(fname, nrow, ncol, precision='auto'):
+    """Memory map of a head (or drawdown) file as an array of layer records."""
+    size = os.path.getsize(fname)
+    types = {'single': ['<f4'], 'double': ['<f8']}.get(precision, ['<f4', '<f8'])
+    for realtype in types:
+        dtype = record_dtype(nrow, ncol, realtype)
+        if size == 0 or size % dtype.itemsize != 0:
+            continue
+        recs = np.memmap(fname, dtype=dtype, mode='r')
+        if recs['ncol'][0] == ncol and recs['nrow'][0] == nrow:
+            return recs
+    raise ValueError('{0} is not a head file for a {1} x {2} grid'.format(fname, nrow, ncol))
+
+
+def extract(fname, obs, text='HEAD', precision='auto'):
+    """Interpolated time series at all observation points.
+
+    Returns (times, values) with values of shape (ntimes, npoints).
+    """
+    nlay, nrow, ncol = obs.shape
+    recs = open_records(fname, nrow, ncol, precision=precision)
+    texts = np.char.strip(recs['text'])
+    sel = np.flatnonzero(texts == text.upper().encode())
+    ilay = recs['ilay'][sel]
+    # record of (time, layer), in file order
+    step = np.stack([recs['kstp'][sel], recs['kper'][sel]], axis=1)
+    new = np.concatenate([[True], np.any(step[1:] != step[:-1], axis=1)])
+    itime = np.cumsum(new) - 1
+    table = np.full((itime[-1] + 1, nlay), -1, dtype=np.int64)
+    table[itime, ilay - 1] = sel
+    times = recs['totim'][sel[new]].astype(np.float64)
+
+    irec = table[:, obs.k]  # (ntimes, npoints)
+    if np.any(irec < 0):
+        raise ValueError('{0} does not have {1} for every layer and time'.format(fname, text))
+    data = recs['data']
+    values = data[irec[:, None, :], obs.i[None], obs.j[None]].astype(np.float64)
+    return times, obs.interpolate(values)
@@ -0,0 +1,265 @@
+## particles.py
+# Pollock-style (semi-analytical) particle tracking on the DIS grid,
+# with whole batches of particles advanced as NumPy arrays.
+#
+# Capture questions (which water reaches the well in SquareWithWell,
+# which reaches each stream in TwoStreamsWithWell) need pathlines, not
+# just plot_discharge arrows. The velocity in each cell is interpolated
+# linearly between opposite faces from the FLOW RIGHT/FRONT/LOWER FACE
+# budget records, so the exit time and point of every particle in its
+# cell have closed forms (Pollock, 1989). Each step moves all particles
+# still moving to their next cell face at once. Tracking can go forward
+# or backward in time, and large batches can be split over worker
+# processes.
+#
+# Example (capture zone of the well in SquareWithWell-SteadyState.py,
+# saved with 'save budget' in OC and ipakcb set on UPW/LPF):
+#   import particles
+#   vf = particles.VelocityField.from_budget(modelname+'.cbc', dis, ibound,
+#                                            porosity=0.25)
+#   start = particles.cell_particles([(0, r_well, c_well)], n=(4, 4, 1))
+#   end = particles.track(vf, start, direction='backward')
+#   # end['x'], end['y'] are where the water reaching the well came from
+
+import multiprocessing
+
+import numpy as np
+
+# end status of a particle
+status_names = {0: 'moving', 1: 'boundary', 2: 'sink', 3: 'max time',
+                4: 'stop cell', 5: 'max steps'}
+
+
+class VelocityField(object):
+    """Face velocities of a structured grid.
+
+    dis: ModflowDis of the model
+    frf, fff, flf: (nlay, nrow, ncol) flow right/front/lower face arrays
+        (None for a missing direction)
+    ibound: active (!= 0) and constant head (< 0) cells; particles stop
+        on entering a constant head or inactive cell
+    porosity: scalar or (nlay, nrow, ncol) effective porosity
+    thick: saturated thickness (cell thickness if None)
+    """
+
+    def __init__(self, dis, frf, fff, flf, ibound, porosity=0.3, thick=None):
+        self.shape = (dis.nlay, dis.nrow, dis.ncol)
+        self.delr = np.asarray(dis.delr.array, dtype=np.float64)
+        self.delc = np.asarray(dis.delc.array, dtype=np.float64)
+        top = np.asarray(dis.top.array, dtype=np.float64)
+        botm = np.asarray(dis.botm.array, dtype=np.float64).reshape(self.shape)
+        tops = np.concatenate([top[None], botm[:-1]])
+        if thick is None:
+            thick = tops - botm
+        self.thick = np.maximum(np.asarray(thick, dtype=np.float64), 1e-10)
+        self.cell_top = botm + self.thick
+        self.ibound = np.asarray(ibound).reshape(self.shape)
+        n = np.broadcast_to(np.asarray(porosity, dtype=np.float64), self.shape)
+        zero = np.zeros(self.shape)
+        frf = zero if frf is None else np.asarray(frf, dtype=np.float64)
+        fff = zero if fff is None else np.asarray(fff, dtype=np.float64)
+        flf = zero if flf is None else np.asarray(flf, dtype=np.float64)
+
+        # velocities at the low and high face of each cell along each axis,
+        # positive towards increasing column, row and layer
+        area_x = self.delc[None, :, None]*self.thick*n
+        area_y = self.delr[None, None, :]*self.thick*n
+        area_z = (self.delc[:, None]*self.delr[None, :])[None]*n
+        self.vx2 = frf/area_x
+        self.vx1 = np.zeros(self.shape)
+        self.vx1[:, :, 1:] = frf[:, :, :-1]/area_x[:, :, 1:]
+        self.vy2 = fff/area_y
+        self.vy1 = np.zeros(self.shape)
+        self.vy1[:, 1:, :] = fff[:, :-1, :]/area_y[:, 1:, :]
+        self.vz2 = flf/area_z
+        self.vz1 = np.zeros(self.shape)
+        self.vz1[1:] = flf[:-1]/area_z[1:]
+        self.Ly = self.delc.sum()
+        self.xe = np.concatenate([[0.], np.cumsum(self.delr)])
+        self.de = np.concatenate([[0.], np.cumsum(self.delc)])
+
+    @classmethod
+    def from_budget(cls, cbcfile, dis, ibound, porosity=0.3, idx=-1, headfile=None,
+                    laytyp=None, precision='auto'):
+        """Velocity field from the face-flow records of a budget file.
+
+        idx: saved time step to use; headfile/laytyp give the saturated
+        thickness of convertible layers (see specdis.py).
+        """
+        import cbcindex
+        import specdis
+
+        index = cbcindex.CbcIndex(cbcfile, precision=precision)
+        texts = index.get_textlist()
+        faces = [specdis.read_full_records(index, t, np.float64)[idx] if t in texts else None
+                 for t in specdis.face_texts]
+        thick = None
+        if headfile is not None:
+            import flopy.utils.binaryfile as bf
+            hds = bf.HeadFile(headfile)
+            heads = hds.get_data(idx=idx if idx >= 0 else len(hds.get_times()) + idx)
+            hds.close()
+            thick = specdis.saturated_thickness(dis, heads, laytyp)
+        return cls(dis, faces[0], faces[1], faces[2], ibound, porosity=porosity, thick=thick)
+
+    def to_global(self, k, i, j, lx, ly, lz):
+        # model x, y (up from the bottom edge) and z from local positions
+        x = self.xe[j] + lx
+        y = self.Ly - (self.de[i] + ly)
+        z = self.cell_top[k, i, j] - lz
+        return x, y, z
+
+
+def cell_particles(cells, n=(2, 2, 2)):
+    """Starting points spread regularly inside cells.
+
+    cells: (k, i, j) cells; n: particles along (column, row, layer)
+    Returns a dict of arrays k, i, j and fx, fy, fz (fractions of the
+    cell width along increasing column, row and layer).
+    """
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, 3)
+    fx, fy, fz = [(np.arange(m) + 0.5)/m for m in n]
+    gx, gy, gz = [g.ravel() for g in np.meshgrid(fx, fy, fz, indexing='ij')]
+    m = len(gx)
+    return {'k': np.repeat(cells[:, 0], m), 'i': np.repeat(cells[:, 1], m),
+            'j': np.repeat(cells[:, 2], m), 'fx': np.tile(gx, len(cells)),
+            'fy': np.tile(gy, len(cells)), 'fz': np.tile(gz, len(cells))}
+
+
+def exit_time(v1, v2, L, x):
+    """Time to reach a face along one axis, and which face (-1, +1 or 0 for none)."""
+    A = (v2 - v1)/L
+    v = v1 + A*x
+    small = np.abs(A) < 1e-12*np.maximum(np.abs(v1) + np.abs(v2), 1e-30)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_hi = np.where(small, (L - x)/v, np.log(v2/v)/A)
+        t_lo = np.where(small, -x/v, np.log(v1/v)/A)
+    up = (v > 0.) & (v2 > 0.)
+    down = (v < 0.) & (v1 < 0.)
+    t = np.where(up, t_hi, np.where(down, t_lo, np.inf))
+    face = np.where(up, 1, np.where(down, -1, 0))
+    return np.where(np.isfinite(t) & (t >= 0.), t, np.where(face != 0, 0., np.inf)), face
+
+
+def advance(v1, v2, L, x, dt):
+    # position along one axis after dt
+    A = (v2 - v1)/L
+    v = v1 + A*x
+    small = np.abs(A) < 1e-12*np.maximum(np.abs(v1) + np.abs(v2), 1e-30)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        moved = np.where(small, x + v*dt, (v*np.exp(A*dt) - v1)/A)
+    return np.clip(moved, 0., L)
+
+
+def track_batch(vf, start, direction='forward', tmax=np.inf, max_steps=100000,
+                stop_cells=None):
+    """Track one batch of particles (see track())."""
+    sign = 1. if direction == 'forward' else -1.
+    k = np.array(start['k'], dtype=np.int64)
+    i = np.array(start['i'], dtype=np.int64)
+    j = np.array(start['j'], dtype=np.int64)
+    lx = np.asarray(start['fx'])*vf.delr[j]
+    ly = np.asarray(start['fy'])*vf.delc[i]
+    lz = np.asarray(start['fz'])*vf.thick[k, i, j]
+    t = np.zeros(len(k))
+    status = np.zeros(len(k), dtype=np.int8)
+    nlay, nrow, ncol = vf.shape
+    stop = np.zeros(vf.shape, dtype=bool) if stop_cells is None else np.asarray(stop_cells, dtype=bool)
+
+    for _ in range(max_steps):
+        a = np.flatnonzero(status == 0)
+        if len(a) == 0:
+            break
+        ka, ia, ja = k[a], i[a], j[a]
+        Lx, Ly, Lz = vf.delr[ja], vf.delc[ia], vf.thick[ka, ia, ja]
+        v = [(sign*vf.vx1[ka, ia, ja], sign*vf.vx2[ka, ia, ja], Lx, lx[a]),
+             (sign*vf.vy1[ka, ia, ja], sign*vf.vy2[ka, ia, ja], Ly, ly[a]),
+             (sign*vf.vz1[ka, ia, ja], sign*vf.vz2[ka, ia, ja], Lz, lz[a])]
+        times, faces = zip(*[exit_time(*args) for args in v])
+        times = np.stack(times)
+        faces = np.stack(faces)
+        axis = np.argmin(times, axis=0)
+        dt = times[axis, np.arange(len(a))]
+        # stagnant particles (weak/strong sinks) stop where they are
+        sink = ~np.isfinite(dt)
+        over = t[a] + np.where(sink, 0., dt) > tmax
+        dt = np.where(over, tmax - t[a], np.where(sink, 0., dt))
+        new = [advance(*args, dt) for args in v]
+        for ax, face in enumerate(faces):
+            hit = (axis == ax) & ~sink & ~over
+            L = v[ax][2]
+            new[ax] = np.where(hit & (face > 0), L, np.where(hit & (face < 0), 0., new[ax]))
+        lx[a], ly[a], lz[a] = new
+        t[a] += dt
+        status[a[sink]] = 2
+        status[a[over & ~sink]] = 3
+
+        # step into the next cell
+        go = ~sink & ~over
+        face = faces[axis, np.arange(len(a))]
+        dk = np.where(go & (axis == 2), face, 0)
+        di = np.where(go & (axis == 1), face, 0)
+        dj = np.where(go & (axis == 0), face, 0)
+        nk, ni, nj = ka + dk, ia + di, ja + dj
+        outside = (nk < 0) | (nk >= nlay) | (ni < 0) | (ni >= nrow) | (nj < 0) | (nj >= ncol)
+        nk, ni, nj = [np.where(outside, c, n) for c, n in [(ka, nk), (ia, ni), (ja, nj)]]
+        ib = vf.ibound[nk, ni, nj]
+        leave = go & (outside | (ib <= 0))
+        status[a[leave]] = 1
+        move = go & ~leave
+        m = a[move]
+        # position on the entry face of the new cell
+        lx[m] = np.where(dj[move] > 0, 0., np.where(dj[move] < 0, vf.delr[nj[move]], lx[m]))
+        ly[m] = np.where(di[move] > 0, 0., np.where(di[move] < 0, vf.delc[ni[move]], ly[m]))
+        lz[m] = np.where(dk[move] > 0, 0., np.where(dk[move] < 0, vf.thick[nk[move], ni[move], nj[move]],
+                                                    lz[m]))
+        k[m], i[m], j[m] = nk[move], ni[move], nj[move]
+        status[m[stop[k[m], i[m], j[m]]]] = 4
+    status[status == 0] = 5
+
+    x, y, z = vf.to_global(k, i, j, lx, ly, lz)
+    return {'k': k, 'i': i, 'j': j, 'x': x, 'y': y, 'z': z, 'time': t, 'status': status}
+
+
+# each worker keeps its own copy of the velocity field
+worker = {}
+
+
+def init_worker(vf, kwargs):
+    worker['vf'] = vf
+    worker['kwargs'] = kwargs
+
+
+def run_chunk(start):
+    return track_batch(worker['vf'], start, **worker['kwargs'])
+
+
+def track(vf, start, direction='forward', tmax=np.inf, max_steps=100000,
+          stop_cells=None, nproc=1, chunksize=10000):
+    """Track particles to where they stop.
+
+    vf: VelocityField
+    start: dict from cell_particles() (k, i, j, fx, fy, fz arrays)
+    direction: 'forward' or 'backward' (upstream, e.g. from a well)
+    tmax: stop particles after this travel time
+    stop_cells: boolean (nlay, nrow, ncol) array of cells where particles
+        stop when they enter (e.g. well cells for forward capture)
+    nproc: worker processes (os.cpu_count() if None); chunksize
+        particles per task
+
+    Returns a dict of arrays k, i, j (final cell), x, y, z, time and
+    status (see status_names).
+    """
+    kwargs = {'direction': direction, 'tmax': tmax, 'max_steps': max_steps,
+              'stop_cells': stop_cells}
+    n = len(start['k'])
+    chunks = [{key: np.asarray(val)[s:s + chunksize] for key, val in start.items()}
+              for s in range(0, n, chunksize)]
+    if nproc == 1 or len(chunks) <= 1:
+        results = [track_batch(vf, c, **kwargs) for c in chunks]
+    else:
+        with multiprocessing.Pool(nproc, initializer=init_worker, initargs=(vf, kwargs)) as pool:
+            results = pool.map(run_chunk, chunks)
+    if not results:
+        return {}
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
@@ -0,0 +1,240 @@
+## profiling.py
+# Opt-in timing of the build, write, run and read phases of a FloPy
+# script. A Profiler records wall time, CPU time of this process and
+# CPU time of child processes (the MODFLOW executable) for each stage,
+# plus counters for bytes written/read and numpy arrays returned, and
+# writes them to a Chrome trace file (open it in chrome://tracing or
+# https://ui.perfetto.dev).
+#
+# Stages can be timed by hand:
+#   import profiling
+#   prof = profiling.Profiler()
+#   with prof.stage('build DIS'):
+#       dis = flopy.modflow.ModflowDis(mf, ...)
+#
+# or the FloPy constructors, write_input, run_model and the binary/SFR
+# output readers can be hooked without touching the script:
+#   prof = profiling.Profiler()
+#   prof.install_hooks()
+#   ... the rest of the script ...
+#   prof.remove_hooks()
+#   prof.report()
+#   prof.write_trace('trace.json')
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def snapshot_files(path):
+    # {file: (size, mtime)} for the files in a directory
+    files = {}
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            fname = os.path.join(path, name)
+            if os.path.isfile(fname):
+                st = os.stat(fname)
+                files[fname] = (st.st_size, st.st_mtime)
+    return files
+
+
+def count_arrays(result):
+    # number of numpy arrays and their total size in a return value
+    if isinstance(result, np.ndarray):
+        return 1, result.nbytes
+    if isinstance(result, (list, tuple)):
+        n, nbytes = 0, 0
+        for r in result:
+            if isinstance(r, np.ndarray):
+                n += 1
+                nbytes += r.nbytes
+        return n, nbytes
+    return 0, 0
+
+
+class Profiler(object):
+    """Collect timed stages and counters for one process.
+
+    enabled: if False, stage() and count() do nothing, so the calls can be
+        left in a script and switched on with a single flag
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []
+        self.counters = {}
+        self.counter_events = []
+        self.t0 = time.perf_counter()
+        # wall-clock start, so traces from several processes line up
+        self.epoch = time.time()*1e6
+        self.pid = os.getpid()
+        self.patched = []
+
+    def now(self):
+        # microseconds since the profiler was created
+        return (time.perf_counter() - self.t0)*1e6
+
+    @contextlib.contextmanager
+    def stage(self, name, **args):
+        """Time the body of a with block as one stage.
+
+        Keyword arguments are stored with the stage; the yielded dict can
+        be used to add more from inside the block.
+        """
+        if not self.enabled:
+            yield args
+            return
+        ts = self.now()
+        cpu0 = time.process_time()
+        ch0 = os.times()
+        try:
+            yield args
+        finally:
+            ch1 = os.times()
+            args['cpu'] = time.process_time() - cpu0
+            args['child_cpu'] = (ch1.children_user - ch0.children_user +
+                                 ch1.children_system - ch0.children_system)
+            self.events.append({'name': name, 'ts': ts, 'dur': self.now() - ts,
+                                'tid': threading.get_ident(), 'args': args})
+
+    def count(self, name, value=1):
+        # add to a running counter (e.g. 'bytes_written')
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.counter_events.append((self.now(), name, self.counters[name]))
+
+    def stage_totals(self):
+        # {stage name: [calls, wall, cpu, child_cpu]} with times in seconds
+        totals = {}
+        for e in self.events:
+            t = totals.setdefault(e['name'], [0, 0., 0., 0.])
+            t[0] += 1
+            t[1] += e['dur']*1e-6
+            t[2] += e['args']['cpu']
+            t[3] += e['args']['child_cpu']
+        return totals
+
+    def report(self):
+        # print a table of stages, slowest first, and the counters
+        totals = self.stage_totals()
+        print('{0:<40} {1:>6} {2:>10} {3:>10} {4:>10}'.format(
+              'stage', 'calls', 'wall [s]', 'cpu [s]', 'child [s]'))
+        for name, t in sorted(totals.items(), key=lambda kv: -kv[1][1]):
+            print('{0:<40} {1:>6} {2:>10.4f} {3:>10.4f} {4:>10.4f}'.format(name, *t))
+        for name in sorted(self.counters):
+            print('{0:<40} {1:>12}'.format(name, self.counters[name]))
+
+    def trace_events(self):
+        # stages and counters as Chrome trace events
+        trace = []
+        for e in self.events:
+            trace.append({'name': e['name'], 'ph': 'X', 'ts': self.epoch + e['ts'], 'dur': e['dur'],
+                          'pid': self.pid, 'tid': e['tid'], 'args': e['args']})
+        for ts, name, value in self.counter_events:
+            trace.append({'name': name, 'ph': 'C', 'ts': self.epoch + ts, 'pid': self.pid,
+                          'args': {name: value}})
+        return trace
+
+    def write_trace(self, fname):
+        """Write the stages and counters to a Chrome trace JSON file."""
+        with open(fname, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(),
+                       'displayTimeUnit': 'ms'}, f, default=str)
+
+    ## hooks into FloPy
+    def wrap(self, owner, attr, name, before=None, after=None):
+        # replace owner.attr with a version that runs inside a stage;
+        # before(obj, args, kwargs) -> state and after(obj, state, result,
+        # stage_args) can add counters
+        orig = getattr(owner, attr)
+        prof = self
+
+        @functools.wraps(orig)
+        def wrapper(*args, **kwargs):
+            obj = args[0] if args else None
+            with prof.stage(name) as stage_args:
+                state = before(obj, args, kwargs) if before else None
+                result = orig(*args, **kwargs)
+                if after:
+                    after(obj, state, result, stage_args)
+                n, nbytes = count_arrays(result)
+                if n > 0:
+                    prof.count('arrays_returned', n)
+                    prof.count('array_bytes', nbytes)
+            return result
+
+        setattr(owner, attr, wrapper)
+        self.patched.append((owner, attr, orig))
+
+    def install_hooks(self):
+        """Time FloPy model construction, writing, running and reading."""
+        import flopy
+        import flopy.utils.binaryfile as bf
+
+        # package and model construction
+        for clsname in dir(flopy.modflow):
+            cls = getattr(flopy.modflow, clsname)
+            if (clsname.startswith('Modflow') and isinstance(cls, type) and
+                    '__init__' in cls.__dict__ and
+                    not hasattr(cls.__init__, '__wrapped__')):
+                self.wrap(cls, '__init__', 'build ' + cls.__name__)
+
+        # writing input: count the bytes of files that were (re)written
+        def before_write(model, args, kwargs):
+            return snapshot_files(model.model_ws)
+
+        def after_write(model, before, result, stage_args):
+            nbytes = 0
+            for fname, (size, mtime) in snapshot_files(model.model_ws).items():
+                if before.get(fname) != (size, mtime):
+                    nbytes += size
+            stage_args['bytes'] = nbytes
+            self.count('bytes_written', nbytes)
+
+        self.wrap(flopy.mbase.BaseModel, 'write_input', 'write_input',
+                  before=before_write, after=after_write)
+        self.wrap(flopy.mbase.BaseModel, 'run_model', 'run_model')
+
+        # reading output: count the size of each file that is opened
+        def after_open(reader, fname, result, stage_args):
+            if isinstance(fname, str) and os.path.isfile(fname):
+                stage_args['bytes'] = os.path.getsize(fname)
+                self.count('bytes_read', stage_args['bytes'])
+
+        def get_fname(reader, args, kwargs):
+            return args[1] if len(args) > 1 else kwargs.get('filename')
+
+        readers = [bf.HeadFile, bf.CellBudgetFile]
+        try:
+            import flopy.utils.sfroutputfile as sf
+            readers.append(sf.SfrFile)
+        except ImportError:
+            pass
+        for cls in readers:
+            self.wrap(cls, '__init__', 'open ' + cls.__name__,
+                      before=get_fname, after=after_open)
+            for attr in ['get_data', 'get_ts', 'get_dataframe']:
+                if hasattr(cls, attr):
+                    self.wrap(cls, attr, 'read ' + cls.__name__ + '.' + attr)
+
+    def remove_hooks(self):
+        # undo install_hooks(), most recent first
+        while self.patched:
+            owner, attr, orig = self.patched.pop()
+            setattr(owner, attr, orig)
+
+
+def merge_traces(fnames, fname_out):
+    """Combine trace files from several worker processes into one file."""
+    trace = []
+    for fname in fnames:
+        with open(fname) as f:
+            trace.extend(json.load(f)['traceEvents'])
+    with open(fname_out, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
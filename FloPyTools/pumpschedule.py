@@ -0,0 +1,114 @@
+## pumpschedule.py
+# Turn metered pumping time series into WEL or MNW2 stress periods.
+#
+# SquareWithWell-Transient.py and GitHub-Tutorial2.py write the pumping
+# of each stress period by hand (wel_sp1, wel_sp2, ...). With daily
+# meter readings over decades, one stress period per day makes nper
+# explode and the WEL file and model start-up become the slow part.
+# Here the rates of all wells are averaged onto coarser periods (the
+# volume pumped in each period is kept exactly), and then consecutive
+# periods with the same rates are merged so nper is as small as
+# possible.
+#
+# Example (three wells, daily rates in m3/day for 20 years):
+#   import pumpschedule
+#   t = np.arange(20*365 + 1.)                   # interval edges [days]
+#   sched = pumpschedule.compile_schedule(t, rates, period=30., quantum=10.)
+#   dis = flopy.modflow.ModflowDis(mf, ..., nper=sched['nper'],
+#                                  perlen=sched['perlen'],
+#                                  nstp=pumpschedule.time_steps(sched['perlen'], 10.),
+#                                  steady=[False]*sched['nper'])
+#   wel = flopy.modflow.ModflowWel(mf, stress_period_data=
+#                                  pumpschedule.wel_spd(sched['q'], k, i, j))
+
+import numpy as np
+
+
+def cumulative_volume(t, rates, at):
+    """Volume pumped by each well from t[0] up to each time in at.
+
+    t: (nt+1,) interval edges; rates: (nt, nwell) rate over each interval,
+    taken as zero outside [t[0], t[-1]]. Returns (len(at), nwell).
+    """
+    t = np.asarray(t, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64).reshape(len(t) - 1, -1)
+    dt = np.diff(t)
+    cum = np.concatenate([np.zeros((1, rates.shape[1])),
+                          np.cumsum(rates*dt[:, None], axis=0)])
+    at = np.clip(np.asarray(at, dtype=np.float64), t[0], t[-1])
+    idx = np.clip(np.searchsorted(t, at, side='right') - 1, 0, len(dt) - 1)
+    return cum[idx] + rates[idx]*(at - t[idx])[:, None]
+
+
+def period_rates(t, rates, edges):
+    """(nper, nwell) average rates over the periods between edges."""
+    edges = np.asarray(edges, dtype=np.float64)
+    vol = cumulative_volume(t, rates, edges)
+    return np.diff(vol, axis=0)/np.diff(edges)[:, None]
+
+
+def merge_periods(edges, q, quantum=0.):
+    """Merge consecutive periods with the same rates.
+
+    quantum: rates are compared after rounding to a multiple of quantum
+        (0 compares them exactly); the merged rate is the volume-weighted
+        average, so the volume pumped is unchanged.
+    Returns (edges, q) of the merged periods.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    key = np.round(q/quantum)*quantum if quantum > 0. else q
+    change = np.any(key[1:] != key[:-1], axis=1)
+    starts = np.flatnonzero(np.concatenate([[True], change]))
+    dt = np.diff(edges)
+    vol = np.add.reduceat(q*dt[:, None], starts, axis=0)
+    new_edges = edges[np.append(starts, len(dt))]
+    return new_edges, vol/np.diff(new_edges)[:, None]
+
+
+def compile_schedule(t, rates, edges=None, period=None, quantum=0.):
+    """Stress periods and rates from pumping time series.
+
+    t: (nt+1,) interval edges of the metered rates (model time units)
+    rates: (nt, nwell) metered rates (negative for pumping, as in WEL)
+    edges: candidate stress period edges; if None, periods of length
+        period are used from t[0] to t[-1] (the last may be shorter); if
+        period is also None the metering intervals themselves are used
+    quantum: rate resolution used when merging periods
+
+    Returns a dict with 'edges', 'perlen' (list), 'nper' and 'q' (nper,
+    nwell) for the merged periods.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if edges is None:
+        if period is None:
+            edges = t
+        else:
+            edges = np.append(np.arange(t[0], t[-1], period), t[-1])
+    edges = np.asarray(edges, dtype=np.float64)
+    q = period_rates(t, rates, edges)
+    edges, q = merge_periods(edges, q, quantum=quantum)
+    perlen = np.diff(edges)
+    return {'edges': edges, 'perlen': perlen.tolist(), 'nper': len(perlen), 'q': q}
+
+
+def time_steps(perlen, max_dt):
+    """Number of (uniform) time steps so no step is longer than max_dt."""
+    return np.maximum(np.ceil(np.asarray(perlen)/max_dt), 1).astype(int).tolist()
+
+
+def wel_spd(q, k, i, j):
+    """WEL stress_period_data dict {kper: [[k, i, j, q], ...]} from (nper, nwell) rates."""
+    q = np.atleast_2d(q)
+    nwell = q.shape[1]
+    kij = np.column_stack([np.broadcast_to(k, nwell), np.broadcast_to(i, nwell),
+                           np.broadcast_to(j, nwell)]).astype(int).tolist()
+    return {per: [c + [rate] for c, rate in zip(kij, q[per].tolist())]
+            for per in range(len(q))}
+
+
+def mnw2_spd(q, wellid, **attrs):
+    """MNW2 (stress_period_data, itmp) from (nper, nwell) rates (see mnw2nodes.py)."""
+    import mnw2nodes
+
+    return mnw2nodes.stress_period_data(wellid, q, **attrs)
@@ -0,0 +1,189 @@
+## runall.py
+# Run every tutorial model in this repository as a regression and
+# throughput check, e.g. as a nightly test of new MODFLOW builds.
+#
+# Each script (BakkerEtAl-2016, GitHub-Tutorial1/2, SquareWithWell-*,
+# TiltedVwithSFR-*, TwoStreamsWithWell, MNW2-SimpleExample, SimpleNWT)
+# is run in its own temporary copy of its folder, several at a time,
+# with matplotlib set to a non-interactive backend. The scripts find
+# MODFLOW through mfexe.resolve(); --bin (or MODFLOW_BIN) points them
+# at the executables of the build being tested. The heads in every
+# .hds file it writes are compared with reference arrays saved in
+# FloPyTools/reference, and the wall time of each run is reported.
+#
+# Usage (from anywhere):
+#   python runall.py                  # run everything, compare with references
+#   python runall.py --update         # run everything, save new references
+#   python runall.py --only Square --nproc 2 --report runall.json
+#   python runall.py --bin /opt/modflow/bin
+# The exit code is 1 if any script fails or differs from its reference.
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tools_dir)
+reference_dir = os.path.join(tools_dir, 'reference')
+
+
+def find_scripts(only=None):
+    """Tutorial scripts in the repository (one folder level down)."""
+    scripts = []
+    for fname in sorted(glob.glob(os.path.join(repo_dir, '*', '*.py'))):
+        if os.path.dirname(fname) == tools_dir:
+            continue
+        if only is not None and only not in fname:
+            continue
+        scripts.append(fname)
+    return scripts
+
+
+def script_name(script):
+    return os.path.splitext(os.path.basename(script))[0]
+
+
+def read_heads(workspace):
+    # {file name: (ntimes, nlay, nrow, ncol) array} for every head file
+    import flopy.utils.binaryfile as bf
+
+    heads = {}
+    for fname in sorted(glob.glob(os.path.join(workspace, '**', '*.hds'), recursive=True)):
+        hds = bf.HeadFile(fname)
+        heads[os.path.relpath(fname, workspace)] = hds.get_alldata()
+        hds.close()
+    return heads
+
+
+def compare(heads, reference, rtol, atol):
+    # list of differences between heads and reference arrays
+    problems = []
+    for key in sorted(set(reference) | set(heads)):
+        if key not in heads:
+            problems.append(key + ': not written')
+        elif key not in reference:
+            problems.append(key + ': no reference')
+        elif heads[key].shape != reference[key].shape:
+            problems.append('{0}: shape {1}, reference {2}'.format(
+                            key, heads[key].shape, reference[key].shape))
+        elif not np.allclose(heads[key], reference[key], rtol=rtol, atol=atol, equal_nan=True):
+            diff = np.nanmax(np.abs(heads[key] - reference[key]))
+            problems.append('{0}: max difference {1:.3g}'.format(key, diff))
+    return problems
+
+
+def run_script(script, timeout=None, update=False, rtol=1e-5, atol=1e-3, keep=False,
+               bin_dir=None):
+    """Run one script in a scratch copy of its folder and check its heads.
+
+    bin_dir: folder with the MODFLOW executables, searched first by
+        mfexe.resolve() in the script (through MODFLOW_BIN)
+    """
+    name = script_name(script)
+    workspace = tempfile.mkdtemp(prefix='runall_' + name + '_')
+    src = os.path.dirname(script)
+    for fname in os.listdir(src):
+        path = os.path.join(src, fname)
+        if os.path.isfile(path):
+            shutil.copy(path, workspace)
+
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+    env['PYTHONPATH'] = tools_dir + os.pathsep + env.get('PYTHONPATH', '')
+    if bin_dir is not None:
+        env['MODFLOW_BIN'] = os.path.abspath(bin_dir) + os.pathsep + env.get('MODFLOW_BIN', '')
+    result = {'name': name, 'script': os.path.relpath(script, repo_dir),
+              'workspace': workspace}
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, os.path.basename(script)], cwd=workspace,
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              stdin=subprocess.DEVNULL, timeout=timeout)
+        result['status'] = 'ok' if proc.returncode == 0 else 'error'
+        result['output'] = proc.stdout.decode('utf-8', 'replace')[-2000:]
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+    result['wall'] = time.perf_counter() - t0
+
+    if result['status'] == 'ok':
+        heads = read_heads(workspace)
+        result['nheads'] = sum(len(h) for h in heads.values())
+        result['cells_per_second'] = sum(h.size for h in heads.values())/result['wall']
+        ref_file = os.path.join(reference_dir, name + '.npz')
+        if update:
+            if not os.path.isdir(reference_dir):
+                os.makedirs(reference_dir)
+            np.savez_compressed(ref_file, **{k.replace(os.sep, '/'): v for k, v in heads.items()})
+            result['status'] = 'updated'
+        elif os.path.isfile(ref_file):
+            with np.load(ref_file) as f:
+                reference = {k.replace('/', os.sep): f[k] for k in f.files}
+            result['problems'] = compare(heads, reference, rtol, atol)
+            if result['problems']:
+                result['status'] = 'different'
+        else:
+            result['status'] = 'no reference'
+    if not keep:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return result
+
+
+def run_all(scripts, nproc=None, **kwargs):
+    """Run scripts concurrently; returns the results in script order."""
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        futures = [pool.submit(run_script, s, **kwargs) for s in scripts]
+        return [f.result() for f in futures]
+
+
+def print_report(results, total_wall):
+    print('{0:<36} {1:>12} {2:>9} {3:>7} {4:>14}'.format(
+          'model', 'status', 'wall [s]', 'heads', 'cells/s'))
+    for r in results:
+        print('{0:<36} {1:>12} {2:>9.2f} {3:>7} {4:>14}'.format(
+              r['name'], r['status'], r['wall'], r.get('nheads', '-'),
+              '{0:.3g}'.format(r['cells_per_second']) if 'cells_per_second' in r else '-'))
+        for p in r.get('problems', []):
+            print('    ' + p)
+    print('{0} models in {1:.2f} s ({2:.2f} models/min)'.format(
+          len(results), total_wall, 60.*len(results)/total_wall if total_wall > 0 else 0.))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run all tutorial models and check their heads.')
+    parser.add_argument('--only', help='only run scripts whose path contains this text')
+    parser.add_argument('--nproc', type=int, default=None, help='models to run at once')
+    parser.add_argument('--timeout', type=float, default=600., help='seconds per model')
+    parser.add_argument('--update', action='store_true', help='save new reference heads')
+    parser.add_argument('--rtol', type=float, default=1e-5)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch folders')
+    parser.add_argument('--report', help='write the results to this JSON file')
+    parser.add_argument('--bin', help='folder with the MODFLOW executables to test')
+    args = parser.parse_args(args)
+
+    scripts = find_scripts(args.only)
+    t0 = time.perf_counter()
+    results = run_all(scripts, nproc=args.nproc, timeout=args.timeout, update=args.update,
+                      rtol=args.rtol, atol=args.atol, keep=args.keep, bin_dir=args.bin)
+    total_wall = time.perf_counter() - t0
+    print_report(results, total_wall)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'total_wall': total_wall, 'results': results}, f, indent=1)
+    ok = all(r['status'] in ('ok', 'updated') for r in results)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
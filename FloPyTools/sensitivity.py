@@ -0,0 +1,225 @@
+## sensitivity.py
+# Finite-difference sensitivities (a Jacobian) of chosen observations to
+# model parameters, with the perturbed runs done in parallel.
+#
+# For calibrating models like TwoStreamsWithWell.py, hk, vka, the river
+# conductance and the recharge rate are each scaled by (1 + delta) in
+# turn. The base model is run once; every perturbed model is then
+# written to its own folder (starting from the base heads if all stress
+# periods are steady, so the solver starts close to the answer), and
+# the perturbed runs are started together. A parameter whose
+# perturbation leaves every input file unchanged (e.g. vka in a
+# one-layer model) is not run and gets a zero column.
+#
+# J[m, p] = (y_m(p perturbed) - y_m(base)) / delta, i.e. the change of
+# observation m per unit relative change of parameter p.
+#
+# Example (after building 'mf' as in TwoStreamsWithWell.py):
+#   import sensitivity
+#   obs = sensitivity.observer(head_cells=[(0, 0, 10), (0, 0, 50)],
+#                              budget_cells=[(0, 0, 0), (0, 0, ncol-1)],
+#                              cbcfile=modelname+'.riv.out')
+#   J, y0, info = sensitivity.jacobian(mf, ['hk', 'vka', 'riv_cond'], obs)
+
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import solvertuner
+
+
+def scale_array(pkg, attr, factor):
+    # multiply a Util2d/Util3d package array
+    setattr(pkg, attr, getattr(pkg, attr).array*factor)
+
+
+def scale_list(pkg, column, factor):
+    # multiply one column of every stress period of a list package
+    data = {}
+    for kper, rec in pkg.stress_period_data.data.items():
+        if isinstance(rec, np.ndarray):
+            rec = rec.copy()
+            rec[column] = rec[column]*factor
+        data[kper] = rec
+    pkg.stress_period_data = data
+
+
+def scale_transient(pkg, attr, factor):
+    # multiply a Transient2d package array (e.g. RCH rech) in every period
+    arr = getattr(pkg, attr).array
+    setattr(pkg, attr, {kper: arr[kper, 0]*factor for kper in range(len(arr))})
+
+
+# name: (package names to look for, attribute, scaling function)
+parameters = {'hk': (['LPF', 'UPW'], 'hk', scale_array),
+              'vka': (['LPF', 'UPW'], 'vka', scale_array),
+              'sy': (['LPF', 'UPW'], 'sy', scale_array),
+              'ss': (['LPF', 'UPW'], 'ss', scale_array),
+              'riv_cond': (['RIV'], 'cond', scale_list),
+              'ghb_cond': (['GHB'], 'cond', scale_list),
+              'drn_cond': (['DRN'], 'cond', scale_list),
+              'rchrate': (['RCH'], 'rech', scale_transient)}
+
+
+def perturb(mf, name, factor):
+    """Scale parameter name of mf by factor; returns a function that undoes it."""
+    names, attr, scale = parameters[name]
+    pkg = next((mf.get_package(n) for n in names if mf.get_package(n) is not None), None)
+    if pkg is None:
+        raise ValueError('model has no {0} package for parameter {1}'.format('/'.join(names), name))
+    key = 'stress_period_data' if scale is scale_list else attr
+    orig = pkg.__dict__[key]
+    scale(pkg, attr, factor)
+
+    def undo():
+        pkg.__dict__[key] = orig
+    return undo
+
+
+def hash_inputs(model_ws):
+    # one hash over the contents of every file in model_ws
+    h = hashlib.sha1()
+    for fname in sorted(os.listdir(model_ws)):
+        path = os.path.join(model_ws, fname)
+        if os.path.isfile(path):
+            h.update(fname.encode())
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def observer(head_cells=(), budget_cells=(), cbcfile=None, text='RIVER LEAKAGE',
+             headfile=None):
+    """Function model_ws -> observation vector, for jacobian().
+
+    head_cells: (k, i, j) cells whose last saved head is observed
+    budget_cells: (k, i, j) cells whose last flow of budget term text is
+        observed (one value per cell), read from cbcfile
+    headfile: head file name (default: <namefile base>.hds)
+    """
+    head_cells = [tuple(c) for c in head_cells]
+    budget_cells = [tuple(c) for c in budget_cells]
+
+    def observe(model_ws, mf):
+        import cbcindex
+
+        y = []
+        if head_cells:
+            import flopy.utils.binaryfile as bf
+            fname = headfile or os.path.splitext(mf.namefile)[0] + '.hds'
+            hds = bf.HeadFile(os.path.join(model_ws, fname))
+            h = hds.get_data(idx=len(hds.get_times()) - 1)
+            hds.close()
+            y += [h[c] for c in head_cells]
+        if budget_cells:
+            index = cbcindex.CbcIndex(os.path.join(model_ws, cbcfile))
+            irecs = np.flatnonzero(index.records.text == text)
+            if len(irecs) == 0:
+                raise ValueError('no "{0}" records in {1}'.format(text, cbcfile))
+            irec = irecs[-1]
+            rec = index.records[irec]
+            shape = (int(rec.nlay), int(rec.nrow), int(rec.ncol))
+            nodes, values = index.read_record(irec)
+            flows = np.zeros(int(np.prod(shape)))
+            if nodes is None:
+                flows[:len(values)] = values
+            else:
+                np.add.at(flows, nodes, values)
+            flows = flows.reshape(shape)
+            y += [flows[c] for c in budget_cells]
+        return np.array(y, dtype=np.float64)
+    return observe
+
+
+def jacobian(mf, params, observe, delta=0.05, nproc=None, warm_start=True,
+             workspace=None, timeout=None):
+    """Finite-difference Jacobian of observations with respect to params.
+
+    mf: base FloPy Modflow model
+    params: names from the parameters dict (hk, vka, riv_cond, rchrate, ...)
+    observe: function(model_ws, mf) -> 1-D observation array (see observer())
+    delta: relative perturbation
+    nproc: perturbed runs at once (os.cpu_count() if None)
+    warm_start: start perturbed runs from the base heads (steady models only)
+    workspace: scratch folder (a temporary one is used and removed if None)
+
+    Returns (J, y0, info) with J of shape (nobs, nparams), y0 the base
+    observations and info a dict of per-parameter run summaries ('skipped'
+    if the input did not change).
+    """
+    orig_ws = mf.model_ws
+    tmp_ws = workspace is None
+    if tmp_ws:
+        workspace = tempfile.mkdtemp(prefix='sensitivity_')
+    lstfile = mf.lst.file_name[0]
+    steady = bool(np.all(mf.dis.steady.array))
+    info = {}
+    try:
+        base_ws = os.path.join(workspace, 'base')
+        mf.change_model_ws(base_ws)
+        base = solvertuner.run_trial(mf, timeout=timeout)
+        if base['status'] != 'ok':
+            raise Exception('base run did not finish: ' + base['status'])
+        info['base'] = base
+        y0 = observe(base_ws, mf)
+
+        undo_strt = None
+        if warm_start and steady:
+            import flopy.utils.binaryfile as bf
+            hds = bf.HeadFile(os.path.join(base_ws, os.path.splitext(mf.namefile)[0] + '.hds'))
+            h = hds.get_data(idx=len(hds.get_times()) - 1)
+            hds.close()
+            orig_strt = mf.bas6.__dict__['strt']
+            mf.bas6.strt = np.where(np.abs(h) < 1e29, h, mf.bas6.strt.array)
+
+            def undo_strt():
+                mf.bas6.__dict__['strt'] = orig_strt
+
+        # write every model first (FloPy is not thread safe), then run
+        try:
+            ref_ws = os.path.join(workspace, 'reference')
+            mf.change_model_ws(ref_ws)
+            mf.write_input()
+            ref_hash = hash_inputs(ref_ws)
+            to_run = []
+            for p in params:
+                ws = os.path.join(workspace, p)
+                mf.change_model_ws(ws)
+                undo = perturb(mf, p, 1. + delta)
+                try:
+                    mf.write_input()
+                finally:
+                    undo()
+                if hash_inputs(ws) == ref_hash:
+                    info[p] = {'status': 'skipped'}
+                else:
+                    to_run.append((p, ws))
+        finally:
+            if undo_strt is not None:
+                undo_strt()
+
+        if nproc is None:
+            nproc = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=nproc) as pool:
+            futures = [(p, ws, pool.submit(solvertuner.run_files, mf.exe_name, mf.namefile,
+                                           ws, lstfile, timeout)) for p, ws in to_run]
+            for p, ws, fut in futures:
+                info[p] = fut.result()
+
+        J = np.zeros((len(y0), len(params)))
+        for ip, (p, ws) in enumerate((p, os.path.join(workspace, p)) for p in params):
+            if info[p]['status'] == 'skipped':
+                continue
+            if info[p]['status'] != 'ok':
+                J[:, ip] = np.nan
+                continue
+            J[:, ip] = (observe(ws, mf) - y0)/delta
+    finally:
+        mf.change_model_ws(orig_ws)
+        if tmp_ws:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return J, y0, info
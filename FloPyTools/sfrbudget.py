@@ -0,0 +1,125 @@
+## sfrbudget.py
+# Read SFR reach flows straight from the binary cell-by-cell budget
+# file instead of the SFR text output.
+#
+# With ipakcb/ISTCB1 > 0 (e.g. ipakcb=53 in TiltedVwithSFR) the SFR
+# package writes a 'STREAM LEAKAGE' record for every saved time step,
+# one entry per reach in reach order; with ISTCB2 < 0 it also writes
+# 'STREAMFLOW OUT'. SfrBudget adds reach lookups to the record index
+# of cbcindex.py, so a time series for one reach is a single strided
+# read from a memory-mapped file and nothing is parsed from text.
+#
+# Example (TiltedVwithSFR-Transient.py):
+#   import sfrbudget
+#   cbc = sfrbudget.SfrBudget(modelname+'.cbc', reach_data=sfr.reach_data)
+#   ts = cbc.get_reach_ts(cbc.reach_index(segment=1, reach=19))
+#   plt.plot(ts['totim'], ts['Qaquifer'])
+
+import numpy as np
+
+import cbcindex
+
+leakage_text = 'STREAM LEAKAGE'
+flow_text = 'STREAMFLOW OUT'
+
+
+class SfrBudget(cbcindex.CbcIndex):
+    """SFR reach flows from a MODFLOW-2005/NWT binary budget file.
+
+    fname: budget file written with ISTCB1 (may also hold the budgets of
+        other packages)
+    precision: 'single', 'double' or 'auto'
+    reach_data: the SFR package's reach_data (optional), used to look up
+        reaches by segment/reach number and to find the cells of the
+        reaches when the budget was not saved in compact form
+
+    Values follow the MODFLOW budget sign convention (positive means
+    into the aquifer).
+    """
+
+    def __init__(self, fname, precision='auto', reach_data=None):
+        self.reach_data = reach_data
+        cbcindex.CbcIndex.__init__(self, fname, precision=precision)
+
+    def reach_index(self, segment, reach):
+        """Position of a reach in the SFR records (needs reach_data)."""
+        if self.reach_data is None:
+            raise ValueError('reach_data is needed to look up reaches by segment/reach')
+        rd = self.reach_data
+        idx = np.flatnonzero((rd['iseg'] == segment) & (rd['ireach'] == reach))
+        if len(idx) != 1:
+            raise ValueError('segment {0} reach {1} not found'.format(segment, reach))
+        return int(idx[0])
+
+    def entry_positions(self, recs, reaches):
+        # byte offset of the value of each reach in each record
+        reaches = np.atleast_1d(reaches)
+        rsize = self.realtype.itemsize
+        imeth = recs.imeth[0]
+        if imeth in (2, 5):
+            entry = 4 + recs.nval[0]*rsize
+            return recs.offset[:, None] + reaches[None, :]*entry + 4
+        if imeth in (0, 1):
+            # full arrays: look the value up by the cell of each reach
+            if self.reach_data is None:
+                raise ValueError('reach_data is needed for non-compact budget files')
+            rd = self.reach_data
+            nrow, ncol = recs.nrow[0], recs.ncol[0]
+            node = (rd['k'].astype(np.int64)*nrow*ncol + rd['i'].astype(np.int64)*ncol +
+                    rd['j'].astype(np.int64))[reaches]
+            return recs.offset[:, None] + node[None, :]*rsize
+        raise ValueError('IMETH={0} records are not SFR reach lists'.format(imeth))
+
+    def get_values(self, text, reaches):
+        """(ntimes, nreaches) array of a record's values for some reaches.
+
+        All values are gathered from the memory-mapped file in one
+        vectorized read.
+        """
+        recs = self.select(text)
+        pos = self.entry_positions(recs, reaches)
+        rsize = self.realtype.itemsize
+        raw = self.data[pos[..., None] + np.arange(rsize)]
+        return raw.reshape(-1).view(self.realtype).reshape(pos.shape).astype(np.float64)
+
+    def get_data(self, text=leakage_text):
+        """(ntimes, nlist) array with every entry of every record.
+
+        When the records are evenly spaced in the file (the usual case)
+        this is a strided view on the memory map, copied once.
+        """
+        recs = self.select(text)
+        rsize = self.realtype.itemsize
+        if recs.imeth[0] in (2, 5):
+            entry = 4 + recs.nval[0]*rsize
+            nlist = int(recs.nlist[0])
+            stride = np.diff(recs.offset)
+            if len(recs) == 1 or np.all(stride == stride[0]):
+                dtype = np.dtype({'names': ['q'], 'formats': [self.realtype],
+                                  'offsets': [4], 'itemsize': entry})
+                step = int(stride[0]) if len(recs) > 1 else nlist*entry
+                view = np.ndarray(shape=(len(recs), nlist), dtype=dtype,
+                                  buffer=self.data, offset=int(recs.offset[0]),
+                                  strides=(step, entry))
+                return view['q'].astype(np.float64)
+        return self.get_values(text, np.arange(recs.nlist[0]))
+
+    def get_times(self, text=leakage_text):
+        return cbcindex.CbcIndex.get_times(self, text)
+
+    def get_reach_ts(self, reaches):
+        """Qaquifer (and Qout, if saved) time series for reach position(s).
+
+        Returns a dict with 'totim' and 'Qaquifer' (and 'Qout') arrays of
+        shape (ntimes,) for a single reach, or (ntimes, nreaches).
+        """
+        single = np.ndim(reaches) == 0
+        ts = {'totim': self.get_times(leakage_text),
+              'Qaquifer': self.get_values(leakage_text, reaches)}
+        if flow_text in self.records.text:
+            ts['Qout'] = self.get_values(flow_text, reaches)
+        if single:
+            for key in ['Qaquifer', 'Qout']:
+                if key in ts:
+                    ts[key] = ts[key][:, 0]
+        return ts
@@ -0,0 +1,174 @@
+## sfrtext.py
+# Read the SFR text output file (the ISTCB2 file, e.g. 'model.sfr.out')
+# without loading the whole thing into a DataFrame.
+#
+# flopy.utils.sfroutputfile.SfrFile(...).get_dataframe() parses every
+# line of every time step, which does not fit in memory for big stream
+# networks with many time steps. SfrText scans the file once to find
+# where each time step's block starts and how long its (fixed format)
+# lines are, and then only parses the lines for the reaches and the
+# columns that are asked for.
+#
+# Example (TiltedVwithSFR-Transient.py):
+#   import sfrtext
+#   sfrout = sfrtext.SfrText('TiltedVwithSFR-Transient.sfr.out')
+#   outlet = sfrout.get_ts(segment=1, reach=19, columns=['Qout', 'Qaquifer'])
+#   plt.plot(outlet['Qout'])
+
+import mmap
+import re
+
+import numpy as np
+
+# column names, same as flopy's SfrFile
+names = ['layer', 'row', 'column', 'segment', 'reach', 'Qin', 'Qaquifer',
+         'Qout', 'Qovr', 'Qprecip', 'Qet', 'stage', 'depth', 'width', 'Cond',
+         'gradient', 'Qwt', 'delUzstor', 'gw_head']
+int_names = ['layer', 'row', 'column', 'segment', 'reach']
+
+re_header = re.compile(rb'STREAM LISTING\s+PERIOD\s+(\d+)\s+STEP\s+(\d+)')
+
+
+class SfrText(object):
+    """Indexed reader for an SFR text output file.
+
+    After construction:
+      kstpkper: (nsteps, 2) array of zero-based (kstp, kper) per block
+      segment, reach: arrays with the segment and reach of each line
+      names: column names present in the file
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.f = open(fname, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.build_index()
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def build_index(self):
+        # one pass over the file: for every time step block store the byte
+        # offset of its first data line, its number of lines and its line
+        # length (or the offset of every line if the lengths vary)
+        mm = self.mm
+        headers = list(re_header.finditer(mm))
+        if len(headers) == 0:
+            raise ValueError('no STREAM LISTING blocks in ' + self.fname)
+        nsteps = len(headers)
+        self.kstpkper = np.zeros((nsteps, 2), dtype=np.int32)
+        self.offset = np.zeros(nsteps, dtype=np.int64)
+        self.linelen = np.zeros(nsteps, dtype=np.int64)
+        self.ragged = {}
+        self.nreach = None
+        for i, h in enumerate(headers):
+            self.kstpkper[i] = int(h.group(2)) - 1, int(h.group(1)) - 1
+            # data starts on the line after the row of dashes
+            dashes = mm.find(b'---', h.end())
+            start = mm.find(b'\n', dashes) + 1
+            end = headers[i + 1].start() if i + 1 < nsteps else len(mm)
+            block = mm[start:end].rstrip()
+            buf = np.frombuffer(block, dtype=np.uint8)
+            nlines = int(np.count_nonzero(buf == 10)) + 1
+            if self.nreach is None:
+                self.nreach = nlines
+            elif nlines != self.nreach:
+                raise ValueError('time step {0} has {1} reaches, expected {2}'.format(
+                                 i, nlines, self.nreach))
+            length = block.find(b'\n') + 1 if nlines > 1 else len(block) + 1
+            if nlines == 1:
+                uniform = True
+            else:
+                ends = np.arange(1, nlines)*length - 1
+                uniform = (len(buf) <= nlines*length and ends[-1] < len(buf) and
+                           bool(np.all(buf[ends] == 10)))
+            self.offset[i] = start
+            self.linelen[i] = length
+            if not uniform:
+                # line lengths vary (e.g. numbers overflowing their format)
+                starts = np.concatenate([[0], np.flatnonzero(buf == 10) + 1])
+                ends = np.concatenate([starts[1:] - 1, [len(buf)]])
+                self.ragged[i] = (start + starts, ends - starts)
+
+        # columns and reach numbering from the first block
+        first = self.read_lines(0, np.arange(self.nreach))
+        ncol = len(first[0].split())
+        self.names = names[:ncol] if ncol <= len(names) else \
+            names + ['col{0}'.format(c) for c in range(len(names), ncol)]
+        seg_reach = np.array([l.split()[3:5] for l in first], dtype=np.int64)
+        self.segment = seg_reach[:, 0]
+        self.reach = seg_reach[:, 1]
+        self.nsteps = nsteps
+
+    def read_lines(self, istep, rows):
+        # raw bytes of the given line numbers in one time step block
+        if istep in self.ragged:
+            starts, lengths = self.ragged[istep]
+            return [self.mm[starts[r]:starts[r] + lengths[r]] for r in rows]
+        o = self.offset[istep]
+        length = self.linelen[istep]
+        return [self.mm[o + r*length:o + (r + 1)*length] for r in rows]
+
+    def get_rows(self, segment=None, reach=None):
+        # line numbers within a block for the given segment(s)/reach(es)
+        sel = np.ones(self.nreach, dtype=bool)
+        if segment is not None:
+            sel &= np.isin(self.segment, np.atleast_1d(segment))
+        if reach is not None:
+            sel &= np.isin(self.reach, np.atleast_1d(reach))
+        return np.flatnonzero(sel)
+
+    def parse(self, lines, columns):
+        # parse lines into a dict of typed arrays for the given columns
+        icols = [self.names.index(c) for c in columns]
+        values = np.array(b' '.join(lines).split(), dtype=np.float64)
+        values = values.reshape(len(lines), len(self.names))
+        data = {}
+        for c, icol in zip(columns, icols):
+            dtype = np.int32 if c in int_names else np.float64
+            data[c] = values[:, icol].astype(dtype)
+        return data
+
+    def iter_steps(self, rows=None, columns=None):
+        """Yield ((kstp, kper), data) per time step.
+
+        rows: line numbers from get_rows() (all reaches if None)
+        columns: column names (all columns if None)
+        data is a dict of 1D arrays, one value per selected reach.
+        """
+        if rows is None:
+            rows = np.arange(self.nreach)
+        if columns is None:
+            columns = self.names
+        for istep in range(self.nsteps):
+            lines = self.read_lines(istep, rows)
+            yield (int(self.kstpkper[istep, 0]), int(self.kstpkper[istep, 1])), self.parse(lines, columns)
+
+    def get_data(self, rows=None, columns=None, steps=None):
+        """Read the selected reaches and columns for the selected steps.
+
+        steps: indices into kstpkper (all steps if None)
+        Returns a dict of (nsteps, nrows) arrays.
+        """
+        if rows is None:
+            rows = np.arange(self.nreach)
+        if columns is None:
+            columns = self.names
+        if steps is None:
+            steps = range(self.nsteps)
+        lines = []
+        for istep in steps:
+            lines.extend(self.read_lines(istep, rows))
+        data = self.parse(lines, columns)
+        for c in columns:
+            data[c] = data[c].reshape(-1, len(rows))
+        return data
+
+    def get_ts(self, segment, reach, columns=None):
+        """Time series for one reach: dict of 1D arrays (one per step)."""
+        rows = self.get_rows(segment=segment, reach=reach)
+        if len(rows) != 1:
+            raise ValueError('segment {0} reach {1} not found'.format(segment, reach))
+        data = self.get_data(rows=rows, columns=columns)
+        return {c: v[:, 0] for c, v in data.items()}
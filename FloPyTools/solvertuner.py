@@ -0,0 +1,187 @@
+## solvertuner.py
+# Try a set of NWT or PCG solver settings on a model that has already
+# been built with FloPy and pick the fastest one that still converges
+# with an acceptable mass balance. All of the tutorial scripts use
+# ModflowNwt(mf) or ModflowPcg(mf) with the default settings, which
+# can be very slow for steep, thin unconfined layers.
+#
+# Each trial writes the model into a scratch directory, runs it, and
+# reads iterations, run time and percent discrepancy from the listing
+# file. Trials that take longer than time_factor times the best run so
+# far are killed, so bad settings only cost a short trial.
+#
+# Example (after building 'mf' as in SquareWithWell-SteadyState.py):
+#   import solvertuner
+#   best, trials = solvertuner.tune_solver(mf, apply=True)
+#   solvertuner.print_trials(trials)
+#   mf.write_input()
+
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import flopy
+
+import listfile
+
+# default search spaces; every combination of the values is tried
+nwt_space = {'options': ['SIMPLE', 'MODERATE', 'COMPLEX', 'SPECIFIED'],
+             'linmeth': [1, 2],
+             'headtol': [1e-2, 1e-3],
+             'backflag': [0, 1]}
+pcg_space = {'mxiter': [50, 200],
+             'iter1': [30, 100],
+             'relax': [0.97, 1.0],
+             'damp': [1.0, 0.7]}
+
+
+def expand_space(space):
+    """Turn a dict of lists into a list of option dicts (all combinations)."""
+    keys = sorted(space)
+    combos = []
+    for values in itertools.product(*[space[k] for k in keys]):
+        opts = dict(zip(keys, values))
+        # NWT only reads the backtracking settings when options='SPECIFIED',
+        # so the other option sets would just be repeated
+        if opts.get('options', 'SPECIFIED') != 'SPECIFIED' and opts.get('backflag', 0) != 0:
+            continue
+        combos.append(opts)
+    return combos
+
+
+def get_solver(mf):
+    # name of the solver package used by the model
+    for name in ['NWT', 'PCG']:
+        if mf.get_package(name) is not None:
+            return name
+    raise ValueError('model has no NWT or PCG package to tune')
+
+
+def set_solver(mf, solver, opts):
+    # replace the solver package with one built from opts
+    mf.remove_package(solver)
+    if solver == 'NWT':
+        return flopy.modflow.ModflowNwt(mf, **opts)
+    return flopy.modflow.ModflowPcg(mf, **opts)
+
+
+def run_trial(mf, timeout=None):
+    """Write and run mf in its current model_ws, return listing summary.
+
+    The run is killed after timeout seconds. The returned dict is the one
+    from listfile.read_listing() plus 'wall' (seconds) and 'status',
+    which is one of 'ok', 'timeout', 'failed' or 'error'.
+    """
+    mf.write_input()
+    return run_files(mf.exe_name, mf.namefile, mf.model_ws, mf.lst.file_name[0],
+                     timeout=timeout)
+
+
+def run_files(exe_name, namefile, model_ws, lstfile, timeout=None):
+    """Run already written input files, return listing summary as run_trial()."""
+    exe = shutil.which(exe_name) or exe_name
+    t0 = time.perf_counter()
+    try:
+        subprocess.run([exe, namefile], cwd=model_ws,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       stdin=subprocess.DEVNULL, timeout=timeout)
+        status = 'ok'
+    except subprocess.TimeoutExpired:
+        status = 'timeout'
+    wall = time.perf_counter() - t0
+
+    fname = os.path.join(model_ws, lstfile)
+    if os.path.isfile(fname):
+        info = listfile.read_listing(fname)
+    else:
+        info = {'iterations': None, 'max_discrepancy': None,
+                'converged': False, 'normal_termination': False}
+    if status == 'ok' and not info['normal_termination']:
+        status = 'error'
+    elif status == 'ok' and not info['converged']:
+        status = 'failed'
+    info['wall'] = wall
+    info['status'] = status
+    return info
+
+
+def tune_solver(mf, search_space=None, max_discrepancy=1.0, time_factor=3.,
+                workspace=None, apply=False, verbose=True):
+    """Run trial solves over a search space of solver settings.
+
+    mf: a FloPy Modflow object with an NWT or PCG package
+    search_space: dict of lists of ModflowNwt/ModflowPcg arguments
+        (defaults to nwt_space or pcg_space)
+    max_discrepancy: largest acceptable percent discrepancy (absolute)
+    time_factor: kill a trial once it runs this many times longer than
+        the fastest acceptable trial so far
+    workspace: scratch directory for the trials (a temporary directory
+        is used and removed if None)
+    apply: if True, the best settings are left on mf
+
+    Returns (best, trials) where best is the option dict of the fastest
+    acceptable trial (None if no trial was acceptable) and trials is a
+    list of dicts with the options and listing summary of every trial.
+    """
+    solver = get_solver(mf)
+    if search_space is None:
+        search_space = nwt_space if solver == 'NWT' else pcg_space
+    combos = expand_space(search_space)
+
+    orig_pkg = mf.get_package(solver)
+    orig_ws = mf.model_ws
+    tmp_ws = workspace is None
+    if tmp_ws:
+        workspace = tempfile.mkdtemp(prefix='solvertuner_')
+    mf.change_model_ws(workspace)
+
+    best = None
+    best_wall = None
+    trials = []
+    try:
+        for itrial, opts in enumerate(combos):
+            trial_opts = dict(opts)
+            if solver == 'NWT':
+                # needed to get outer/inner iteration counts in the listing
+                trial_opts.setdefault('iprnwt', 1)
+            set_solver(mf, solver, trial_opts)
+            timeout = None if best_wall is None else time_factor*best_wall
+            info = run_trial(mf, timeout=timeout)
+
+            ok = (info['status'] == 'ok' and
+                  info['max_discrepancy'] <= max_discrepancy)
+            info['acceptable'] = ok
+            info['options'] = opts
+            trials.append(info)
+            if ok and (best_wall is None or info['wall'] < best_wall):
+                best = opts
+                best_wall = info['wall']
+            if verbose:
+                print('trial {0}/{1} {2}: {3}, {4:.2f} s, {5} iterations'.format(
+                      itrial + 1, len(combos), opts, info['status'],
+                      info['wall'], info['iterations']))
+    finally:
+        # put the model back the way we found it
+        mf.remove_package(solver)
+        mf.add_package(orig_pkg)
+        mf.change_model_ws(orig_ws)
+        if tmp_ws:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if apply and best is not None:
+        set_solver(mf, solver, best)
+    return best, trials
+
+
+def print_trials(trials):
+    # table of trials, fastest acceptable first
+    order = sorted(trials, key=lambda t: (not t['acceptable'], t['wall']))
+    print('{0:>8} {1:>10} {2:>12} {3:>9}  {4}'.format(
+          'wall [s]', 'iterations', 'discrepancy', 'status', 'options'))
+    for t in order:
+        print('{0:8.2f} {1:>10} {2:>12} {3:>9}  {4}'.format(
+              t['wall'], str(t['iterations']), str(t['max_discrepancy']),
+              t['status'], t['options']))
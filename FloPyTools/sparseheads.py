@@ -0,0 +1,126 @@
+## sparseheads.py
+# Store heads (or drawdown) for active cells only.
+#
+# In models with large inactive or dry regions (see TiltedVwithSFR/
+# head.csv, which is mostly nan) a dense (nlay, nrow, ncol) float array
+# per time step is mostly wasted. SparseHeads keeps an index of the
+# active cells, taken from ibound, and one float32 vector per time step,
+# and only builds a dense array when one is asked for. Results can be
+# saved to and loaded from a compressed .npz file.
+#
+# Example (after running SquareWithWell-Transient.py):
+#   import sparseheads
+#   sh = sparseheads.from_headfile(modelname+'.hds', ibound)
+#   sh.save(modelname+'-heads.npz')
+#   sh = sparseheads.SparseHeads.load(modelname+'-heads.npz')
+#   head = sh.get_data(totim=sh.times[-1])  # dense, nan where inactive
+
+import numpy as np
+
+
+class SparseHeads(object):
+    """Active-cell storage of head-like results.
+
+    shape: (nlay, nrow, ncol) of the model grid
+    active: zero-based flat indices of the stored cells
+    times: (ntimes,) array of totim
+    values: (ntimes, nactive) array (float32 by default)
+    kstpkper: (ntimes, 2) array of zero-based (kstp, kper)
+
+    Dry (hdry) and no-flow (hnoflo) values in active cells are stored as
+    nan.
+    """
+
+    def __init__(self, shape, active, times, values, kstpkper=None):
+        self.shape = tuple(int(n) for n in shape)
+        self.active = np.asarray(active, dtype=np.int64)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.values = values
+        if kstpkper is None:
+            kstpkper = np.zeros((len(self.times), 2), dtype=np.int32)
+        self.kstpkper = np.asarray(kstpkper, dtype=np.int32)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.active.nbytes
+
+    def expand(self, values, fill=np.nan):
+        # dense array(s) from active-cell vector(s)
+        values = np.asarray(values)
+        lead = values.shape[:-1]
+        ncell = int(np.prod(self.shape))
+        dense = np.full(lead + (ncell,), fill, dtype=values.dtype)
+        dense[..., self.active] = values
+        return dense.reshape(lead + self.shape)
+
+    def get_times(self):
+        return list(self.times)
+
+    def get_data(self, totim=None, idx=None, fill=np.nan):
+        """Dense (nlay, nrow, ncol) array for one time (last if None)."""
+        if idx is None:
+            idx = -1 if totim is None else int(np.flatnonzero(np.isclose(self.times, totim))[0])
+        return self.expand(self.values[idx], fill=fill)
+
+    def get_alldata(self, fill=np.nan):
+        return self.expand(self.values, fill=fill)
+
+    def get_ts(self, idx):
+        """(ntimes, 2) array of time and value for cell (k, i, j)."""
+        node = np.ravel_multi_index(idx, self.shape)
+        pos = np.searchsorted(self.active, node)
+        if pos >= len(self.active) or self.active[pos] != node:
+            raise ValueError('cell {0} is not active'.format(idx))
+        return np.column_stack([self.times, self.values[:, pos]])
+
+    def save(self, fname):
+        """Write to a compressed .npz file."""
+        np.savez_compressed(fname, shape=np.array(self.shape), active=self.active,
+                            times=self.times, values=self.values,
+                            kstpkper=self.kstpkper)
+
+    @classmethod
+    def load(cls, fname):
+        with np.load(fname) as f:
+            return cls(f['shape'], f['active'], f['times'], f['values'], f['kstpkper'])
+
+
+def active_cells(ibound):
+    # sorted flat indices of cells with ibound != 0
+    return np.flatnonzero(np.asarray(ibound).ravel() != 0)
+
+
+def compress(heads, active, dtype=np.float32, inactive_value=1e29):
+    """Active-cell values from dense array(s) (..., nlay, nrow, ncol)."""
+    heads = np.asarray(heads)
+    nlead = heads.ndim - 3
+    flat = heads.reshape(heads.shape[:nlead] + (-1,))[..., active].astype(dtype)
+    flat[np.abs(flat) > inactive_value] = np.nan
+    return flat
+
+
+def from_headfile(fname, ibound, text='head', dtype=np.float32, precision='auto'):
+    """Read a binary head (or drawdown) file into a SparseHeads.
+
+    Each time step is read and compressed in turn, so the dense array
+    for all times is never held in memory.
+    """
+    import flopy.utils.binaryfile as bf
+
+    ibound = np.asarray(ibound)
+    active = active_cells(ibound)
+    hds = bf.HeadFile(fname, text=text, precision=precision)
+    kstpkper = hds.get_kstpkper()
+    times = hds.get_times()
+    values = np.empty((len(times), len(active)), dtype=dtype)
+    for it, kk in enumerate(kstpkper):
+        values[it] = compress(hds.get_data(kstpkper=kk), active, dtype=dtype)
+    hds.close()
+    return SparseHeads(ibound.shape, active, times, values, kstpkper)
+
+
+def from_arrays(heads, ibound, times, dtype=np.float32):
+    """SparseHeads from dense arrays of shape (ntimes, nlay, nrow, ncol)."""
+    ibound = np.asarray(ibound)
+    active = active_cells(ibound)
+    return SparseHeads(ibound.shape, active, times, compress(heads, active, dtype=dtype))
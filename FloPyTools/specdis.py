@@ -0,0 +1,134 @@
+## specdis.py
+# Cell-centred specific discharge (qx, qy, qz) for every saved time
+# step, computed as whole-array operations.
+#
+# GitHub-Tutorial2.py calls cbb.get_data() twice per time and then
+# plot_discharge() recomputes the cell-centred flows every call. Here
+# the FLOW RIGHT FACE, FLOW FRONT FACE and FLOW LOWER FACE records for
+# all times are read in one pass over a memory-mapped budget file
+# (using the record index from cbcindex.py) and converted with one
+# vectorized operation over a (ntimes, nlay, nrow, ncol) array.
+#
+# Example (after running GitHub-Tutorial2.py):
+#   import specdis
+#   times, qx, qy, qz = specdis.specific_discharge('tutorial2.cbc', mf.dis,
+#                                                  headfile='tutorial2.hds')
+#   # qx[it, k, i, j] is the x-component at time times[it]
+
+import numpy as np
+
+import cbcindex
+
+face_texts = ['FLOW RIGHT FACE', 'FLOW FRONT FACE', 'FLOW LOWER FACE']
+
+
+def read_full_records(index, text, dtype=np.float32):
+    """(ntimes, nlay, nrow, ncol) array of a full-grid budget record.
+
+    index: a cbcindex.CbcIndex for the budget file
+    The records are read through a strided view on the memory map when
+    they are evenly spaced, so this is a single copy from the file.
+    """
+    recs = index.select(text)
+    if recs.imeth[0] not in (0, 1):
+        raise ValueError('"{0}" is not saved as full arrays'.format(text))
+    shape = (int(recs.nlay[0]), int(recs.nrow[0]), int(recs.ncol[0]))
+    ncell = shape[0]*shape[1]*shape[2]
+    realtype = index.realtype
+    stride = np.diff(recs.offset)
+    if len(recs) == 1 or np.all(stride == stride[0]):
+        step = int(stride[0]) if len(recs) > 1 else ncell*realtype.itemsize
+        view = np.ndarray(shape=(len(recs), ncell), dtype=realtype,
+                          buffer=index.data, offset=int(recs.offset[0]),
+                          strides=(step, realtype.itemsize))
+        out = view.astype(dtype)
+    else:
+        out = np.empty((len(recs), ncell), dtype=dtype)
+        for i, o in enumerate(recs.offset):
+            out[i] = index.data[o:o + ncell*realtype.itemsize].view(realtype)
+    return out.reshape((len(recs),) + shape)
+
+
+def face_to_center(frf=None, fff=None, flf=None):
+    """Average face flows to cell centres for arrays of shape (..., nlay, nrow, ncol).
+
+    Returns volumetric flows (qx to the right, qy up the page i.e. towards
+    row 0, qz upwards); missing faces give zeros.
+    """
+    ref = next(a for a in [frf, fff, flf] if a is not None)
+    qx = np.zeros_like(ref)
+    qy = np.zeros_like(ref)
+    qz = np.zeros_like(ref)
+    if frf is not None:
+        qx[..., 1:] = 0.5*(frf[..., :-1] + frf[..., 1:])
+        qx[..., 0] = 0.5*frf[..., 0]
+    if fff is not None:
+        # front face flow is towards increasing row number (down the page)
+        qy[..., 1:, :] = -0.5*(fff[..., :-1, :] + fff[..., 1:, :])
+        qy[..., 0, :] = -0.5*fff[..., 0, :]
+    if flf is not None:
+        # lower face flow is downwards
+        qz[..., 1:, :, :] = -0.5*(flf[..., :-1, :, :] + flf[..., 1:, :, :])
+        qz[..., 0, :, :] = -0.5*flf[..., 0, :, :]
+    return qx, qy, qz
+
+
+def saturated_thickness(dis, heads=None, laytyp=None):
+    # cell thickness, limited by the water table in convertible layers
+    top = np.asarray(dis.top.array, dtype=np.float64)
+    botm = np.asarray(dis.botm.array, dtype=np.float64)
+    tops = np.concatenate([top[None, :, :], botm[:-1]])
+    thick = tops - botm
+    if heads is None:
+        return thick
+    if laytyp is None:
+        laytyp = np.ones(dis.nlay, dtype=int)
+    convertible = (np.asarray(laytyp) != 0)[:, None, None]
+    h = np.where(np.abs(heads) > 1e29, botm, heads)
+    wet = np.clip(np.minimum(h, tops) - botm, 0., None)
+    return np.where(convertible, wet, thick)
+
+
+def specific_discharge(cbcfile, dis, headfile=None, laytyp=None,
+                       dtype=np.float32, precision='auto'):
+    """Specific discharge for every saved time step.
+
+    cbcfile: budget file with FLOW RIGHT/FRONT/LOWER FACE records
+    dis: the model's ModflowDis package
+    headfile: head file for the saturated thickness of convertible layers
+        (laytyp != 0); full cell thickness is used if None
+    laytyp: layer types (all convertible if None and headfile is given)
+    dtype: output type, float32 halves the memory of float64
+
+    Returns (times, qx, qy, qz), with q arrays of shape
+    (ntimes, nlay, nrow, ncol) in length/time. times are NaN for budget
+    files saved without compact=True.
+    """
+    index = cbcindex.CbcIndex(cbcfile, precision=precision)
+    texts = index.get_textlist()
+    faces = [read_full_records(index, t, dtype) if t in texts else None
+             for t in face_texts]
+    ref_text = next(t for t in face_texts if t in texts)
+    times = index.get_times(ref_text)
+    qx, qy, qz = face_to_center(*faces)
+
+    delr = np.asarray(dis.delr.array, dtype=dtype)
+    delc = np.asarray(dis.delc.array, dtype=dtype)
+    if headfile is not None:
+        import flopy.utils.binaryfile as bf
+        hds = bf.HeadFile(headfile)
+        heads = hds.get_alldata()
+        hds.close()
+        if len(heads) != len(times):
+            raise ValueError('head and budget files have different numbers of saved steps')
+        thick = saturated_thickness(dis, heads, laytyp).astype(dtype)
+    else:
+        thick = saturated_thickness(dis).astype(dtype)[None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qx /= delc[:, None]*thick
+        qy /= delr[None, :]*thick
+        qz /= (delc[:, None]*delr[None, :])
+    for q in [qx, qy]:
+        q[~np.isfinite(q)] = 0.
+    return times, qx, qy, qz
@@ -0,0 +1,232 @@
+## steadyflow.py
+# Solve small confined steady-state models in this process with SciPy,
+# without writing input files or starting the MODFLOW executable.
+#
+# For models like GitHub-Tutorial1.py (10 x 10, one confined layer,
+# constant-head edges) most of the time of mf.run_model() goes into
+# writing files and starting mf2005, not into the solve. SteadyFlow
+# assembles the same block-centred finite-difference equations MODFLOW
+# uses, from the DIS, BAS6, LPF/UPW, WEL and GHB package data, into a
+# SciPy sparse matrix, and solves it directly (the factorization is
+# kept, so re-solving with other well rates is cheap) or with
+# ILU-preconditioned conjugate gradients.
+#
+# Only confined layers (laytyp = 0) without confining beds are handled;
+# any other stress package raises a ValueError rather than being
+# silently ignored.
+#
+# Example (after building 'mf' as in GitHub-Tutorial1.py, no write_input):
+#   import steadyflow
+#   sf = steadyflow.SteadyFlow(mf)
+#   head = sf.solve()                  # like HeadFile.get_data()
+#   frf = sf.flows()['FLOW RIGHT FACE']  # like CellBudgetFile.get_data()[0]
+
+import numpy as np
+
+# packages that do not change the steady-state confined solution
+ignored_packages = ['DIS', 'BAS6', 'LPF', 'UPW', 'OC', 'PCG', 'NWT', 'SIP',
+                    'SOR', 'DE4', 'GMG', 'PCGN', 'WEL', 'GHB', 'LIST']
+
+
+def harmonic_conductance(t1, t2, l1, l2, width):
+    # MODFLOW inter-cell conductance from transmissivities t and cell
+    # lengths l along the flow direction
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = 2.*width*t1*t2/(t1*l2 + t2*l1)
+    return np.where((t1 > 0.) & (t2 > 0.), c, 0.)
+
+
+class SteadyFlow(object):
+    """Steady-state confined flow solution of a FloPy Modflow model.
+
+    mf: model with DIS, BAS6, LPF (or UPW), and optionally WEL and GHB
+    kper: stress period whose WEL/GHB data are used
+    """
+
+    def __init__(self, mf, kper=0):
+        names = [n for p in mf.packagelist for n in p.name]
+        other = [n for n in names if n.upper() not in ignored_packages]
+        if other:
+            raise ValueError('steadyflow cannot handle package(s) ' + ', '.join(other))
+        dis = mf.dis
+        bas = mf.bas6
+        flow = mf.get_package('LPF')
+        if flow is None:
+            flow = mf.get_package('UPW')
+        if flow is None:
+            raise ValueError('model has no LPF or UPW package')
+        if np.any(np.asarray(flow.laytyp.array) != 0):
+            raise ValueError('steadyflow only handles confined layers (laytyp = 0)')
+        if np.any(np.asarray(dis.laycbd.array) != 0):
+            raise ValueError('steadyflow does not handle confining beds (laycbd != 0)')
+
+        self.shape = (dis.nlay, dis.nrow, dis.ncol)
+        self.delr = np.asarray(dis.delr.array, dtype=np.float64)
+        self.delc = np.asarray(dis.delc.array, dtype=np.float64)
+        top = np.asarray(dis.top.array, dtype=np.float64)
+        botm = np.asarray(dis.botm.array, dtype=np.float64).reshape(self.shape)
+        self.thick = np.concatenate([top[None], botm[:-1]]) - botm
+        self.ibound = np.asarray(bas.ibound.array).reshape(self.shape)
+        self.strt = np.asarray(bas.strt.array, dtype=np.float64).reshape(self.shape)
+        self.hnoflo = getattr(bas, 'hnoflo', -999.99)
+
+        hk = np.asarray(flow.hk.array, dtype=np.float64).reshape(self.shape)
+        chani = np.broadcast_to(np.asarray(flow.chani.array, dtype=np.float64), (self.shape[0],))
+        hani = np.asarray(flow.hani.array, dtype=np.float64).reshape(self.shape)
+        ky = np.where((chani > 0.)[:, None, None], hk*chani[:, None, None], hk*hani)
+        vka = np.asarray(flow.vka.array, dtype=np.float64).reshape(self.shape)
+        layvka = np.broadcast_to(np.asarray(flow.layvka.array), (self.shape[0],))
+        with np.errstate(divide='ignore'):
+            kv = np.where((layvka != 0)[:, None, None], hk/vka, vka)
+        self.hk, self.ky, self.kv = hk, ky, kv
+
+        self.wel = self.stress_list(mf.get_package('WEL'), kper)
+        self.ghb = self.stress_list(mf.get_package('GHB'), kper)
+        self.assemble()
+
+    @staticmethod
+    def stress_list(pkg, kper):
+        # recarray of the package's list data for kper (flopy repeats the
+        # last period given), or None
+        if pkg is None:
+            return None
+        data = pkg.stress_period_data.data
+        keys = [k for k in sorted(data) if k <= kper]
+        if not keys or not isinstance(data[keys[-1]], np.ndarray):
+            return None
+        return data[keys[-1]]
+
+    def conductances(self):
+        """CR, CC, CV arrays (nlay, nrow, ncol) for the right, front and lower faces."""
+        nlay, nrow, ncol = self.shape
+        active = self.ibound != 0
+        tx = np.where(active, self.hk*self.thick, 0.)
+        ty = np.where(active, self.ky*self.thick, 0.)
+        cr = np.zeros(self.shape)
+        cc = np.zeros(self.shape)
+        cv = np.zeros(self.shape)
+        delr, delc = self.delr, self.delc
+        cr[:, :, :-1] = harmonic_conductance(tx[:, :, :-1], tx[:, :, 1:], delr[:-1],
+                                             delr[1:], delc[:, None])
+        cc[:, :-1, :] = harmonic_conductance(ty[:, :-1, :], ty[:, 1:, :], delc[:-1, None],
+                                             delc[1:, None], delr[None, :])
+        if nlay > 1:
+            area = delc[:, None]*delr[None, :]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res = 0.5*self.thick/self.kv
+                both = active[:-1] & active[1:]
+                cv[:-1] = np.where(both, area/np.where(both, res[:-1] + res[1:], 1.), 0.)
+        return cr, cc, cv
+
+    def assemble(self):
+        """Build the sparse system A h = b for the variable-head cells."""
+        from scipy import sparse
+
+        ncell = int(np.prod(self.shape))
+        self.cr, self.cc, self.cv = self.conductances()
+        node = np.arange(ncell).reshape(self.shape)
+        rows, cols, vals = [], [], []
+        for c, a, b in [(self.cr, node[:, :, :-1], node[:, :, 1:]),
+                        (self.cc, node[:, :-1, :], node[:, 1:, :]),
+                        (self.cv, node[:-1], node[1:])]:
+            cab = c[tuple(slice(0, n) for n in a.shape)].ravel()
+            a, b = a.ravel(), b.ravel()
+            sel = cab > 0.
+            rows += [a[sel], b[sel]]
+            cols += [b[sel], a[sel]]
+            vals += [cab[sel], cab[sel]]
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+        # full matrix of sum_n C (h_n - h) over all cells
+        full = sparse.coo_matrix((vals, (rows, cols)), shape=(ncell, ncell)).tocsr()
+        diag = -np.asarray(full.sum(axis=1)).ravel()
+        rhs = np.zeros(ncell)
+        if self.ghb is not None:
+            gnode = np.ravel_multi_index((self.ghb['k'], self.ghb['i'], self.ghb['j']), self.shape)
+            np.add.at(diag, gnode, -self.ghb['cond'])
+            np.add.at(rhs, gnode, -self.ghb['cond']*self.ghb['bhead'])
+        self.q_wel = np.zeros(ncell)
+        if self.wel is not None:
+            wnode = np.ravel_multi_index((self.wel['k'], self.wel['i'], self.wel['j']), self.shape)
+            np.add.at(self.q_wel, wnode, self.wel['flux'])
+
+        ib = self.ibound.ravel()
+        self.var = np.flatnonzero(ib > 0)
+        self.chd = np.flatnonzero(ib < 0)
+        full = full + sparse.diags(diag)
+        self.A = full[self.var][:, self.var].tocsc()
+        self.A_chd = full[self.var][:, self.chd]
+        self.rhs_ghb = rhs
+        self.factor = None
+
+    def solve(self, q_wel=None, method='direct', tol=1e-10):
+        """Heads (nlay, nrow, ncol), hnoflo in inactive cells.
+
+        q_wel: optional (nlay, nrow, ncol) array of well rates replacing
+            the WEL data (the matrix is not rebuilt)
+        method: 'direct' (sparse LU, kept for later solves) or 'cg'
+            (conjugate gradients with an incomplete-LU preconditioner)
+        """
+        from scipy.sparse import linalg
+
+        q = self.q_wel if q_wel is None else np.asarray(q_wel, dtype=np.float64).ravel()
+        h = np.where(self.ibound.ravel() != 0, self.strt.ravel(), self.hnoflo)
+        b = (self.rhs_ghb - q)[self.var] - self.A_chd.dot(h[self.chd])
+        if method == 'direct':
+            if self.factor is None:
+                self.factor = linalg.factorized(self.A)
+            h[self.var] = self.factor(b)
+        elif method == 'cg':
+            # A is negative definite, so solve -A h = -b
+            ilu = linalg.spilu(-self.A)
+            M = linalg.LinearOperator(self.A.shape, ilu.solve)
+            x, info = linalg.cg(-self.A, -b, x0=h[self.var], rtol=tol, M=M)
+            if info != 0:
+                raise Exception('conjugate gradients did not converge')
+            h[self.var] = x
+        else:
+            raise ValueError('unknown method ' + repr(method))
+        self.head = h.reshape(self.shape)
+        self.q_used = q
+        return self.head
+
+    def flows(self):
+        """Cell-by-cell flows of the last solve as full (nlay, nrow, ncol) arrays.
+
+        Keys and signs follow the budget file: 'FLOW RIGHT FACE', 'FLOW
+        FRONT FACE', 'FLOW LOWER FACE' (positive towards increasing
+        column/row/layer), 'CONSTANT HEAD', 'WELLS' and 'HEAD DEP BOUNDS'
+        (positive into the aquifer).
+        """
+        h = self.head
+        frf = np.zeros(self.shape)
+        fff = np.zeros(self.shape)
+        flf = np.zeros(self.shape)
+        frf[:, :, :-1] = self.cr[:, :, :-1]*(h[:, :, :-1] - h[:, :, 1:])
+        fff[:, :-1, :] = self.cc[:, :-1, :]*(h[:, :-1, :] - h[:, 1:, :])
+        flf[:-1] = self.cv[:-1]*(h[:-1] - h[1:])
+        # constant head: flow out of each CH cell to non-CH neighbours
+        chd = self.ibound < 0
+        ch = np.zeros(self.shape)
+        for f, axis in [(frf, 2), (fff, 1), (flf, 0)]:
+            lo = [slice(None)]*3
+            hi = [slice(None)]*3
+            lo[axis] = slice(0, -1)
+            hi[axis] = slice(1, None)
+            lo, hi = tuple(lo), tuple(hi)
+            q = f[lo]
+            ch[lo] += np.where(chd[lo] & ~chd[hi], q, 0.)
+            ch[hi] -= np.where(chd[hi] & ~chd[lo], q, 0.)
+        out = {'FLOW RIGHT FACE': frf, 'FLOW FRONT FACE': fff,
+               'FLOW LOWER FACE': flf, 'CONSTANT HEAD': ch}
+        if self.wel is not None or np.any(self.q_used):
+            out['WELLS'] = np.where(self.ibound > 0, self.q_used.reshape(self.shape), 0.)
+        if self.ghb is not None:
+            ghb = np.zeros(self.shape)
+            kij = (self.ghb['k'], self.ghb['i'], self.ghb['j'])
+            active = self.ibound[kij] > 0
+            np.add.at(ghb, tuple(a[active] for a in kij),
+                      (self.ghb['cond']*(self.ghb['bhead'] - h[kij]))[active])
+            out['HEAD DEP BOUNDS'] = ghb
+        return out
@@ -0,0 +1,243 @@
+## telegrid.py
+# Variable delr/delc grids that are fine near wells, streams and
+# boundaries and grow geometrically away from them.
+#
+# SquareWithWell-SteadyState.py uses a uniform 50 x 100 grid only to
+# resolve the cone of depression at the well. With a telescoping grid
+# the cells at the well (and along other features) are dmin wide, and
+# each cell moving away is at most mult times the size of its
+# neighbour, up to dmax. Features sit at cell centres. Arrays (ibound,
+# strt, hk, ...) and WEL/RIV/GHB cell lists made for a uniform grid can
+# be moved onto the new grid.
+#
+# Example (SquareWithWell-SteadyState.py, well at x = y = 500 m):
+#   import telegrid
+#   g = telegrid.telescoping_grid(Lx, Ly, points=[(500., 500.)],
+#                                 dmin=2., dmax=50., mult=1.3)
+#   dis = flopy.modflow.ModflowDis(mf, nlay, g['nrow'], g['ncol'],
+#                                  delr=g['delr'], delc=g['delc'], ...)
+#   ibound = telegrid.remap_array(ibound, old, g)   # old = telegrid.uniform_grid(Lx, Ly, nrow, ncol)
+#   wel_sp1 = telegrid.remap_cells(wel_sp1, old, g)
+#
+# benchmark() compares the head error at a few distances from a well on
+# uniform and telescoping grids of increasing size (see steadyflow.py).
+
+import numpy as np
+
+
+def gap_sizes(length, s_left, s_right, dmax, mult):
+    # cells filling a gap, growing by at most mult from each end
+    if length <= 0.:
+        return np.zeros(0)
+    sizes = []
+    x = 0.
+    while x < length*(1. - 1e-9):
+        # growth limits from the left end and from the right end
+        s = min(dmax, s_left + (mult - 1.)*x, (s_right + (mult - 1.)*(length - x))/mult)
+        s = max(s, min(s_left, s_right, dmax))
+        sizes.append(s)
+        x += s
+    sizes = np.array(sizes)
+    # drop a small last piece into the others, then stretch to fit
+    if len(sizes) > 1 and x - length > 0.5*sizes[-1]:
+        sizes = sizes[:-1]
+    return sizes*length/sizes.sum()
+
+
+def axis_spacing(length, centers=(), dmin=1., dmax=None, mult=1.5, fine_edges=False):
+    """Cell widths along one axis.
+
+    length: axis length
+    centers: coordinates (0..length) that should be at the centre of a
+        cell dmin wide
+    dmax: largest cell width (length/10 if None)
+    mult: largest ratio between neighbouring cells
+    fine_edges: also make the cells at both ends dmin wide
+    """
+    dmax = length/10. if dmax is None else dmax
+    centers = np.unique(np.clip(np.asarray(centers, dtype=np.float64), dmin/2., length - dmin/2.))
+    # fine cells at each centre; centres closer than dmin share cells
+    blocks = []
+    for c in centers:
+        lo, hi = c - dmin/2., c + dmin/2.
+        if blocks and lo < blocks[-1][1]:
+            blocks[-1][1] = hi
+        else:
+            blocks.append([lo, hi])
+    edge = dmin if fine_edges else dmax
+    sizes = []
+    left, s_left = 0., edge
+    for lo, hi in blocks:
+        sizes.append(gap_sizes(lo - left, s_left, dmin, dmax, mult))
+        n = max(int(round((hi - lo)/dmin)), 1)
+        sizes.append(np.full(n, (hi - lo)/n))
+        left, s_left = hi, dmin
+    sizes.append(gap_sizes(length - left, s_left, edge, dmax, mult))
+    return np.concatenate(sizes)
+
+
+def grid_dict(delr, delc, Ly):
+    # widths, edges and cell-centre coordinates (y up, row 0 at the top)
+    delr = np.asarray(delr, dtype=np.float64)
+    delc = np.asarray(delc, dtype=np.float64)
+    xe = np.concatenate([[0.], np.cumsum(delr)])
+    ye = Ly - np.concatenate([[0.], np.cumsum(delc)])
+    return {'delr': delr, 'delc': delc, 'nrow': len(delc), 'ncol': len(delr),
+            'x_edges': xe, 'y_edges': ye,
+            'x_coord': 0.5*(xe[:-1] + xe[1:]), 'y_coord': 0.5*(ye[:-1] + ye[1:])}
+
+
+def uniform_grid(Lx, Ly, nrow, ncol):
+    """Grid dict of a uniform grid, as built in the tutorial scripts."""
+    return grid_dict(np.full(ncol, Lx/ncol), np.full(nrow, Ly/nrow), Ly)
+
+
+def telescoping_grid(Lx, Ly, points=(), x_lines=(), y_lines=(), dmin=1., dmax=None,
+                     mult=1.5, fine_edges=False):
+    """Grid refined around points (x, y) and lines x = const / y = const.
+
+    Returns a dict with delr, delc, nrow, ncol, x_coord, y_coord (cell
+    centres, y measured up from the bottom as in the scripts) and the
+    cell edges x_edges/y_edges.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    xc = np.concatenate([points[:, 0], np.asarray(x_lines, dtype=np.float64)])
+    # rows count down from the top edge y = Ly
+    yc = Ly - np.concatenate([points[:, 1], np.asarray(y_lines, dtype=np.float64)])
+    delr = axis_spacing(Lx, xc, dmin, dmax, mult, fine_edges)
+    delc = axis_spacing(Ly, yc, dmin, dmax, mult, fine_edges)
+    return grid_dict(delr, delc, Ly)
+
+
+def cell_index(x, y, grid):
+    """Zero-based (i, j) of the cells containing points (x, y)."""
+    j = np.searchsorted(grid['x_edges'], x, side='right') - 1
+    i = np.searchsorted(-grid['y_edges'], -np.asarray(y), side='right') - 1
+    return np.clip(i, 0, grid['nrow'] - 1), np.clip(j, 0, grid['ncol'] - 1)
+
+
+def remap_array(arr, old, new):
+    """Array (..., nrow, ncol) on grid old sampled onto grid new.
+
+    Each new cell takes the value of the old cell containing its centre.
+    """
+    arr = np.asarray(arr)
+    i, _ = cell_index(np.zeros(new['nrow']), new['y_coord'], old)
+    _, j = cell_index(new['x_coord'], np.zeros(new['ncol']), old)
+    return arr[..., i[:, None], j[None, :]]
+
+
+def remap_cells(cells, old, new, scale=()):
+    """Move a WEL/RIV/GHB cell list from grid old to grid new.
+
+    cells: record array with k, i, j fields, or rows [k, i, j, ...]
+    scale: columns proportional to cell area (e.g. 'cond', or 4 for the
+        position in a row list). If empty, each cell goes to the new cell
+        containing the old cell's centre (wells); otherwise it goes to all
+        new cells it overlaps, with those columns scaled by the fraction
+        of its area in each (rivers, GHB), so totals are kept.
+    Returns the same kind of object as cells.
+    """
+    is_rec = isinstance(cells, np.ndarray) and cells.dtype.names is not None
+    if is_rec:
+        rec = cells
+        k, i, j = rec['k'], rec['i'], rec['j']
+    else:
+        rows = [list(r) for r in cells]
+        k = np.array([r[0] for r in rows], dtype=int)
+        i = np.array([r[1] for r in rows], dtype=int)
+        j = np.array([r[2] for r in rows], dtype=int)
+    i = np.asarray(i, dtype=int)
+    j = np.asarray(j, dtype=int)
+
+    if not scale:
+        ni, nj = cell_index(old['x_coord'][j], old['y_coord'][i], new)
+        src = np.arange(len(i))
+        factor = np.ones(len(i))
+    else:
+        # new rows/columns overlapping each old row/column, measured from
+        # the top/left edge
+        ro, rn = [np.concatenate([[0.], np.cumsum(g['delc'])]) for g in (old, new)]
+        co, cn = [np.concatenate([[0.], np.cumsum(g['delr'])]) for g in (old, new)]
+        r0 = np.searchsorted(rn[1:], ro[i], 'right')
+        r1 = np.searchsorted(rn[:-1], ro[i + 1], 'left')
+        c0 = np.searchsorted(cn[1:], co[j], 'right')
+        c1 = np.searchsorted(cn[:-1], co[j + 1], 'left')
+        nr, nc = r1 - r0, c1 - c0
+        src = np.repeat(np.arange(len(i)), nr*nc)
+        # position within each record's block of new cells
+        pos = np.arange(len(src)) - np.repeat(np.cumsum(nr*nc) - nr*nc, nr*nc)
+        ni = r0[src] + pos//nc[src]
+        nj = c0[src] + pos % nc[src]
+        isrc, jsrc = i[src], j[src]
+        dy = np.minimum(rn[ni + 1], ro[isrc + 1]) - np.maximum(rn[ni], ro[isrc])
+        dx = np.minimum(cn[nj + 1], co[jsrc + 1]) - np.maximum(cn[nj], co[jsrc])
+        factor = dx*dy/(old['delc'][isrc]*old['delr'][jsrc])
+
+    if is_rec:
+        out = rec[src].copy()
+        out['i'] = ni
+        out['j'] = nj
+        for c in scale:
+            out[c] = out[c]*factor
+        return out
+    out = []
+    for s, a, b, f in zip(src, ni, nj, factor):
+        r = list(rows[s])
+        r[1], r[2] = int(a), int(b)
+        for c in scale:
+            r[c] = float(r[c]*f)
+        out.append(r)
+    return out
+
+
+def square_model(grid, hk=1., thick=100., q=-1000., well=(500., 500.), h_edge=100.):
+    # confined one-layer square with constant-head left/right edges and a
+    # well, as in SquareWithWell-SteadyState.py
+    import flopy
+
+    mf = flopy.modflow.Modflow('telegrid_benchmark')
+    flopy.modflow.ModflowDis(mf, 1, grid['nrow'], grid['ncol'], delr=grid['delr'],
+                             delc=grid['delc'], top=thick, botm=[0.])
+    ibound = np.ones((1, grid['nrow'], grid['ncol']), dtype=np.int32)
+    ibound[:, :, (0, grid['ncol'] - 1)] = -1
+    flopy.modflow.ModflowBas(mf, ibound=ibound, strt=h_edge)
+    flopy.modflow.ModflowLpf(mf, hk=hk, vka=hk, laytyp=0)
+    i, j = cell_index(well[0], well[1], grid)
+    flopy.modflow.ModflowWel(mf, stress_period_data={0: [[0, int(i), int(j), q]]})
+    return mf
+
+
+def benchmark(Lx=1000., Ly=1000., well=(500., 500.), distances=(5., 10., 25., 50., 100., 250.),
+              uniform_sizes=((10, 10), (25, 25), (50, 50), (50, 100), (100, 100)),
+              tele_dmin=(20., 10., 5., 2., 1.), ref_size=(401, 401), mult=1.2, dmax=50.):
+    """Head error at points east of the well against cell count.
+
+    The reference is a uniform ref_size grid. Heads are interpolated
+    linearly along the row through the well, at distances measured from
+    the centre of the cell holding the well. Returns a list of dicts
+    with 'grid', 'ncell' and 'max_error', and prints the table.
+    """
+    import steadyflow
+
+    def heads_at(grid):
+        # heads at the given distances east of the centre of the well cell
+        sf = steadyflow.SteadyFlow(square_model(grid, well=well))
+        h = sf.solve()
+        i, j = cell_index(well[0], well[1], grid)
+        x_obs = grid['x_coord'][j] + np.asarray(distances)
+        return np.interp(x_obs, grid['x_coord'], h[0, int(i)])
+
+    h_ref = heads_at(uniform_grid(Lx, Ly, *ref_size))
+    results = []
+    grids = [('uniform {0}x{1}'.format(nr, nc), uniform_grid(Lx, Ly, nr, nc))
+             for nr, nc in uniform_sizes]
+    grids += [('telescoping dmin={0:g}'.format(d),
+               telescoping_grid(Lx, Ly, points=[well], dmin=d, dmax=dmax, mult=mult))
+              for d in tele_dmin]
+    print('{0:<26} {1:>8} {2:>12}'.format('grid', 'cells', 'max error'))
+    for name, g in grids:
+        err = np.abs(heads_at(g) - h_ref).max()
+        results.append({'grid': name, 'ncell': g['nrow']*g['ncol'], 'max_error': err})
+        print('{0:<26} {1:>8d} {2:>12.4g}'.format(name, g['nrow']*g['ncol'], err))
+    return results
@@ -0,0 +1,64 @@
+## test_listfile.py
+# iter_steps() on a small MODFLOW-2005 (PCG) listing where OC only
+# prints a budget for the last time step, as in GitHub-Tutorial2.py.
+#
+# Run from the FloPyTools folder:
+#   python -m pytest -q tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import listfile
+
+sparse_oc_listing = """\
+                                  MODFLOW-2005
+     1 CALLS TO PCG ROUTINE FOR TIME STEP   1 IN STRESS PERIOD   1
+     7 TOTAL ITERATIONS
+     1 CALLS TO PCG ROUTINE FOR TIME STEP   2 IN STRESS PERIOD   1
+     4 TOTAL ITERATIONS
+     2 CALLS TO PCG ROUTINE FOR TIME STEP   3 IN STRESS PERIOD   1
+     9 TOTAL ITERATIONS
+
+ OUTPUT CONTROL FOR STRESS PERIOD   1   TIME STEP   3
+    SAVE HEAD FOR ALL LAYERS
+
+  VOLUMETRIC BUDGET FOR ENTIRE MODEL AT END OF TIME STEP   3, STRESS PERIOD   1
+  ------------------------------------------------------------------------------
+
+     CUMULATIVE VOLUMES      L**3       RATES FOR THIS TIME STEP      L**3/T
+     ------------------                 ------------------------
+
+           IN:                                      IN:
+           ---                                      ---
+             STORAGE =           0.0000               STORAGE =           0.0000
+       CONSTANT HEAD =         300.0000         CONSTANT HEAD =         100.0000
+
+            TOTAL IN =         300.0000              TOTAL IN =         100.0000
+
+          OUT:                                     OUT:
+          ----                                     ----
+               WELLS =         300.0000                 WELLS =         100.0000
+
+           TOTAL OUT =         300.0000             TOTAL OUT =         100.0000
+
+            IN - OUT =           0.0000              IN - OUT =           0.0000
+
+ PERCENT DISCREPANCY =           0.00     PERCENT DISCREPANCY =           0.00
+
+ TIME SUMMARY AT END OF TIME STEP   3 IN STRESS PERIOD   1
+     1 CALLS TO PCG ROUTINE FOR TIME STEP   1 IN STRESS PERIOD   2
+     5 TOTAL ITERATIONS
+"""
+
+
+def test_sparse_oc_iterations(tmp_path):
+    fname = tmp_path / 'sparse.list'
+    fname.write_text(sparse_oc_listing)
+    steps = list(listfile.iter_steps(str(fname)))
+    assert [(s['kper'], s['kstp']) for s in steps] == [(1, 1), (1, 2), (1, 3), (2, 1)]
+    assert [s['iterations'] for s in steps] == [7, 4, 9, 5]
+    assert steps[2]['total_in'] == 100.
+    assert steps[2]['out']['WELLS'] == 100.
+    assert all(s['converged'] for s in steps)
@@ -0,0 +1,44 @@
+## test_specdis.py
+# specific_discharge() on a small compact budget file (IMETH=1 face
+# records with times), as MODFLOW writes with compact=True.
+#
+# Run from the FloPyTools folder:
+#   python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import specdis
+
+
+def write_compact_faces(fname, nrow, ncol, times):
+    # FLOW RIGHT FACE = 1 and FLOW FRONT FACE = 0 in every cell, 1 layer
+    with open(fname, 'wb') as f:
+        for kstp, totim in enumerate(times, start=1):
+            for text, value in [('FLOW RIGHT FACE', 1.), ('FLOW FRONT FACE', 0.)]:
+                np.array([kstp, 1], '<i4').tofile(f)
+                f.write(text.rjust(16).encode())
+                np.array([ncol, nrow, -1, 1], '<i4').tofile(f)
+                np.array([1., totim, totim], '<f4').tofile(f)
+                np.full(nrow*ncol, value, '<f4').tofile(f)
+
+
+def test_compact_budget(tmp_path):
+    import flopy
+
+    fname = str(tmp_path / 'faces.cbc')
+    write_compact_faces(fname, 2, 4, [1., 2., 3.])
+    mf = flopy.modflow.Modflow('m', model_ws=str(tmp_path))
+    dis = flopy.modflow.ModflowDis(mf, nlay=1, nrow=2, ncol=4, top=10., botm=0.)
+    times, qx, qy, qz = specdis.specific_discharge(fname, dis)
+    assert np.allclose(times, [1., 2., 3.])
+    assert qx.shape == (3, 1, 2, 4)
+    # unit face flows through a 1 x 10 face; the first cell only has the
+    # flow out of its right face
+    assert np.allclose(qx[:, 0, :, 1:], 0.1)
+    assert np.allclose(qx[:, 0, :, 0], 0.05)
+    assert np.allclose(qy, 0.)
@@ -0,0 +1,168 @@
+## zonebudget.py
+# Zone budgets from a binary cell-by-cell budget file: for every saved
+# time step, the inflow and outflow of each budget term (CONSTANT HEAD,
+# WELLS, RIVER LEAKAGE, ...) summed over each zone, plus the flow
+# exchanged with other zones across the FLOW RIGHT/FRONT/LOWER FACE
+# records.
+#
+# Sums are np.bincount over the zone number of each cell, so a time step
+# is a handful of vectorized reductions whatever the number of zones.
+# Time steps are split over a pool of worker processes, each with its
+# own memory map of the budget file (record index from cbcindex.py),
+# and the results are written to a CSV file as they come back.
+#
+# Example (TwoStreamsWithWell.py, left half of the domain is zone 1):
+#   import zonebudget
+#   zones = np.ones((nlay, nrow, ncol), dtype=int)
+#   zones[:, :, ncol//2:] = 2
+#   zb = zonebudget.zone_budget(modelname+'.cbc', zones, fname_out='zb.csv')
+#   zb[zb['zone'] == 1]['WELLS_OUT']
+
+import csv
+import multiprocessing
+
+import numpy as np
+
+import cbcindex
+
+face_texts = ['FLOW RIGHT FACE', 'FLOW FRONT FACE', 'FLOW LOWER FACE']
+
+
+def face_exchange(flows, zones, axis, nz):
+    # IN/OUT from other zones across one set of faces; flows[k, i, j] is
+    # the flow from a cell to its neighbour along axis
+    n = zones.shape[axis]
+    za = zones.take(np.arange(n - 1), axis=axis).ravel()
+    zb = zones.take(np.arange(1, n), axis=axis).ravel()
+    q = flows.take(np.arange(n - 1), axis=axis).ravel()
+    sel = za != zb
+    za, zb, q = za[sel], zb[sel], q[sel]
+    pos = np.maximum(q, 0.)
+    neg = np.maximum(-q, 0.)
+    zin = np.bincount(za, weights=neg, minlength=nz) + np.bincount(zb, weights=pos, minlength=nz)
+    zout = np.bincount(za, weights=pos, minlength=nz) + np.bincount(zb, weights=neg, minlength=nz)
+    return zin, zout
+
+
+def step_budget(index, zones, nz, irecs, terms):
+    """(nz, 2*len(terms) + 2) array of IN/OUT sums for one time step.
+
+    Columns are term1 IN, term1 OUT, ..., FROM_OTHER_ZONES, TO_OTHER_ZONES.
+    """
+    out = np.zeros((nz, 2*len(terms) + 2))
+    zflat = zones.ravel()
+    for irec in irecs:
+        text = index.records.text[irec]
+        nodes, values = index.read_record(irec)
+        if text in face_texts:
+            axis = 2 - face_texts.index(text)
+            if zones.shape[axis] > 1:
+                zin, zout = face_exchange(values.reshape(zones.shape), zones, axis, nz)
+                out[:, -2] += zin
+                out[:, -1] += zout
+            continue
+        col = 2*terms.index(text)
+        z = zflat if nodes is None else zflat[nodes]
+        out[:, col] += np.bincount(z, weights=np.maximum(values, 0.), minlength=nz)
+        out[:, col + 1] += np.bincount(z, weights=np.maximum(-values, 0.), minlength=nz)
+    return out
+
+
+# each worker keeps its own memory map and zone array
+worker = {}
+
+
+def init_worker(cbcfile, precision, zones, terms):
+    worker['index'] = cbcindex.CbcIndex(cbcfile, precision=precision)
+    worker['zones'] = zones
+    worker['nz'] = int(zones.max()) + 1
+    worker['terms'] = terms
+
+
+def run_steps(steps):
+    # worker: budgets for a list of (istep, record indices)
+    return [(istep, step_budget(worker['index'], worker['zones'], worker['nz'],
+                                irecs, worker['terms']))
+            for istep, irecs in steps]
+
+
+def zone_budget(cbcfile, zones, fname_out=None, nproc=None, chunksize=16,
+                precision='auto', return_table=True):
+    """Zone budget for every saved time step.
+
+    cbcfile: cell-by-cell budget file
+    zones: integer array (nlay, nrow, ncol) of zone numbers >= 0
+    fname_out: CSV file the rows are streamed to as steps finish
+    nproc: worker processes (os.cpu_count() if None; 1 runs in this process)
+    chunksize: time steps per task
+    return_table: if False only the CSV is written (for very long runs)
+
+    Returns a NumPy record array with one row per (time step, zone) and
+    columns kstp, kper (zero-based), totim, zone and <TERM>_IN/<TERM>_OUT
+    for each budget term plus FROM_OTHER_ZONES/TO_OTHER_ZONES.
+    """
+    zones = np.asarray(zones, dtype=np.int64)
+    index = cbcindex.CbcIndex(cbcfile, precision=precision)
+    recs = index.records
+    terms = [t for t in index.get_textlist() if t not in face_texts]
+    nz = int(zones.max()) + 1
+    present = np.flatnonzero(np.bincount(zones.ravel(), minlength=nz))
+
+    # group the records by time step, in file order
+    keys = list(dict.fromkeys(zip(recs.kstp, recs.kper)))
+    irecs = {key: [] for key in keys}
+    for irec, key in enumerate(zip(recs.kstp, recs.kper)):
+        irecs[key].append(irec)
+    steps = [(istep, irecs[key]) for istep, key in enumerate(keys)]
+    totim = [recs.totim[irecs[key][0]] for key in keys]
+
+    columns = ['kstp', 'kper', 'totim', 'zone']
+    for t in terms:
+        name = t.strip().replace(' ', '_')
+        columns += [name + '_IN', name + '_OUT']
+    columns += ['FROM_OTHER_ZONES', 'TO_OTHER_ZONES']
+
+    chunks = [steps[i:i + chunksize] for i in range(0, len(steps), chunksize)]
+    if nproc == 1:
+        init_worker(cbcfile, index.precision, zones, terms)
+        results = map(run_steps, chunks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(nproc, initializer=init_worker,
+                                    initargs=(cbcfile, index.precision, zones, terms))
+        results = pool.imap(run_steps, chunks)
+
+    f = open(fname_out, 'w', newline='') if fname_out is not None else None
+    writer = csv.writer(f) if f is not None else None
+    if writer is not None:
+        writer.writerow(columns)
+    table = []
+    try:
+        for chunk in results:
+            for istep, budget in chunk:
+                kstp, kper = keys[istep]
+                rows = np.column_stack([np.full(len(present), kstp - 1),
+                                        np.full(len(present), kper - 1),
+                                        np.full(len(present), totim[istep]),
+                                        present, budget[present]])
+                if writer is not None:
+                    writer.writerows([int(kstp) - 1, int(kper) - 1, totim[istep], int(z)] + b.tolist()
+                                     for z, b in zip(present, budget[present]))
+                if return_table:
+                    table.append(rows)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if f is not None:
+            f.close()
+
+    if not return_table:
+        return None
+    dtype = [(c, np.int32) for c in columns[:2]] + [('totim', np.float64), ('zone', np.int32)]
+    dtype += [(c, np.float64) for c in columns[4:]]
+    data = np.vstack(table) if table else np.zeros((0, len(columns)))
+    out = np.zeros(len(data), dtype=dtype)
+    for icol, c in enumerate(columns):
+        out[c] = data[:, icol]
+    return out.view(np.recarray)
@@ -3,8 +3,11 @@
 import flopy
 import numpy as np
 
-# where is your MODFLOW-2005 executable?
-path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin/mf2005.exe'
+# where is your MODFLOW-2005 executable? (search folders are set in mfexe.py)
+import sys
+sys.path.append('../FloPyTools')
+import mfexe
+path2mf = mfexe.resolve('mf2005')
 
 # Assign name and create modflow model object
 modelname = 'tutorial2'
@@ -78,4 +78,30 @@ mnw2 = flopy.modflow.ModflowMnw2(model=m, mnwmax=2,
 mnw2.nodtot
 pd.DataFrame(mnw2.node_data)
 
+## same wells built from arrays of screens (no DataFrames): the layer
+## of each node is found by intersecting the screens with DIS
+import sys
+sys.path.append('../FloPyTools')
+import mnw2nodes
+
+node_data = mnw2nodes.node_data(dis, wellid=['well1', 'well2'],
+                                i=[1, 3], j=[1, 3],
+                                ztop=[9.5, 9.1], zbotm=[5.1, 3.7],
+                                losstype='skin', pumploc=-1, qlimit=0,
+                                ppflag=0, pumpcap=0, rw=1., rskin=2.,
+                                kskin=5., zpump=[6.2, 4.1])
+stress_period_data, itmp = mnw2nodes.stress_period_data(
+                               ['well1', 'well2'],
+                               [[0., 0.], [100., 1000.], [100., 1000.]])
+
+mnw2 = flopy.modflow.ModflowMnw2(model=m, mnwmax=2,
+                 node_data=node_data,
+                 stress_period_data=stress_period_data,
+                 itmp=itmp, # [2, 2, -1]
+                 )
+
+# inspect package
+mnw2.nodtot
+pd.DataFrame(mnw2.node_data)
+
 m.write_input()
\ No newline at end of file
@@ -9,8 +9,10 @@
 # Using default units of ITMUNI=4 (days) and LENUNI=2 (meters)
 
 import numpy as np
-import flopy 
-import platform
+import flopy
+import sys
+sys.path.append('../FloPyTools')
+import mfexe
 
 # make plots?
 make_plots = False
@@ -18,17 +20,8 @@ make_plots = False
 # what version of modflow to use?
 modflow_v = 'mfnwt'  # 'mfnwt' or 'mf2005'
 
-# where is your MODFLOW executable?
-if (modflow_v=='mf2005'):
-    if platform.system() == 'Windows':
-        path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin/mf2005.exe'
-    else: 
-        path2mf = modflow_v
-elif (modflow_v=='mfnwt'):
-    if platform.system() == 'Windows':
-        path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MODFLOW-NWT_1.1.3/bin/MODFLOW-NWT.exe'
-    else:
-        path2mf = modflow_v
+# where is your MODFLOW executable? (search folders are set in mfexe.py)
+path2mf = mfexe.resolve(modflow_v)
 
 # Assign name and create modflow model object
 modelname = 'SquareWithWell-SteadyState'
@@ -90,7 +83,7 @@ stress_period_data = {0: wel_sp1}
 wel = flopy.modflow.ModflowWel(mf, stress_period_data=stress_period_data)
 
 # Output control
-spd = {(0, 0): ['save head','save drawdown']}
+spd = {(0, 0): ['save head']}  # drawdown is computed from the heads
 oc = flopy.modflow.ModflowOc(mf, stress_period_data=spd,
                              compact=True)
 
@@ -107,10 +100,11 @@ if (make_plots):
     # Imports
     import matplotlib.pyplot as plt
     import flopy.utils.binaryfile as bf
+    import drawdown
 
     # Create the headfile object
     headobj = bf.HeadFile(modelname+'.hds', text='head')
-    ddnobj = bf.HeadFile(modelname+'.ddn', text='drawdown')
+    ddnobj = drawdown.DrawdownFile(modelname+'.hds', strt=strt)
 
     # get data
     time = headobj.get_times()[0]
@@ -11,8 +11,11 @@
 import numpy as np
 import flopy 
 
-# where is your MODFLOW-2005 executable?
-path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin/mf2005.exe'
+# where is your MODFLOW-2005 executable? (search folders are set in mfexe.py)
+import sys
+sys.path.append('../FloPyTools')
+import mfexe
+path2mf = mfexe.resolve('mf2005')
 
 # Assign name and create modflow model object
 modelname = 'TiltedVwithSFR-SteadyState'
@@ -69,7 +72,7 @@ rchrate = 0.001  # [m/d]
 rch = flopy.modflow.ModflowRch(mf, rech=rchrate, nrchop=3)
 
 # output control
-spd = {(0, 0): ['save head', 'save budget', 'save drawdown']}
+spd = {(0, 0): ['save head', 'save budget']}
 oc = flopy.modflow.ModflowOc(mf, stress_period_data=spd, compact=True)
 
 ## make stream network
@@ -16,8 +16,12 @@
 import numpy as np
 import flopy 
 
-# where is your MODFLOW-2005 executable?
-path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MF2005.1_12/bin/mf2005.exe'
+# where is your MODFLOW-2005 executable? (search folders are set in mfexe.py)
+import sys
+sys.path.append('../FloPyTools')
+import mfexe
+import sfrtext
+path2mf = mfexe.resolve('mf2005')
 
 # Assign name and create modflow model object
 modelname = 'TiltedVwithSFR-SteadyState'
@@ -78,11 +82,11 @@ rch = flopy.modflow.ModflowRch(mf, rech=rchrate, nrchop=3)
 
 # output control
 spd = {}
-spd[(0,0)] = ['save head', 'save budget', 'save drawdown']
-spd[(1,0)] = ['save head', 'save budget', 'save drawdown']
+spd[(0,0)] = ['save head', 'save budget']
+spd[(1,0)] = ['save head', 'save budget']
 for ts in range(0,100):
-    spd[(1,ts)] = ['save head', 'save budget', 'save drawdown']
-    spd[(2,ts)] = ['save head', 'save budget', 'save drawdown']
+    spd[(1,ts)] = ['save head', 'save budget']
+    spd[(2,ts)] = ['save head', 'save budget']
 oc = flopy.modflow.ModflowOc(mf, stress_period_data=spd, compact=True)
 
 ## make stream network
@@ -163,7 +167,6 @@ if not success:
 # Imports
 import matplotlib.pyplot as plt
 import flopy.utils.binaryfile as bf
-import flopy.utils.sfroutputfile as sf
 
 ## plot of land surface
 plt.imshow(ztop, cmap='BrBG')
@@ -181,13 +184,14 @@ p3 = h.plot(totim=time[100], contour=True, grid=True, colorbar=True)
 p4 = h.plot(totim=time[150], contour=True, grid=True, colorbar=True)
 
 ## look at sfr output
-sfrout = sf.SfrFile(modelname+'.sfr.out')
-df = sfrout.get_dataframe()
-df.head()
+# only parse the outlet reach instead of making a DataFrame of everything
+sfrout = sfrtext.SfrText(modelname+'.sfr.out')
+outlet = sfrout.get_ts(segment=1, reach=19, columns=['Qout', 'Qaquifer'])
+sfrout.close()
 
 fig, axes = plt.subplots(2, 1, sharex=True)
-df_outlet = df.loc[(df.segment == 1) & (df.reach == 19)]
-df_outlet.Qout.plot(ax=axes[0])
+axes[0].plot(outlet['Qout'])
 axes[0].set_ylabel('Simulated streamflow, cfs')
-df_outlet.Qaquifer.plot(ax=axes[1])
-axes[1].set_ylabel('Leakage to aquifer, cfs')
\ No newline at end of file
+axes[1].plot(outlet['Qaquifer'])
+axes[1].set_ylabel('Leakage to aquifer, cfs')
+axes[1].set_xlabel('time step')
\ No newline at end of file
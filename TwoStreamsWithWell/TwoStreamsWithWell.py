@@ -3,14 +3,14 @@
 
 import numpy as np
 import flopy
-import flopy.utils.binaryfile as bf
-import matplotlib.pyplot as plt
-import flopy.utils.postprocessing as pp
+import sys
+sys.path.append('../FloPyTools')
+import mfexe
 
 runid = 'BigPumpK1e-6'
 modelname = 'TwoStreamsWithWell'
 modflow_v = 'mfnwt'
-path2mf = 'C:/Users/Sam/Dropbox/Work/Models/MODFLOW/MODFLOW-NWT_1.1.4/bin/MODFLOW-NWT.exe'
+path2mf = mfexe.resolve(modflow_v)  # search folders are set in mfexe.py
 
 # key parameters to experiment with
 Qw = -2
@@ -21,8 +21,7 @@ vka = 1.         # Kv = Kh/vka
 
 # Assign name and create modflow model object
 mf = flopy.modflow.Modflow(modelname, exe_name=path2mf, 
-                           version=modflow_v,
-                           model_ws="C:/Users/Sam/WorkGits/FloPy_Tutorials/TwoStreamsWithWell")
+                           version=modflow_v)
 
 # discretization (space) - these should be the same as in your R script                         
 nlay = 1
@@ -73,7 +72,7 @@ riv = flopy.modflow.ModflowRiv(mf, stress_period_data=riv_spd, ipakcb=61,
                                filenames=[modelname+'.riv', modelname+'.riv.out'])
 
 ## output control
-spd = {(0, 0): ['save head', 'save budget', 'save drawdown', 'print head', 'print budget', 'print drawdown']}
+spd = {(0, 0): ['save head', 'save budget', 'print head', 'print budget']}
 oc = flopy.modflow.ModflowOc(mf, stress_period_data=spd, compact=True)
 
 ## write input and run
@@ -85,6 +84,7 @@ if not success:
     raise Exception('MODFLOW did not terminate normally.')
 
 ## look at budget outputs
+import flopy.utils.binaryfile as bf
 rivout = bf.CellBudgetFile(modelname+'.riv.out', verbose=False)
 rivout_3D = rivout.get_data(totim=1, text='RIVER LEAKAGE')
 leakage_L_noPump = rivout_3D[0][0][1]
@@ -177,12 +177,14 @@ head_pump_10lay = h.get_data(totim=1)
 h.close()
 
 # calculate WTEs
+import flopy.utils.postprocessing as pp
 wte_noPump = pp.get_water_table(head_noPump, nodata=-9999)
 wte_noPump_10lay = pp.get_water_table(head_noPump_10lay, nodata=-9999)
 wte_pump = pp.get_water_table(head_pump, nodata=-9999)
 wte_pump_10lay = pp.get_water_table(head_pump_10lay, nodata=-9999)
 
 ## plots
+import matplotlib.pyplot as plt
 # water table
 plt.plot(xcoord, wte_noPump, 'b')
 plt.plot(xcoord, wte_pump, 'r')